@@ -1,104 +1,111 @@
-import pyodbc
+import argparse
 import configparser
-import re
+
+from csvprofile import get_profile
+from db import open_database
+from migrate import execute, parse_alter_statements, plan, types_from_profile
+from projection import project_types, projection_for, read_projections
 
 def read_alter_statements(filename):
     with open(filename, 'r') as f:
         alter_statements = f.readlines()
     return alter_statements
 
-def execute_alter_statements(connection, alter_statements, varchar_max_columns):
-    cursor = connection.cursor()
-    total_statements = len(alter_statements)
-    success = True
-
-    try:
-        connection.autocommit = False
-
-        for idx, statement in enumerate(alter_statements, start=1):
-            try:
-                column_name = re.search(r'ALTER COLUMN \[([^\]]+)\]', statement).group(1)
-
-                # Skip if this column is not in the list of VARCHAR(MAX) columns
-                if column_name not in varchar_max_columns:
-                    print(f"Skipped ALTER statement {idx}/{total_statements}: Column '{column_name}' is not VARCHAR(MAX).")
-                    continue
 
-                cursor.execute(statement)
-                print(f"Executed ALTER statement {idx}/{total_statements}: {statement.strip()}")
-
-            except Exception as e:
-                print(f"Error executing ALTER statement {idx}/{total_statements}: {e}")
-                success = False
-                break
-
-        if success:
-            connection.commit()
-            print("All ALTER statements executed successfully.")
+def print_plan(result, requested=None):
+    print(f"Table {result['table']}: {result['rows']} rows, {result['changes']} column changes "
+          f"({result['rewrites']} rewrite the data).")
+    for change in result["changes"]:
+        kind = "metadata only" if change["metadata_only"] else "rewrite"
+        check = "" if change.get("safe", True) else f"  <-- DATA DOES NOT FIT (measured {change['measured']})"
+        print(f"  [{change['column']}] {change['from']} -> {change['to']} ({kind}){check}")
+    print(f"Estimated cells rewritten: alter {result['alter_cost']}, rebuild {result['rebuild_cost']}")
+    print(f"Strategy: {result['strategy']}")
+    if result["strategy"] == "rebuild":
+        print(f"The old table is kept as {result['table']}__before_migrate, drop it once the new one is checked.")
+    elif result["rebuild_blockers"] and (requested == "rebuild" or result["rewrites"] > 1):
+        blockers = ", ".join(f"{count} {kind}" for kind, count in result["rebuild_blockers"].items())
+        if requested == "rebuild":
+            print(f"[WARN] --strategy rebuild not followed, the copy would lose: {blockers}. Using ALTER instead.")
         else:
-            connection.rollback()
-            print("Transaction rolled back due to errors.")
-    except Exception as ex:
-        print(f"Transaction aborted: {ex}")
-        connection.rollback()
-    finally:
-        connection.autocommit = True
-
-
-def get_varchar_max_columns(cursor):
-    cursor.execute("""
-        SELECT COLUMN_NAME 
-        FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'Cases' AND DATA_TYPE = 'varchar' AND CHARACTER_MAXIMUM_LENGTH = -1
-    """)
-    varchar_max_columns = [row[0] for row in cursor.fetchall()]
-    return varchar_max_columns
+            print(f"Not rebuilt, the copy would lose: {blockers}")
 
 
 def connect_to_db():
     config = configparser.ConfigParser()
     config.read('config.ini')
-    server = config['SQL_SERVER']['Server']
-    database = config['SQL_SERVER']['Database']
-    username = config['SQL_SERVER']['Username']
-    password = config['SQL_SERVER']['Password']
 
-    connection_string = f"DRIVER=SQL Server;SERVER={server};DATABASE={database};UID={username};PWD={password}"
-    
     try:
-        connection = pyodbc.connect(connection_string)
+        connection = open_database(config, min_size=0, max_size=1, driver="SQL Server").connect()
         return connection
     except Exception as e:
         print(f"Error connecting to the database: {e}")
         return None
 
 def main():
+    parser = argparse.ArgumentParser(description="Plan and apply column type changes to a table.")
+    parser.add_argument("--table", default="Cases")
+    parser.add_argument("--statements", default="alter_statements.txt",
+                        help="file of ALTER COLUMN statements giving the target types")
+    parser.add_argument("--from-profile", dest="profile_csv",
+                        help="take the target types from this CSV's profile instead")
+    parser.add_argument("--all-columns", dest="only_max", action="store_false",
+                        help="change every differing column, not only (N)VARCHAR(MAX) ones")
+    parser.add_argument("--strategy", choices=["alter", "rebuild"],
+                        help="prefer this strategy over the planner's choice; a table whose indexes, keys, "
+                             "triggers or identity column a copy would lose is always altered")
+    parser.add_argument("--rebuild-min-passes", type=int, default=3,
+                        help="rewriting ALTERs from which a single rebuild is cheaper (default 3)")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan and the statements, change nothing")
+    args = parser.parse_args()
+
     connection = connect_to_db()
     if connection is None:
         return
 
-    alter_statements = read_alter_statements('alter_statements.txt')
-    varchar_max_columns = get_varchar_max_columns(connection.cursor())
+    if args.profile_csv:
+        # A table with a column mapping is compared on its mapped columns only
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+        desired = project_types(types_from_profile(get_profile(args.profile_csv)),
+                                projection_for(args.table, read_projections(config)))
+    else:
+        desired = parse_alter_statements(read_alter_statements(args.statements))
+
+    # Setting --strategy makes the chosen one win regardless of the pass count,
+    # but never rebuilds a table the copy would lose objects of
+    min_passes = {"alter": float("inf"), "rebuild": 0}.get(args.strategy, args.rebuild_min_passes)
+    result = plan(connection.cursor(), args.table, desired, args.only_max, min_passes)
+
+    if not result["changes"]:
+        print("No column changes needed.")
+        connection.close()
+        return
 
-    # Filter only relevant ALTER statements that correspond to VARCHAR(MAX) columns
-    relevant_alter_statements = [stmt for stmt in alter_statements if re.search(r'ALTER COLUMN \[([^\]]+)\]', stmt).group(1) in varchar_max_columns]
+    print_plan(result, args.strategy)
+    print("The following statements will be executed:")
+    for stmt in result["statements"]:
+        print(stmt)
 
-    if not relevant_alter_statements:
-        print("No relevant ALTER statements to execute.")
+    if result["unsafe"]:
+        print(f"{len(result['unsafe'])} columns hold data that does not fit the new type. Execution aborted.")
+        connection.close()
+        return
+    if args.dry_run:
         connection.close()
         return
 
-    print("The following ALTER statements will be executed:")
-    for stmt in relevant_alter_statements:
-        print(stmt.strip())
-
-    confirmation = input(f"Are you sure you want to execute {len(relevant_alter_statements)} ALTER statements? (yes/no): ")
+    confirmation = input(f"Are you sure you want to execute {len(result['statements'])} statements? (yes/no): ")
     if confirmation.lower() != 'yes':
         print("Execution aborted.")
         connection.close()
         return
 
-    execute_alter_statements(connection, relevant_alter_statements, varchar_max_columns)
+    try:
+        execute(connection, result["statements"])
+        print("All statements executed successfully.")
+    except Exception as e:
+        print(f"Transaction rolled back due to errors: {e}")
 
     connection.close()
 
@@ -0,0 +1,103 @@
+import os
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Adaptive chunk sizing. The reader asks the tuner for the size of each chunk
+# it cuts; the pipeline reports back how long parsing and each commit took.
+# The size moves toward target_seconds per commit, measured as rows per
+# second on the write side, and backs off whenever the process gets close to
+# the memory ceiling. Growth and shrinkage are capped per step so one slow
+# commit (a log flush, a lock wait) cannot swing the size wildly.
+
+
+def current_rss():
+    # Resident set size in bytes, or None where it cannot be read cheaply
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ChunkTuner:
+    def __init__(self, initial=50000, target_seconds=2.0, memory_limit_mb=None, min_size=1000,
+                 max_size=500000, smoothing=0.3, log=print):
+        self.size = int(initial)
+        self.target_seconds = target_seconds
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+        self.log = log
+        self.lock = threading.Lock()
+        self.write_seconds_per_row = None
+        self.parse_seconds_per_row = None
+        self.peak_rss = 0
+        self.decisions = []
+
+    def __call__(self):
+        # iter_record_blocks calls this before cutting every chunk
+        with self.lock:
+            return self.size
+
+    def _smooth(self, old, new):
+        return new if old is None else old + self.smoothing * (new - old)
+
+    def observe_parse(self, rows, seconds):
+        if rows:
+            with self.lock:
+                self.parse_seconds_per_row = self._smooth(self.parse_seconds_per_row, seconds / rows)
+
+    def observe_commit(self, rows, chunks, seconds):
+        # rows and seconds cover everything executed since the previous
+        # commit on that writer, including the commit itself
+        if not rows or not chunks:
+            return
+        with self.lock:
+            self.write_seconds_per_row = self._smooth(self.write_seconds_per_row, seconds / rows)
+            rss = current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+
+            size = self.target_seconds / self.write_seconds_per_row / chunks
+            size = min(max(size, self.size * 0.5), self.size * 2)
+            reason = "latency"
+            if self.memory_limit and rss is not None:
+                if rss > self.memory_limit:
+                    size, reason = self.size * 0.5, "memory"
+                elif rss > self.memory_limit * 0.8 and size > self.size:
+                    size, reason = self.size, "memory"
+            size = int(min(max(size, self.min_size), self.max_size))
+
+            # Ignore changes under 10% so the log only shows real moves
+            if abs(size - self.size) < self.size * 0.1:
+                return
+            decision = {"from": self.size, "to": size, "reason": reason, "commit_seconds": round(seconds, 3),
+                        "rows": rows, "write_rows_per_second": round(1 / self.write_seconds_per_row),
+                        "rss_mb": round(rss / 1024 / 1024, 1) if rss is not None else None}
+            if self.parse_seconds_per_row:
+                decision["parse_rows_per_second"] = round(1 / self.parse_seconds_per_row)
+            self.decisions.append(decision)
+            self.size = size
+        if self.log is not None:
+            message = (f"[TUNE] chunk size {decision['from']} -> {decision['to']} ({reason}): "
+                       f"{rows} rows committed in {seconds:.2f}s, "
+                       f"{decision['write_rows_per_second']} rows/s written")
+            if decision.get("parse_rows_per_second"):
+                message += f", {decision['parse_rows_per_second']} rows/s parsed"
+            if decision["rss_mb"] is not None:
+                message += f", RSS {decision['rss_mb']} MB"
+            self.log(message)
+
+
+def make_chunk_size(setting, target_seconds=2.0, memory_limit_mb=None, initial=50000):
+    # "auto" (or 0) gives a tuner, anything else is a fixed chunk size
+    if setting in (None, "", "auto", 0, "0"):
+        return ChunkTuner(initial, target_seconds, memory_limit_mb)
+    return int(setting)
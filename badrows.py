@@ -0,0 +1,116 @@
+import csv
+import os
+import threading
+
+import numpy as np
+
+from sources import sidecar_base
+from typeinfer import to_parameters
+
+# Rows that cannot go into the target table. They are caught before the
+# insert where the target's column definitions make that possible (too
+# long for the column, not convertible to its type, out of range, NULL in a
+# NOT NULL column) and otherwise isolated by bisecting the failing batch.
+# Either way they are written to a quarantine CSV with the reason and the
+# line of the source file they came from, and the rest of the chunk loads.
+
+INTEGER_RANGES = {"tinyint": (0, 255), "smallint": (-2 ** 15, 2 ** 15 - 1), "int": (-2 ** 31, 2 ** 31 - 1),
+                  "bigint": (-2 ** 63, 2 ** 63 - 1)}
+
+
+def quarantine_path(csv_file, table_name):
+    return f"{sidecar_base(csv_file)}.{table_name}.quarantine.csv"
+
+
+def column_limits(rows):
+    # rows of (COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, IS_NULLABLE)
+    # from INFORMATION_SCHEMA.COLUMNS
+    limits = {}
+    for name, data_type, max_length, is_nullable in rows:
+        data_type = data_type.lower()
+        limits[name] = {"type": data_type,
+                        "max_length": max_length if max_length and max_length > 0 else None,
+                        "range": INTEGER_RANGES.get(data_type),
+                        "nullable": str(is_nullable).upper() != "NO"}
+    return limits
+
+
+def invalid_rows(chunk, limits, column_types=None):
+    # -> {row position: reason} for the rows of a text chunk that the server
+    # would reject. Every check is a vectorised pass over one column. With
+    # column_types alone (no limits) the values that would not convert are
+    # still found: to_parameters would otherwise send them as NULL.
+    reasons = {}
+    limits = limits or {}
+    column_types = column_types or {}
+
+    def flag(mask, reason):
+        for i in np.flatnonzero(mask):
+            reasons.setdefault(int(i), reason)
+
+    for i, name in enumerate(chunk.columns):
+        limit = limits.get(name)
+        sql_type = column_types.get(name)
+        if limit is None and sql_type in (None, "VARCHAR"):
+            continue
+        values = chunk.iloc[:, i]
+        present = values.notna().to_numpy()
+        if limit is not None and not limit["nullable"]:
+            flag(~present, f"{name}: NULL in a NOT NULL column")
+        if limit is not None and limit["max_length"] is not None:
+            flag((values.str.len() > limit["max_length"]).fillna(False).to_numpy(),
+                 f"{name}: longer than {limit['max_length']} characters")
+        if sql_type and sql_type != "VARCHAR":
+            converted = to_parameters(values, sql_type)
+            blank = (values.str.strip() == "").fillna(False).to_numpy()
+            type_name = limit["type"] if limit is not None else sql_type.lower()
+            flag(present & ~blank & converted.isna().to_numpy(), f"{name}: not a valid {type_name}")
+            if limit is not None and limit["range"] is not None:
+                low, high = limit["range"]
+                numbers = converted.astype("Float64")
+                flag(((numbers < low) | (numbers > high)).fillna(False).to_numpy(bool),
+                     f"{name}: out of range for {limit['type']}")
+    return reasons
+
+
+def row_lines(position, rows):
+    # Source line of each row in a chunk, None when the chunk did not come
+    # from a file
+    if "first_line" not in position:
+        return None
+    if position.get("line_starts") is not None:
+        return np.asarray(position["line_starts"])
+    return position["first_line"] + np.arange(rows)
+
+
+class Quarantine:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+        self.file = None
+        self.writer = None
+
+    def add(self, line, error, values, columns=None):
+        with self.lock:
+            if self.file is None:
+                # Appends, so a resumed load keeps what the first run found
+                new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                self.file = open(self.path, 'a', encoding='utf-8', newline='')
+                self.writer = csv.writer(self.file)
+                if new_file:
+                    self.writer.writerow(["source_line", "error"] + (list(columns) if columns is not None else []))
+            self.writer.writerow([line, str(error).replace("\n", " ")] + ["" if v is None else v for v in values])
+            self.file.flush()
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def clear(self):
+        # A fresh load starts a fresh quarantine file
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,207 @@
+import argparse
+import configparser
+import fnmatch
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from autotune import make_chunk_size
+from badrows import Quarantine, column_limits, quarantine_path
+from checkpoint import Checkpoint
+from db import LOADER_DRIVER, open_database
+from deltaload import build_index
+from pipeline import load_csv, read_loader_config
+from projection import projection_for, read_projections
+from sources import compressed_size, csv_name, find_inputs, zip_members
+from stagecache import open_cache
+from typeinfer import parameter_type
+
+# Non-interactive import of a whole drop of CSV files. Files are matched to
+# tables through a mapping file, loaded largest first by a pool of workers,
+# and every file keeps its own checkpoint so a rerun skips what finished.
+# The pool is sized so that all running loads together never hold more than
+# max_connections database connections.
+#
+# The mapping is a JSON object of file name or glob pattern -> table name:
+#
+#     {"case.csv": "Cases", "contact_*.csv": "Contact"}
+#
+# Patterns match the CSV's own name, so case.csv.gz and exports.zip::case.csv
+# both match "case.csv".
+#
+# Files no pattern matches load into the table named after the file, the
+# same rule insertTables.py uses when it creates the tables.
+#
+# With an index key, every file that loads in full also records the delta
+# index insert3.py --delta compares the next export of it against.
+
+
+def find_files(inputs):
+    # Directories contribute their plain, compressed and zipped CSVs; a
+    # pattern that matches a zip archive loads every CSV inside it
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = find_inputs(pattern)
+        else:
+            paths = []
+            for path in glob.glob(pattern):
+                paths.extend(zip_members(path) if path.lower().endswith(".zip") else [path])
+        files.extend(path for path in paths if path not in files)
+    return files
+
+
+def read_mapping(path):
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def table_for(csv_file, mapping):
+    name = csv_name(csv_file)
+    if name in mapping:
+        return mapping[name]
+    for pattern, table_name in mapping.items():
+        if fnmatch.fnmatch(name, pattern):
+            return table_name
+    return name.split('.')[0]
+
+
+def target_columns(database, table_name):
+    # -> (parameter types, column limits) of the target table, from the
+    # database's metadata cache
+    rows = database.columns(table_name)
+    return {row[0]: parameter_type(row[1]) for row in rows}, column_limits(rows)
+
+
+def load_file(csv_file, table_name, database, settings, typed=True, restart=False, cache=None, projection=None,
+              index_key=None):
+    result = {"file": csv_file, "table": table_name, "bytes": compressed_size(csv_file), "rows": 0,
+              "seconds": 0.0, "rows_per_second": 0.0, "mb_per_second": 0.0, "status": "ok", "error": None}
+    start_time = time.perf_counter()
+    try:
+        checkpoint = Checkpoint(csv_file, table_name)
+        checkpoint.load()
+        if restart:
+            checkpoint.state.update(committed_chunks=0, committed_offset=0, next_line=None, rows=0,
+                                    complete=False)
+        elif checkpoint.state["complete"]:
+            result.update(status="skipped", rows=checkpoint.state["rows"])
+            return result
+        resume_args = checkpoint.resume_args() if checkpoint.resuming else {}
+        quarantine = Quarantine(quarantine_path(csv_file, table_name))
+        if not checkpoint.resuming:
+            quarantine.clear()
+
+        column_types, limits = target_columns(database, table_name) if typed else (None, None)
+        chunk_size = make_chunk_size(settings["chunk_size"], settings["target_commit_seconds"],
+                                     settings["memory_limit_mb"])
+        stats = load_csv(csv_file, table_name, database.connect, chunk_size=chunk_size, writers=settings["workers"],
+                         queue_size=settings["queue_size"], commit_every=settings["commit_every"],
+                         on_commit=checkpoint.mark_committed, column_types=column_types, cache=cache,
+                         column_limits=limits, quarantine=quarantine, read_workers=settings["read_workers"],
+                         projection=projection, **resume_args)
+        quarantine.close()
+        checkpoint.mark_complete()
+        if index_key is not None:
+            build_index(csv_file, table_name, index_key, chunk_size, cache=cache, projection=projection)
+        result["rows"] = stats["rows"]
+        result["quarantined"] = stats["quarantined"]
+        result["retried_chunks"] = stats["retried_chunks"]
+        result["filtered"] = stats["filtered"]
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = time.perf_counter() - start_time
+    if result["seconds"] and result["status"] == "ok":
+        result["rows_per_second"] = result["rows"] / result["seconds"]
+        result["mb_per_second"] = result["bytes"] / 1024 / 1024 / result["seconds"]
+    return result
+
+
+def batch_load(files, mapping, database, settings, max_connections=8, typed=True, restart=False,
+               report_path=None, cache=None, projections=(), index_key=None):
+    # Each running load holds one connection per writer; the database's
+    # pool enforces the cap, the worker count just avoids queueing on it
+    per_file = max(settings["workers"], 1)
+    pool_size = max(1, min(len(files), max_connections // per_file))
+    if per_file > max_connections:
+        print(f"[WARN] {per_file} writers per file exceeds the {max_connections} connection cap, "
+              f"loading one file at a time.")
+    # Largest first, so a big file is not left running alone at the end
+    files = sorted(files, key=compressed_size, reverse=True)
+    report = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "max_connections": max_connections,
+              "concurrent_files": pool_size, "writers_per_file": per_file, "files": []}
+    lock = threading.Lock()
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(pool_size) as executor:
+        futures = []
+        for csv_file in files:
+            table_name = table_for(csv_file, mapping)
+            futures.append(executor.submit(load_file, csv_file, table_name, database, settings, typed, restart,
+                                           cache, projection_for(table_name, projections), index_key))
+        for future in as_completed(futures):
+            result = future.result()
+            with lock:
+                report["files"].append(result)
+            if result["status"] == "failed":
+                print(f"[ERROR] {result['file']} -> {result['table']}: {result['error']}")
+            elif result["status"] == "skipped":
+                print(f"[INFO] {result['file']} -> {result['table']}: already imported, skipped.")
+            else:
+                print(f"[SUCCESS] {result['file']} -> {result['table']}: {result['rows']} rows in "
+                      f"{result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s, "
+                      f"{result['mb_per_second']:.1f} MB/s)")
+
+    elapsed = time.perf_counter() - start_time
+    loaded = [result for result in report["files"] if result["status"] == "ok"]
+    report.update(elapsed_seconds=elapsed, rows=sum(result["rows"] for result in loaded),
+                  bytes=sum(result["bytes"] for result in loaded),
+                  failed=sum(result["status"] == "failed" for result in report["files"]))
+    report["rows_per_second"] = report["rows"] / elapsed if elapsed else 0.0
+    report["files"].sort(key=lambda result: result["file"])
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+
+    parser = argparse.ArgumentParser(description="Import a directory of CSV files without prompts.")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of CSV files or zip archives")
+    parser.add_argument("--mapping", help="JSON file mapping file names or patterns to tables")
+    parser.add_argument("--max-connections", dest="max_connections", type=int, default=8,
+                        help="cap on database connections across all running loads (default 8)")
+    parser.add_argument("--workers", type=int, help="writer connections per file (default: [LOADER] Workers or 1)")
+    parser.add_argument("--commit-every", dest="commit_every", type=int, help="chunks per commit on each writer")
+    parser.add_argument("--chunk-size", dest="chunk_size", help="rows per chunk, or auto")
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and reload every file")
+    parser.add_argument("--report", default="batch_report.json", help="where to write the JSON run report")
+    parser.add_argument("--index-key", dest="index_key",
+                        help="after each full load, record a delta index keyed on this column for insert3.py --delta")
+    args = parser.parse_args()
+    settings = read_loader_config(config, args)
+
+    files = find_files(args.inputs)
+    if not files:
+        print("No CSV files found.")
+        return
+    print(f"Loading {len(files)} files with at most {args.max_connections} connections...")
+    database = open_database(config, max_size=args.max_connections, driver=LOADER_DRIVER)
+    report = batch_load(files, read_mapping(args.mapping), database, settings, args.max_connections,
+                        restart=args.restart, report_path=args.report, cache=open_cache(config),
+                        projections=read_projections(config), index_key=args.index_key)
+    database.close()
+    print(f"[INFO] {report['rows']} rows from {len(report['files'])} files in {report['elapsed_seconds']:.2f}s "
+          f"({report['failed']} failed). Report written to {args.report}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+from csvprofile import scan_csv
+from synthetic import write_synthetic_csv
+
+# Times the column-width pass behind colreducer1.analyze_csv on a wide
+# synthetic file: the old per-cell apply(len) loop against the vectorized
+# scan, serial and across processes. The scan is the whole profile pass, so
+# it also collects the typeinfer counters the legacy loop never computed.
+
+
+def legacy_max_lengths(filename, chunksize=50000):
+    column_max_lengths = defaultdict(int)
+    for chunk in pd.read_csv(filename, chunksize=chunksize, low_memory=False):
+        for column in chunk.columns:
+            max_length = chunk[column].dropna().astype(str).apply(len).max()
+            if max_length > column_max_lengths[column]:
+                column_max_lengths[column] = max_length
+    return column_max_lengths
+
+
+def timed(func, *args, **kwargs):
+    start_time = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the colreducer1 column-width scan.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--columns", type=int, default=300)
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--file", help="existing CSV to use instead of generating one")
+    args = parser.parse_args()
+
+    csv_file = args.file
+    if csv_file is None:
+        csv_file = os.path.join(tempfile.mkdtemp(), "synthetic_case.csv")
+        print(f"Writing {args.rows} x {args.columns} synthetic file to {csv_file}...")
+        write_synthetic_csv(csv_file, args.rows, args.columns)
+
+    legacy = timed(legacy_max_lengths, csv_file, args.chunksize)
+    print(f"legacy apply(len):      {legacy:.2f}s")
+    serial = timed(scan_csv, csv_file, args.chunksize, workers=1)
+    print(f"vectorized, 1 process:  {serial:.2f}s ({legacy / serial:.1f}x)")
+    workers = os.cpu_count() or 1
+    parallel = timed(scan_csv, csv_file, args.chunksize, workers=workers)
+    print(f"vectorized, {workers} processes: {parallel:.2f}s ({legacy / parallel:.1f}x)")
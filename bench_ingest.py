@@ -0,0 +1,295 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from autotune import current_rss
+from badrows import Quarantine, column_limits, invalid_rows
+from colreducer1 import analyze_csv
+from csvprofile import get_profile, profile_path
+from csvreader import read_chunks
+from db import SqliteBackend
+from migrate import parse_type
+from pipeline import build_insert_sql, convert_chunk, load_csv
+from synthetic import WIDTH_DISTRIBUTIONS, write_synthetic_csv
+from typeinfer import choose_type, is_string_type, parameter_type
+
+# End-to-end ingest benchmark. Generates a synthetic export (or takes a real
+# CSV), then times each stage on its own, chunk by chunk:
+#
+#   parse    read_chunks() as text, the way the typed loaders read
+#   profile  colreducer1.analyze_csv() on a cold profile cache
+#   convert  bad-row checks plus executemany parameters (pipeline.convert_chunk)
+#   insert   executemany + commit into the sink
+#
+# and finally the whole threaded pipeline (pipeline.load_csv). The sink is a
+# SQLite file or a fake pyodbc connection that only walks the parameters, so
+# the database is out of the picture. Results go to a JSON file; pass the
+# previous run's file to --compare to see what a change did.
+
+TABLE = "Cases"
+PRIMARY_KEY = "Case ID"
+
+
+def peak_rss_mb():
+    # Linux reports kilobytes, macOS bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+class FakeCursor:
+    # Stands in for a pyodbc cursor: executemany walks every parameter row
+    # like the driver binding them and keeps nothing
+    def __init__(self, sink):
+        self.sink = sink
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        return self
+
+    def executemany(self, sql, rows):
+        count = 0
+        for row in rows:
+            count += len(row) > 0
+        with self.sink.lock:
+            self.sink.rows += count
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeSink:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = 0
+
+    def connect(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_sink(kind, work_dir, create_statement):
+    if kind == "fake":
+        return FakeSink().connect
+    backend = SqliteBackend(os.path.join(work_dir, "bench.db"))
+    conn = backend.connect()
+    conn.execute(create_statement)
+    conn.commit()
+    conn.close()
+    return backend.connect
+
+
+def reset_sink(kind, connect):
+    if kind == "sqlite":
+        conn = connect()
+        conn.execute(f"DELETE FROM {TABLE}")
+        conn.commit()
+        conn.close()
+
+
+def target_columns(csv_file, threshold):
+    # (name, data_type, max_length, is_nullable) as INFORMATION_SCHEMA would
+    # report them for the table analyze_csv creates
+    columns = []
+    for column in get_profile(csv_file)["columns"]:
+        sql_type = choose_type(column["type_stats"], threshold)[0]
+        base, size, _ = parse_type(sql_type)
+        columns.append((column["name"], base, size if is_string_type(sql_type) else None,
+                        "NO" if column["name"] == PRIMARY_KEY else "YES"))
+    return columns
+
+
+def summarise(seconds, rows, mb, rss=None):
+    seconds = np.asarray(seconds, dtype=float)
+    total = float(seconds.sum())
+    summary = {"calls": len(seconds), "seconds": total,
+               "rows_per_second": rows / total if total else None,
+               "mb_per_second": mb / total if total else None}
+    for name, q in (("p50_ms", 50), ("p90_ms", 90), ("p99_ms", 99), ("max_ms", 100)):
+        summary[name] = float(np.percentile(seconds, q)) * 1000 if len(seconds) else None
+    if rss is not None:
+        summary["peak_rss_mb"] = max(rss) / 2 ** 20 if rss else None
+    return summary
+
+
+def run_stages(csv_file, connect, columns, chunk_size, mb):
+    column_types = {name: parameter_type(data_type) for name, data_type, _, _ in columns}
+    limits = column_limits(columns)
+    timings = {"parse": [], "convert": [], "insert": []}
+    rss = {"parse": [], "convert": [], "insert": []}
+    rows = rejected = 0
+    conn = connect()
+    cursor = conn.cursor()
+    chunks = read_chunks(csv_file, chunk_size, dtype=str)
+    while True:
+        start_time = time.perf_counter()
+        item = next(chunks, None)
+        if item is None:
+            break
+        timings["parse"].append(time.perf_counter() - start_time)
+        rss["parse"].append(current_rss())
+        _, chunk = item
+        rows += len(chunk)
+
+        start_time = time.perf_counter()
+        reasons = invalid_rows(chunk, limits, column_types)
+        if reasons:
+            keep = np.ones(len(chunk), dtype=bool)
+            keep[sorted(reasons)] = False
+            chunk = chunk.iloc[keep]
+            rejected += len(reasons)
+        sql = build_insert_sql(TABLE, chunk.columns)
+        batch = convert_chunk(chunk, column_types)
+        timings["convert"].append(time.perf_counter() - start_time)
+        rss["convert"].append(current_rss())
+
+        start_time = time.perf_counter()
+        cursor.executemany(sql, batch)
+        conn.commit()
+        timings["insert"].append(time.perf_counter() - start_time)
+        rss["insert"].append(current_rss())
+    cursor.close()
+    conn.close()
+
+    stages = {name: summarise(timings[name], rows, mb, rss[name]) for name in timings}
+    return stages, rows, rejected
+
+
+def run_pipeline(csv_file, connect, columns, chunk_size, writers, mb, work_dir):
+    quarantine = Quarantine(os.path.join(work_dir, "bench.quarantine.csv"))
+    quarantine.clear()
+    stats = load_csv(csv_file, TABLE, connect, chunk_size=chunk_size, writers=writers,
+                     column_types={name: parameter_type(data_type) for name, data_type, _, _ in columns},
+                     column_limits=column_limits(columns), quarantine=quarantine)
+    quarantine.close()
+    return {"writers": writers, "rows": stats["rows"], "quarantined": stats["quarantined"],
+            "seconds": stats["elapsed_seconds"], "rows_per_second": stats["rows_per_second"],
+            "mb_per_second": mb / stats["elapsed_seconds"] if stats["elapsed_seconds"] else None,
+            "read_seconds": stats["read_seconds"], "convert_seconds": stats["convert_seconds"],
+            "write_seconds": stats["write_seconds"]}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(previous, current):
+    print(f"Compared with {previous['run'].get('commit')} ({previous['run'].get('started')}):")
+    for name, stage in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before or not before.get("rows_per_second") or not stage.get("rows_per_second"):
+            continue
+        ratio = stage["rows_per_second"] / before["rows_per_second"]
+        print(f"  {name:>8}: {before['rows_per_second']:12.0f} -> {stage['rows_per_second']:12.0f} rows/s "
+              f"({ratio:.2f}x), p90 {before['p90_ms']:.1f} -> {stage['p90_ms']:.1f} ms")
+    before = previous.get("pipeline", {}).get("rows_per_second")
+    if before:
+        after = current["pipeline"]["rows_per_second"]
+        print(f"  pipeline: {before:12.0f} -> {after:12.0f} rows/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parse, profile, convert and insert end to end.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--columns", type=int, default=30)
+    parser.add_argument("--max-width", type=int, default=40)
+    parser.add_argument("--width-distribution", choices=WIDTH_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--null-ratio", type=float, default=0.05)
+    parser.add_argument("--bad-row-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", help="existing CSV to use instead of generating one")
+    parser.add_argument("--sink", choices=["sqlite", "fake"], default="sqlite")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--writers", type=int, default=2, help="writer threads for the pipeline run")
+    parser.add_argument("--type-threshold", type=float, default=0.95,
+                        help="share of values a type must fit; below 1.0 bad rows are quarantined, "
+                             "not typed as VARCHAR")
+    parser.add_argument("--output", default="bench_ingest.json")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--generate", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        write_synthetic_csv(args.generate, args.rows, args.columns, args.max_width, args.null_ratio, args.seed,
+                            args.width_distribution, args.bad_row_rate)
+        sys.exit()
+
+    work_dir = tempfile.mkdtemp()
+    csv_file = args.file
+    if csv_file is None:
+        # Generated in a child process so building the frame does not count
+        # towards this process's peak RSS
+        csv_file = os.path.join(work_dir, "synthetic.csv")
+        print(f"Writing {args.rows} x {args.columns} synthetic file ({args.width_distribution} widths, "
+              f"{args.bad_row_rate:.1%} bad rows) to {csv_file}...")
+        subprocess.run([sys.executable, __file__, "--generate", csv_file, "--rows", str(args.rows),
+                        "--columns", str(args.columns), "--max-width", str(args.max_width),
+                        "--width-distribution", args.width_distribution, "--null-ratio", str(args.null_ratio),
+                        "--bad-row-rate", str(args.bad_row_rate), "--seed", str(args.seed)], check=True)
+    mb = os.path.getsize(csv_file) / 2 ** 20
+
+    if os.path.exists(profile_path(csv_file)):
+        os.remove(profile_path(csv_file))
+    start_time = time.perf_counter()
+    create_statement = analyze_csv(csv_file, PRIMARY_KEY, args.chunk_size, threshold=args.type_threshold)
+    profile_seconds = time.perf_counter() - start_time
+    columns = target_columns(csv_file, args.type_threshold)
+
+    connect = open_sink(args.sink, work_dir, create_statement)
+    stages, rows, rejected = run_stages(csv_file, connect, columns, args.chunk_size, mb)
+    stages["profile"] = summarise([profile_seconds], rows, mb)
+    reset_sink(args.sink, connect)
+    pipeline = run_pipeline(csv_file, connect, columns, args.chunk_size, args.writers, mb, work_dir)
+
+    staged_seconds = sum(stage["seconds"] for name, stage in stages.items() if name != "profile")
+    result = {
+        "run": {"started": datetime.datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                "python": platform.python_version(), "platform": platform.platform(), "args": vars(args)},
+        "data": {"file": csv_file, "rows": rows, "mb": mb, "rejected_rows": rejected},
+        "stages": {name: stages[name] for name in ("parse", "profile", "convert", "insert")},
+        "pipeline": pipeline,
+        "rows_per_second": rows / staged_seconds if staged_seconds else None,
+        "mb_per_second": mb / staged_seconds if staged_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{rows} rows, {mb:.1f} MB, {rejected} rejected, sink {args.sink}")
+    for name, stage in result["stages"].items():
+        print(f"  {name:>8}: {stage['seconds']:7.2f}s {stage['rows_per_second']:12.0f} rows/s "
+              f"{stage['mb_per_second']:8.1f} MB/s  p50 {stage['p50_ms']:.1f} ms  p99 {stage['p99_ms']:.1f} ms")
+    print(f"  pipeline: {pipeline['seconds']:7.2f}s {pipeline['rows_per_second']:12.0f} rows/s "
+          f"{pipeline['mb_per_second']:8.1f} MB/s ({args.writers} writers, {pipeline['quarantined']} quarantined)")
+    print(f"Peak RSS {result['peak_rss_mb']:.0f} MB. Results written to {args.output}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
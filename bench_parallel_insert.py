@@ -0,0 +1,50 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+from autotune import make_chunk_size
+from pipeline import load_csv
+from synthetic import write_synthetic_csv
+
+# Compare single and multi-connection loads against a local SQLite file.
+# SQLite serialises writers, so this measures the pipeline overhead and the
+# per-worker accounting rather than the speedup SQL Server would give.
+
+
+def run(csv_file, workers, commit_every, chunk_size):
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+    columns = pd.read_csv(csv_file, nrows=0).columns
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"CREATE TABLE Cases ({', '.join(f'[{col}]' for col in columns)})")
+    conn.commit()
+    conn.close()
+    return load_csv(csv_file, "Cases", lambda: sqlite3.connect(db_file, timeout=60),
+                    chunk_size=chunk_size, writers=workers, commit_every=commit_every)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parallel CSV inserts against SQLite.")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--columns", type=int, default=30)
+    parser.add_argument("--chunk-size", default="10000", help="rows per chunk or auto")
+    parser.add_argument("--target-commit-seconds", type=float, default=2.0)
+    parser.add_argument("--commit-every", type=int, default=1)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    csv_file = os.path.join(tempfile.mkdtemp(), "synthetic.csv")
+    write_synthetic_csv(csv_file, args.rows, args.columns)
+
+    for workers in args.workers:
+        chunk_size = make_chunk_size(args.chunk_size, args.target_commit_seconds)
+        stats = run(csv_file, workers, args.commit_every, chunk_size)
+        print(f"workers={workers}: {stats['rows']} rows in {stats['elapsed_seconds']:.2f}s "
+              f"({stats['rows_per_second']:.0f} rows/s)")
+        for worker in stats["workers"]:
+            print(f"    worker {worker['worker']}: {worker['rows']} rows, {worker['rows_per_second']:.0f} rows/s")
+        if "chunk_size" in stats:
+            print(f"    chunk size settled at {stats['chunk_size']}, peak RSS {stats['peak_rss_mb']} MB")
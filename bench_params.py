@@ -0,0 +1,80 @@
+import argparse
+import collections
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from params import build_batch, iter_batch
+from synthetic import write_synthetic_csv
+from typeinfer import choose_type, observe_chunk
+
+# Memory and time of turning one chunk into executemany parameters. Each
+# mode runs in its own process so ru_maxrss (peak RSS) is not polluted by
+# the other modes; the reported peak is the growth over the parsed chunk.
+
+MODES = ["legacy", "batch", "typed", "iter"]
+
+
+def legacy(chunk):
+    chunk = chunk.replace({np.nan: "NULL"})
+    return [tuple(x) for x in chunk.to_numpy()]
+
+
+def peak_rss_mb():
+    # Linux reports kilobytes, macOS bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def measure(mode, csv_file, chunksize):
+    text = mode in ("typed", "iter")
+    chunk = pd.read_csv(csv_file, nrows=chunksize, low_memory=False, dtype=str if text else None)
+    column_types = None
+    if text:
+        column_types = {name: choose_type(stats)[0] for name, stats in observe_chunk(chunk).items()}
+    before = peak_rss_mb()
+
+    start_time = time.perf_counter()
+    if mode == "legacy":
+        rows = legacy(chunk)
+    elif mode == "batch":
+        rows = build_batch(chunk)
+    elif mode == "typed":
+        rows = build_batch(chunk, column_types)
+    else:
+        rows = None
+        collections.deque(iter_batch(chunk, column_types), maxlen=0)  # a streaming consumer
+    elapsed = time.perf_counter() - start_time
+    # Freed outside the timed section; the peak RSS has already seen it
+    del rows
+
+    return {"mode": mode, "rows": len(chunk), "seconds": elapsed, "peak_rss_growth_mb": peak_rss_mb() - before}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark executemany parameter conversion.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--columns", type=int, default=100)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.file, args.rows)))
+        sys.exit()
+
+    csv_file = os.path.join(tempfile.mkdtemp(), "params.csv")
+    write_synthetic_csv(csv_file, args.rows, args.columns)
+    print(f"{args.rows} rows x {args.columns} columns per chunk")
+    for mode in MODES:
+        output = subprocess.run([sys.executable, __file__, "--mode", mode, "--file", csv_file, "--rows", str(args.rows)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print(f"{mode:>7}: {result['seconds'] * 1000:8.1f} ms, peak RSS +{result['peak_rss_growth_mb']:.1f} MB")
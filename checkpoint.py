@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+
+from sources import archive_path, input_stat, sidecar_base
+
+# Progress file for a CSV -> table import. It records the file's hash and the
+# byte offset just past the last chunk of the contiguous committed prefix, so
+# a rerun can seek straight to the first uncommitted chunk. Writers may commit
+# out of order; chunks that land ahead of a gap are held until it is filled.
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def checkpoint_path(csv_file, table_name):
+    return f"{sidecar_base(csv_file)}.{table_name}.checkpoint.json"
+
+
+class Checkpoint:
+    def __init__(self, csv_file, table_name, path=None):
+        self.csv_file = csv_file
+        self.table_name = table_name
+        self.path = path or checkpoint_path(csv_file, table_name)
+        self.lock = threading.Lock()
+        self.state = None
+        self.done_ahead = {}
+
+    def load(self):
+        stat = input_stat(self.csv_file)
+        saved = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+
+        # Re-hash only when size or mtime say the file may have changed
+        if saved and saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime:
+            digest = saved["hash"]
+        else:
+            digest = file_hash(archive_path(self.csv_file))
+
+        if saved and saved["hash"] == digest and saved["table"] == self.table_name:
+            saved["size"], saved["mtime"] = stat.st_size, stat.st_mtime
+            self.state = saved
+        else:
+            if saved:
+                print(f"[INFO] {self.csv_file} changed since the last run, ignoring old checkpoint.")
+            self.state = {"file": os.path.abspath(self.csv_file), "table": self.table_name,
+                          "size": stat.st_size, "mtime": stat.st_mtime, "hash": digest,
+                          "committed_chunks": 0, "committed_offset": 0, "next_line": None,
+                          "rows": 0, "complete": False}
+        return self.state
+
+    @property
+    def resuming(self):
+        return self.state["committed_chunks"] > 0 and not self.state["complete"]
+
+    def resume_args(self):
+        return {"start_offset": self.state["committed_offset"], "start_index": self.state["committed_chunks"],
+                "start_line": self.state["next_line"]}
+
+    def mark_committed(self, position, rows):
+        with self.lock:
+            self.done_ahead[position["index"]] = (position, rows)
+            advanced = False
+            while self.state["committed_chunks"] in self.done_ahead:
+                done, done_rows = self.done_ahead.pop(self.state["committed_chunks"])
+                self.state["committed_chunks"] += 1
+                self.state["committed_offset"] = done["end"]
+                self.state["next_line"] = done["next_line"]
+                self.state["rows"] += done_rows
+                advanced = True
+            if advanced:
+                self.save()
+
+    def mark_complete(self):
+        with self.lock:
+            self.state["complete"] = True
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
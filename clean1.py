@@ -1,36 +1,82 @@
-import pandas as pd
+import argparse
+import configparser
 import os
 
-# Define the directory where your CSV files are located
-csv_directory = os.getcwd()
-print('csvdir :' + csv_directory)
+from csvprofile import get_profile
+from csvreader import read_chunks
+from projection import describe, projection_for, read_projections
+from sources import csv_name, find_inputs
+from stagecache import open_cache
+from stream import DedupeByKey, Stage, drop_columns, normalise, run_pipeline, trim, write_csv
 
-# Get a list of all CSV files in that directory
-csv_files = [f for f in os.listdir(csv_directory) if f.endswith('.csv')]
+# Clean every CSV in the working directory chunk by chunk and write the
+# result to the output directory. Nothing holds a whole file: each stage
+# passes one chunk on before the next is read, so memory depends on the
+# chunk size, not on the size of the exports.
 
-# Initialize a dictionary to hold DataFrames. The keys will be the CSV filenames.
-dataframes = {}
 
-# Specify the chunk size for reading in the CSV
-chunk_size = 50000  # you can change this size depending on your available memory
+def clean_file(full_path, output_path, chunk_size=50000, key=None, keep_empty_columns=False, cache=None,
+               read_workers=1, projection=None):
+    stages = [Stage("trim", trim), Stage("normalise", normalise)]
+    if key:
+        stages.append(Stage("dedupe", DedupeByKey(key)))
+    if not keep_empty_columns:
+        # Whether a column is empty is only known for the whole file, so it
+        # comes from the cached profile rather than from the chunks
+        profile = get_profile(full_path, chunk_size)
+        empty = [column["name"].strip() for column in profile["columns"] if column["nulls"] == profile["rows"]]
+        if projection is not None and projection["columns"]:
+            renamed = dict(projection["columns"])
+            empty = [renamed[name] for name in empty if name in renamed]
+        if empty:
+            print(f"Dropping empty columns: {', '.join(empty)}")
+            stages.append(Stage("drop_empty", drop_columns(empty)))
 
-for csv_file in csv_files:
-    chunks = []
-    full_path = os.path.join(csv_directory, csv_file)
-    for chunk in pd.read_csv(full_path, chunksize=chunk_size, encoding='utf-8', low_memory=False):
-    # your code for processing each chunk
+    # Read as text so cleaning never changes a value's formatting; a table's
+    # column mapping keeps only the columns that table takes
+    chunks = (chunk for _, chunk in read_chunks(full_path, chunk_size, cache=cache, workers=read_workers,
+                                                projection=projection, dtype=str))
+    read = Stage("read")
+    rows = write_csv(run_pipeline(chunks, [read] + stages), output_path)
+    return rows, [stage.stats() for stage in [read] + stages]
 
-        chunks.append(chunk)
 
-    # Combine chunks back into single dataframe
-    df = pd.concat(chunks, axis=0)
-    
-    # Store the DataFrame in the dictionary
-    dataframes[csv_file] = df
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clean the CSV files in the current directory.")
+    parser.add_argument("--output-dir", default="cleaned", help="where the cleaned files are written")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--key", help="drop rows repeating an earlier value of this column")
+    parser.add_argument("--keep-empty-columns", action="store_true")
+    parser.add_argument("--all-columns", action="store_true",
+                        help="ignore the [TABLE:...] column mappings and keep every column")
+    parser.add_argument("--read-workers", type=int, default=os.cpu_count(),
+                        help="processes parsing the CSV (default: all cores)")
+    args = parser.parse_args()
 
-    # Print first few rows to check
-    print(f"First few rows of {csv_file}:")
-    print(df.head())
-    print("\n---\n")
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    cache = open_cache(config)
 
-# Now, 'dataframes' is a dictionary containing all your DataFrames
+    # Define the directory where your CSV files are located
+    csv_directory = os.getcwd()
+    print('csvdir :' + csv_directory)
+
+    # Get a list of all CSV files in that directory, compressed and zipped ones included
+    csv_files = find_inputs(csv_directory)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    projections = [] if args.all_columns else read_projections(config)
+    for full_path in csv_files:
+        # Cleaned files are written uncompressed, named after the CSV itself
+        csv_file = csv_name(full_path)
+        output_path = os.path.join(args.output_dir, csv_file)
+        projection = projection_for(csv_file.split('.')[0], projections)
+        if projection is not None:
+            print(describe(projection, csv_file.split('.')[0]))
+        rows, stage_stats = clean_file(full_path, output_path, args.chunk_size, args.key, args.keep_empty_columns,
+                                       cache, args.read_workers, projection)
+        print(f"{csv_file}: {rows} rows written to {output_path}")
+        for stats in stage_stats:
+            print(f"    {stats['stage']}: {stats['rows_in']} rows in, {stats['rows_out']} out, "
+                  f"{stats['seconds']:.2f}s")
+        print("\n---\n")
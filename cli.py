@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import configparser
+import os
+import sys
+
+# One entry point for the tools:
+#
+#   python cli.py profile|ddl|load|verify|alter|clean|rename ...
+#
+# Nothing heavy is imported at startup. Each subcommand imports what it
+# uses when it runs, so --help and argument errors never load pandas,
+# numpy, pyarrow or a database driver. Commands with several steps run as
+# asyncio tasks: connecting, metadata queries (table lists, column
+# definitions), profile scans and prompts are started together on worker
+# threads and awaited where their results are needed, so their waits
+# overlap instead of adding up.
+
+
+def read_config(path):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def in_thread(func, *args, **kwargs):
+    # A task running func on the default thread pool
+    return asyncio.create_task(asyncio.to_thread(func, *args, **kwargs))
+
+
+async def ask(prompt):
+    # input() without stopping the tasks already running
+    return (await asyncio.to_thread(input, prompt)).strip().lower()
+
+
+def find_files(inputs):
+    from batchload import find_files as find
+    return find(inputs or ["."])
+
+
+async def profile_command(args, config):
+    from csvprofile import profile_files
+
+    files = find_files(args.inputs)
+    if not files:
+        print("No CSV files found.")
+        return 1
+    profiles = await asyncio.to_thread(profile_files, files, args.chunk_size, args.workers, args.refresh)
+    for csv_file in files:
+        profile = profiles[csv_file]
+        print(f"{csv_file}: {profile['rows']} rows, {len(profile['columns'])} columns")
+        if args.columns:
+            for column in profile["columns"]:
+                print(f"    [{column['name']}] {column['type']} ({column['confidence']:.1%}), "
+                      f"{column['nulls']} nulls, max length {column['max_length']}")
+    return 0
+
+
+async def ddl_command(args, config):
+    from db import open_database
+    from ddl import create_tables, read_table_rules
+    from insertTables import plan_tables
+    from projection import read_projections
+
+    files = find_files(args.inputs)
+    if not files:
+        print("No CSV files found.")
+        return 1
+    # Connecting and listing the tables overlaps with profiling the files
+    database_task = None if args.dry_run else in_thread(open_database, config)
+    tables_task = asyncio.create_task(_tables(database_task)) if database_task is not None else None
+    try:
+        print(f"Profiling {len(files)} CSV files...")
+        plans = await asyncio.to_thread(plan_tables, files, read_table_rules(config), args.threshold,
+                                        args.workers, read_projections(config))
+        existing = {name.lower() for name in await tables_task} if tables_task is not None else set()
+
+        new_plans = []
+        for table_name, statements in plans:
+            if table_name.lower() in existing:
+                print(f"Table {table_name} already exists, skipping.")
+                continue
+            new_plans.append((table_name, statements))
+            print("\n".join(statements))
+        if database_task is None or not new_plans:
+            return 0
+        database = await database_task
+        conn = database.connect()
+        try:
+            await asyncio.to_thread(create_tables, conn, new_plans)
+            print(f"[SUCCESS] Created {len(new_plans)} tables.")
+        except Exception as e:
+            print(f"[ERROR] Error while creating tables, none were created. Error: {e}")
+            return 1
+        finally:
+            conn.close()
+        return 0
+    finally:
+        # Also when profiling or a [TABLE:...] rule failed: the connection
+        # opened meanwhile is closed, not left to the pool's threads
+        if database_task is not None:
+            await _close_database(database_task, tables_task)
+
+
+async def _close_database(database_task, *tasks):
+    # Waits for the queries still running on the database, then closes it.
+    # Their errors are retrieved here, so a failed connect is not reported
+    # again as never awaited.
+    for task in tasks + (database_task,):
+        if not task.done():
+            await asyncio.wait([task])
+        if not task.cancelled():
+            task.exception()
+    if not database_task.cancelled() and database_task.exception() is None:
+        database_task.result().close()
+
+
+async def _tables(database_task):
+    database = await database_task
+    return await asyncio.to_thread(database.tables)
+
+
+async def load_command(args, config):
+    from batchload import batch_load, read_mapping, table_for
+    from db import LOADER_DRIVER, open_database
+    from pipeline import read_loader_config
+    from projection import read_projections
+    from stagecache import open_cache
+
+    files = find_files(args.inputs)
+    if not files:
+        print("No CSV files found.")
+        return 1
+    mapping = read_mapping(args.mapping)
+    targets = {csv_file: table_for(csv_file, mapping) for csv_file in files}
+    database = await asyncio.to_thread(open_database, config, None, None, args.max_connections, LOADER_DRIVER)
+    try:
+        # The table list and every target's columns in one round of queries;
+        # the loads then find them in the database's metadata cache
+        tables, *_ = await asyncio.gather(asyncio.to_thread(database.tables),
+                                          *(asyncio.to_thread(database.columns, table_name)
+                                            for table_name in sorted(set(targets.values()))))
+        existing = {name.lower() for name in tables}
+        missing = sorted({table_name for table_name in targets.values() if table_name.lower() not in existing})
+        if missing:
+            print(f"[ERROR] No table {', '.join(missing)} in the database; run the ddl command first. "
+                  f"Their files are skipped.")
+            files = [csv_file for csv_file in files if targets[csv_file] not in missing]
+
+        print(f"Loading {len(files)} files with at most {args.max_connections} connections...")
+        settings = read_loader_config(config, args)
+        report = await asyncio.to_thread(batch_load, files, mapping, database, settings, args.max_connections,
+                                         restart=args.restart, report_path=args.report, cache=open_cache(config),
+                                         projections=read_projections(config), index_key=args.index_key)
+        print(f"[INFO] {report['rows']} rows from {len(report['files'])} files in "
+              f"{report['elapsed_seconds']:.2f}s ({report['failed']} failed). Report written to {args.report}.")
+
+        failed = bool(report["failed"] or missing)
+        if args.verify_key:
+            for result in report["files"]:
+                if result["status"] == "ok":
+                    failed = not await _verify(result["file"], result["table"], database, config,
+                                               args.verify_key) or failed
+        return 1 if failed else 0
+    finally:
+        database.close()
+
+
+async def _verify(csv_file, table_name, database, config, key, workers=None, columns=None, partitions=256,
+                  max_drill=16, report_path=None):
+    from projection import projection_for, read_projections
+    from verify import print_report, verify_load
+
+    report = await asyncio.to_thread(verify_load, csv_file, table_name, database.connect, key, columns, partitions,
+                                     workers, projection=projection_for(table_name, read_projections(config)),
+                                     max_drill=max_drill)
+    print_report(report)
+    if report_path:
+        import json
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report["ok"]
+
+
+async def verify_command(args, config):
+    from db import open_database
+
+    database = await asyncio.to_thread(open_database, config)
+    try:
+        columns = [name.strip() for name in args.columns.split(",")] if args.columns else None
+        ok = await _verify(args.csv_file, args.table, database, config, args.key, args.workers, columns,
+                           args.partitions, args.max_drill, args.report)
+    finally:
+        database.close()
+    return 0 if ok else 1
+
+
+async def alter_command(args, config):
+    from db import open_database
+    from migrate import parse_alter_statements
+
+    # The connection is opened while the profile is read or scanned
+    database_task = in_thread(open_database, config, None, 0, 1, "SQL Server")
+    try:
+        if args.profile_csv:
+            desired = await asyncio.to_thread(_profile_types, args.profile_csv, args.table, config)
+        else:
+            with open(args.statements) as f:
+                desired = parse_alter_statements(f.readlines())
+        database = await database_task
+        connection = await asyncio.to_thread(database.connect)
+        try:
+            return await _alter(args, connection, desired)
+        finally:
+            connection.close()
+    finally:
+        await _close_database(database_task)
+
+
+async def _alter(args, connection, desired):
+    from alterCol import print_plan
+    from migrate import execute, plan
+
+    min_passes = {"alter": float("inf"), "rebuild": 0}.get(args.strategy, args.rebuild_min_passes)
+    result = await asyncio.to_thread(plan, connection.cursor(), args.table, desired, args.only_max, min_passes)
+    if not result["changes"]:
+        print("No column changes needed.")
+        return 0
+    print_plan(result, args.strategy)
+    print("The following statements will be executed:")
+    for statement in result["statements"]:
+        print(statement)
+    if result["unsafe"]:
+        print(f"{len(result['unsafe'])} columns hold data that does not fit the new type. Execution aborted.")
+        return 1
+    if args.dry_run:
+        return 0
+    if not args.yes and await ask(f"Execute {len(result['statements'])} statements? (yes/no): ") != "yes":
+        print("Execution aborted.")
+        return 1
+    try:
+        await asyncio.to_thread(execute, connection, result["statements"])
+        print("All statements executed successfully.")
+    except Exception as e:
+        print(f"Transaction rolled back due to errors: {e}")
+        return 1
+    return 0
+
+
+def _profile_types(csv_file, table_name, config):
+    from csvprofile import get_profile
+    from migrate import types_from_profile
+    from projection import project_types, projection_for, read_projections
+    return project_types(types_from_profile(get_profile(csv_file)),
+                         projection_for(table_name, read_projections(config)))
+
+
+async def clean_command(args, config):
+    from clean1 import clean_file
+    from projection import describe, projection_for, read_projections
+    from sources import csv_name
+    from stagecache import open_cache
+
+    files = find_files(args.inputs)
+    if not files:
+        print("No CSV files found.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache = open_cache(config)
+    projections = [] if args.all_columns else read_projections(config)
+    # --jobs files at a time; each one's profile scan and parse overlap with
+    # the others' writes
+    jobs = asyncio.Semaphore(max(args.jobs, 1))
+
+    async def clean(full_path):
+        csv_file = csv_name(full_path)
+        output_path = os.path.join(args.output_dir, csv_file)
+        projection = projection_for(csv_file.split('.')[0], projections)
+        async with jobs:
+            if projection is not None:
+                print(describe(projection, csv_file.split('.')[0]))
+            rows, stage_stats = await asyncio.to_thread(clean_file, full_path, output_path, args.chunk_size, args.key,
+                                                        args.keep_empty_columns, cache, args.read_workers,
+                                                        projection)
+        print(f"{csv_file}: {rows} rows written to {output_path}")
+        for stats in stage_stats:
+            print(f"    {stats['stage']}: {stats['rows_in']} rows in, {stats['rows_out']} out, "
+                  f"{stats['seconds']:.2f}s")
+
+    await asyncio.gather(*(clean(full_path) for full_path in files))
+    return 0
+
+
+async def rename_command(args, config):
+    from namesShorten import shorten_names
+
+    renamed = shorten_names(args.directory, args.dry_run)
+    for old_name, new_name in renamed:
+        print(f"{old_name} -> {new_name}")
+    print(f"{'Would rename' if args.dry_run else 'Renamed'} {len(renamed)} files.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="CSV profiling, table creation and loading for SQL Server.")
+    parser.add_argument("--config", default="config.ini", help="configuration file (default: config.ini)")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    profile = commands.add_parser("profile", help="profile CSV files (rows, widths, inferred types)")
+    profile.add_argument("inputs", nargs="*", help="CSV files, directories or glob patterns (default: here)")
+    profile.add_argument("--columns", action="store_true", help="print every column's profile")
+    profile.add_argument("--refresh", action="store_true", help="rescan even when a cached profile is current")
+    profile.add_argument("--workers", type=int, help="processes scanning the files (default: all cores)")
+    profile.add_argument("--chunk-size", dest="chunk_size", type=int, default=50000)
+    profile.set_defaults(run=profile_command)
+
+    ddl = commands.add_parser("ddl", help="create the tables for CSV files from their profiles")
+    ddl.add_argument("inputs", nargs="*", help="CSV files, directories or glob patterns (default: here)")
+    ddl.add_argument("--threshold", type=float, default=1.0,
+                     help="share of values a type must fit before it is chosen over VARCHAR")
+    ddl.add_argument("--workers", type=int, help="processes profiling the files (default: all cores)")
+    ddl.add_argument("--dry-run", action="store_true", help="print the DDL, create nothing")
+    ddl.set_defaults(run=ddl_command)
+
+    load = commands.add_parser("load", help="load CSV files into their tables without prompts")
+    load.add_argument("inputs", nargs="*", help="CSV files, directories or glob patterns (default: here)")
+    load.add_argument("--mapping", help="JSON file mapping file names or patterns to tables")
+    load.add_argument("--max-connections", dest="max_connections", type=int, default=8,
+                      help="cap on database connections across all running loads (default 8)")
+    load.add_argument("--workers", type=int, help="writer connections per file (default: [LOADER] Workers or 1)")
+    load.add_argument("--read-workers", dest="read_workers", type=int,
+                      help="processes parsing each file (default: [LOADER] ReadWorkers or 1)")
+    load.add_argument("--commit-every", dest="commit_every", type=int, help="chunks per commit on each writer")
+    load.add_argument("--chunk-size", dest="chunk_size", help="rows per chunk, or auto")
+    load.add_argument("--restart", action="store_true", help="ignore checkpoints and reload every file")
+    load.add_argument("--report", default="batch_report.json", help="where to write the JSON run report")
+    load.add_argument("--verify-key", dest="verify_key",
+                      help="verify every loaded table against its CSV by this key column afterwards")
+    load.add_argument("--index-key", dest="index_key",
+                      help="after each full load, record a delta index keyed on this column for insert3.py --delta")
+    load.set_defaults(run=load_command)
+
+    verify = commands.add_parser("verify", help="check that a loaded table matches its CSV")
+    verify.add_argument("csv_file")
+    verify.add_argument("table")
+    verify.add_argument("--key", required=True, help="primary key or unique column")
+    verify.add_argument("--columns", help="comma separated columns to compare (default: every comparable column)")
+    verify.add_argument("--partitions", type=int, default=256, help="key hash partitions (default 256)")
+    verify.add_argument("--max-drill", dest="max_drill", type=int, default=16,
+                        help="mismatching partitions to compare row by row (default 16)")
+    verify.add_argument("--workers", type=int, help="processes hashing the CSV (default: all cores)")
+    verify.add_argument("--report", help="also write the report as JSON here")
+    verify.set_defaults(run=verify_command)
+
+    alter = commands.add_parser("alter", help="plan and apply column type changes to a table")
+    alter.add_argument("--table", default="Cases")
+    alter.add_argument("--statements", default="alter_statements.txt",
+                       help="file of ALTER COLUMN statements giving the target types")
+    alter.add_argument("--from-profile", dest="profile_csv",
+                       help="take the target types from this CSV's profile instead")
+    alter.add_argument("--all-columns", dest="only_max", action="store_false",
+                       help="change every differing column, not only (N)VARCHAR(MAX) ones")
+    alter.add_argument("--strategy", choices=["alter", "rebuild"],
+                       help="prefer this strategy over the planner's choice; a table whose indexes, keys, "
+                            "triggers or identity column a copy would lose is always altered")
+    alter.add_argument("--rebuild-min-passes", dest="rebuild_min_passes", type=int, default=3,
+                       help="rewriting ALTERs from which a single rebuild is cheaper (default 3)")
+    alter.add_argument("--dry-run", action="store_true", help="print the plan and the statements, change nothing")
+    alter.add_argument("--yes", action="store_true", help="do not ask before executing")
+    alter.set_defaults(run=alter_command)
+
+    clean = commands.add_parser("clean", help="trim, normalise and dedupe CSV files into another directory")
+    clean.add_argument("inputs", nargs="*", help="CSV files, directories or glob patterns (default: here)")
+    clean.add_argument("--output-dir", dest="output_dir", default="cleaned")
+    clean.add_argument("--chunk-size", dest="chunk_size", type=int, default=50000)
+    clean.add_argument("--key", help="drop rows repeating an earlier value of this column")
+    clean.add_argument("--keep-empty-columns", dest="keep_empty_columns", action="store_true")
+    clean.add_argument("--all-columns", dest="all_columns", action="store_true",
+                       help="ignore the [TABLE:...] column mappings and keep every column")
+    clean.add_argument("--read-workers", dest="read_workers", type=int, default=1,
+                       help="processes parsing each file (default 1)")
+    clean.add_argument("--jobs", type=int, default=1, help="files cleaned at the same time (default 1)")
+    clean.set_defaults(run=clean_command)
+
+    rename = commands.add_parser("rename", help='shorten "name anything else.csv" to "name.csv"')
+    rename.add_argument("directory", nargs="?", default=".")
+    rename.add_argument("--dry-run", action="store_true", help="print the renames, change nothing")
+    rename.set_defaults(run=rename_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return asyncio.run(args.run(args, read_config(args.config)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
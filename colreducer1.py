@@ -1,40 +1,37 @@
-import pandas as pd
-from collections import defaultdict
+import configparser
 import os
 
-def analyze_csv(filename, primary_column_name, chunksize=50000):
-    # Initialize a dictionary to store the max length for each column
-    column_max_lengths = defaultdict(int)
+from csvprofile import get_profile
+from projection import projection_for, read_projections
+from typeinfer import choose_type, is_string_type
 
-    # Read CSV in chunks
-    chunk_iter = pd.read_csv(filename, chunksize=chunksize, low_memory=False)
-    for chunk in chunk_iter:
-        for column in chunk.columns:
-            # Skip NaN values and find the max length for this chunk
-            max_length = chunk[column].dropna().astype(str).apply(len).max()
-
-            # Update global max length
-            if max_length > column_max_lengths[column]:
-                column_max_lengths[column] = max_length
+def analyze_csv(filename, primary_column_name, chunksize=50000, workers=None, threshold=1.0, projection=None):
+    # Widths and type counters come from the shared profile, scanned once
+    # (chunks spread over `workers` processes, all cores by default) and cached
+    profile = get_profile(filename, chunksize, workers=workers)
+    columns = profile["columns"]
+    if projection is not None and projection["columns"]:
+        # Only the columns the table takes, under their table names
+        by_name = {column["name"]: column for column in columns}
+        missing = [source for source, _ in projection["columns"] if source not in by_name]
+        if missing:
+            raise ValueError(f"Mapped columns {', '.join(missing)} are not in {filename}")
+        columns = [dict(by_name[source], name=target) for source, target in projection["columns"]]
 
     # Sort columns by length in descending order
-    sorted_columns = sorted(column_max_lengths.items(), key=lambda x: x[1], reverse=True)
+    sorted_columns = sorted(columns, key=lambda x: x["max_length"], reverse=True)
 
     # Generate CREATE TABLE statements
     create_statements = []
-    for column, max_length in sorted_columns:
-        # Adding a buffer for future data
-        suggested_length = int(max_length + 10)
+    for column in sorted_columns:
+        sql_type, _ = choose_type(column["type_stats"], threshold)
 
-        # Handle column length conditions
-        if column == primary_column_name:
-            create_statements.insert(0, f"[{column}] VARCHAR(255) PRIMARY KEY")
-        elif max_length == 18:
-            create_statements.append(f"[{column}] VARCHAR({max_length})")
-        elif suggested_length > 6000:
-            create_statements.append(f"[{column}] VARCHAR(MAX)")
+        if column["name"] == primary_column_name:
+            if is_string_type(sql_type):
+                sql_type = "VARCHAR(255)"
+            create_statements.insert(0, f"[{column['name']}] {sql_type} PRIMARY KEY")
         else:
-            create_statements.append(f"[{column}] VARCHAR({suggested_length})")
+            create_statements.append(f"[{column['name']}] {sql_type}")
 
     # Concatenate the CREATE TABLE statements
     create_table_statement = "CREATE TABLE Cases (\n" + ",\n".join(create_statements) + "\n);"
@@ -44,7 +41,10 @@ def analyze_csv(filename, primary_column_name, chunksize=50000):
 if __name__ == "__main__":
     filename = "case.csv"
     primary_column_name = input("Enter the name of the primary column (e.g., 'Case ID'): ")
-    create_table_statement = analyze_csv(filename, primary_column_name)
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    create_table_statement = analyze_csv(filename, primary_column_name,
+                                         projection=projection_for("Cases", read_projections(config)))
 
     # Print to console
     print("\nGenerated CREATE TABLE statement:")
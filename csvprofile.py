@@ -0,0 +1,215 @@
+import json
+import mmap
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from csvreader import (iter_record_blocks, parse_block, parse_block_arrow, read_chunks, read_header, read_range,
+                       record_ranges)
+from sources import input_stat, is_compressed, sidecar_base
+from typeinfer import choose_type, empty_stats, merge, observe, observe_arrow, observe_chunk, reservoir_sample
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# One streaming pass over a CSV that collects everything the other tools used
+# to rescan the file for: row count, per-column max length, null counts and
+# the type inference counters from typeinfer. The result is cached next to
+# the CSV and reused for as long as the file's path, size and mtime are
+# unchanged.
+
+
+def profile_path(csv_file):
+    return sidecar_base(csv_file) + ".profile.json"
+
+
+def file_key(csv_file):
+    stat = input_stat(csv_file)
+    return {"path": os.path.abspath(csv_file), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def count_records(csv_file, block_size=64 << 20):
+    # Count newlines outside quoted fields without parsing. Splitting a block
+    # on '"' leaves the quoted and unquoted parts alternating, so only every
+    # other part is searched for newlines.
+    with open(csv_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            newlines = 0
+            in_quotes = False
+            last_byte = b""
+            for offset in range(0, len(mm), block_size):
+                block = mm[offset:offset + block_size]
+                parts = block.split(b'"')
+                first_outside = 1 if in_quotes else 0
+                newlines += sum(part.count(b"\n") for part in parts[first_outside::2])
+                if len(parts) % 2 == 0:
+                    in_quotes = not in_quotes
+                last_byte = block[-1:]
+    if last_byte != b"\n":
+        newlines += 1
+    return max(newlines - 1, 0)  # header line
+
+
+def chunk_stats(header, block, encoding='utf-8'):
+    columns = {}
+    if pa is not None:
+        # Every column stays an Arrow string array: lengths come off the
+        # offsets buffer and null counts from the array metadata
+        table = parse_block_arrow(header, block, encoding)
+        rows = table.num_rows
+        for name, column in zip(table.column_names, table.columns):
+            type_stats = observe_arrow(column)
+            columns[name] = {"max_length": type_stats["max_length"], "nulls": column.null_count,
+                             "type_stats": type_stats}
+    else:
+        # dtype=str keeps the raw text, so lengths are what the DDL needs to hold
+        chunk = parse_block(header, block, encoding, dtype=str)
+        rows = len(chunk)
+        nulls = chunk.isna().sum()
+        for name in chunk.columns:
+            type_stats = observe(chunk[name].dropna())
+            columns[name] = {"max_length": type_stats["max_length"], "nulls": int(nulls[name]),
+                             "type_stats": type_stats}
+    return {"rows": rows, "columns": columns}
+
+
+def range_stats(csv_file, header, start, end, encoding='utf-8'):
+    # Worker side of scan_csv: read the byte range here rather than ship it
+    return chunk_stats(header, read_range(csv_file, start, end), encoding)
+
+
+def stats_tasks(csv_file, chunksize=50000, encoding='utf-8'):
+    # -> (function, args) computing the stats of each chunk of the file.
+    # Plain files are split into byte ranges the workers read themselves;
+    # compressed ones are decompressed here and the blocks sent over.
+    if is_compressed(csv_file):
+        for _, header, block in iter_record_blocks(csv_file, chunksize):
+            yield chunk_stats, (header, block, encoding)
+        return
+    header, _ = read_header(csv_file)
+    for start, end, _, _ in record_ranges(csv_file, chunksize):
+        yield range_stats, (csv_file, header, start, end, encoding)
+
+
+def merge_chunk_stats(profile, stats):
+    profile["rows"] += stats["rows"]
+    for name, chunk_column in stats["columns"].items():
+        column = profile["columns"].setdefault(name, {"name": name, "max_length": 0, "nulls": 0,
+                                                      "type_stats": empty_stats()})
+        column["max_length"] = max(column["max_length"], chunk_column["max_length"])
+        column["nulls"] += chunk_column["nulls"]
+        column["type_stats"] = merge(column["type_stats"], chunk_column["type_stats"])
+
+
+def scan_csv(csv_file, chunksize=50000, encoding='utf-8', workers=None):
+    workers = workers or os.cpu_count() or 1
+    profile = {"rows": 0, "columns": {}}
+    tasks = stats_tasks(csv_file, chunksize, encoding)
+
+    if workers == 1:
+        for task, task_args in tasks:
+            merge_chunk_stats(profile, task(*task_args))
+    else:
+        # A couple of chunks per worker in flight keeps memory bounded, and
+        # the stats merge in any order
+        with ProcessPoolExecutor(workers) as executor:
+            in_flight = set()
+            for task, task_args in tasks:
+                in_flight.add(executor.submit(task, *task_args))
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge_chunk_stats(profile, future.result())
+            for future in in_flight:
+                merge_chunk_stats(profile, future.result())
+
+    return finish_profile(profile)
+
+
+def finish_profile(profile):
+    for column in profile["columns"].values():
+        column["type"], column["confidence"] = choose_type(column["type_stats"])
+    profile["columns"] = list(profile["columns"].values())
+    return profile
+
+
+def save_profile(csv_file, profile):
+    profile["key"] = file_key(csv_file)
+    with open(profile_path(csv_file), 'w') as f:
+        json.dump(profile, f, indent=2)
+    return profile
+
+
+def profile_files(csv_files, chunksize=50000, workers=None, refresh=False):
+    # Several CSVs through one process pool: the ranges of every file that
+    # has no cached profile are in flight together, so a batch of small
+    # files keeps all cores busy too. -> {csv_file: profile}
+    profiles = {}
+    pending = {}
+    for csv_file in csv_files:
+        cached = None if refresh else load_cached_profile(csv_file)
+        if cached is not None:
+            profiles[csv_file] = cached
+        else:
+            pending[csv_file] = {"rows": 0, "columns": {}}
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as executor:
+            in_flight = {}
+            for csv_file in pending:
+                for task, task_args in stats_tasks(csv_file, chunksize):
+                    in_flight[executor.submit(task, *task_args)] = csv_file
+                    if len(in_flight) >= workers * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            merge_chunk_stats(pending[in_flight.pop(future)], future.result())
+            for future, csv_file in in_flight.items():
+                merge_chunk_stats(pending[csv_file], future.result())
+        for csv_file, profile in pending.items():
+            profiles[csv_file] = save_profile(csv_file, finish_profile(profile))
+    return {csv_file: profiles[csv_file] for csv_file in csv_files}
+
+
+def load_cached_profile(csv_file):
+    path = profile_path(csv_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        cached = json.load(f)
+    if cached.get("key") != file_key(csv_file):
+        return None
+    return cached
+
+
+def get_profile(csv_file, chunksize=50000, refresh=False, workers=None):
+    if not refresh:
+        cached = load_cached_profile(csv_file)
+        if cached is not None:
+            return cached
+    return save_profile(csv_file, scan_csv(csv_file, chunksize, workers=workers))
+
+
+def row_count(csv_file):
+    # Progress bars only need a total: use the profile if one is cached,
+    # otherwise the byte-level count, which never parses a field. None for a
+    # compressed input, whose progress goes by compressed bytes instead.
+    cached = load_cached_profile(csv_file)
+    if cached is not None:
+        return cached["rows"]
+    if is_compressed(csv_file):
+        return None
+    return count_records(csv_file)
+
+
+def column_types(csv_file, sample_size=None, threshold=1.0, chunksize=50000):
+    # Full-file inference comes from the cached profile; with sample_size
+    # only a reservoir sample of the rows is inspected instead
+    if sample_size is None:
+        stats = {column["name"]: column["type_stats"] for column in get_profile(csv_file, chunksize)["columns"]}
+    else:
+        chunks = (chunk for _, chunk in read_chunks(csv_file, chunksize, dtype=str))
+        stats = observe_chunk(reservoir_sample(chunks, sample_size))
+    return {name: choose_type(column_stats, threshold)[0] for name, column_stats in stats.items()}
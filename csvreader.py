@@ -0,0 +1,241 @@
+import csv
+import io
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from projection import project, read_args
+from sources import compressed_offset, is_compressed, open_input, skip_to
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Record-aligned CSV chunking. Each chunk knows the byte range it came from,
+# so a load can record how far it got and a later run can seek straight past
+# the committed prefix instead of parsing it again. Quoted fields may contain
+# newlines: a record only ends on a newline once its quotes are balanced.
+# chunk_size may also be a callable (see autotune.ChunkTuner), asked again
+# before every chunk so the size can change while the file is read.
+#
+# With workers > 1 the file is memory-mapped and cut into byte ranges that
+# end on a record boundary (found by quote parity, so newlines inside quoted
+# fields never split a record); worker processes read and parse the ranges
+# and the chunks come back in file order, which checkpoints rely on. The
+# ranges are sized from the average row width, so those chunks hold about
+# chunk_size rows rather than exactly.
+# On Windows the worker processes re-import the calling script, which then
+# needs an `if __name__ == '__main__':` guard.
+#
+# Compressed inputs and zip members (see sources.py) are read as a stream;
+# with workers > 1 the blocks are cut while decompressing and only the
+# parsing happens in the pool.
+
+
+def read_record(f):
+    line = f.readline()
+    if not line:
+        return b"", 0
+    lines = 1
+    quotes = line.count(b'"')
+    while quotes % 2:
+        more = f.readline()
+        if not more:
+            break
+        line += more
+        lines += 1
+        quotes += more.count(b'"')
+    return line, lines
+
+
+def read_header(path):
+    with open_input(path) as f:
+        header, _ = read_record(f)
+        return header, f.tell()
+
+
+def iter_record_blocks(path, chunk_size, start_offset=None, start_index=0, start_line=None, record_starts=False):
+    # record_starts adds each record's byte offset to the position
+    with open_input(path) as f:
+        header, header_lines = read_record(f)
+        if not header:
+            return
+        line_number = header_lines + 1
+        if start_offset:
+            skip_to(f, start_offset)
+            line_number = start_line or line_number
+        index = start_index
+        while True:
+            start = f.tell()
+            first_line = line_number
+            records = []
+            # Per-record start lines, only kept once a record spans lines
+            line_starts = None
+            size = chunk_size() if callable(chunk_size) else chunk_size
+            while len(records) < size:
+                record, lines = read_record(f)
+                if not record:
+                    break
+                if lines > 1 and line_starts is None:
+                    line_starts = list(range(first_line, line_number))
+                if line_starts is not None:
+                    line_starts.append(line_number)
+                records.append(record)
+                line_number += lines
+            if not records:
+                return
+            if record_starts:
+                offsets = [start]
+                for record in records[:-1]:
+                    offsets.append(offsets[-1] + len(record))
+            if not records[-1].endswith(b"\n"):
+                records[-1] += b"\n"
+            position = {"index": index, "start": start, "end": f.tell(), "first_line": first_line,
+                        "next_line": line_number, "records": len(records), "line_starts": line_starts}
+            if compressed_offset(f) is not None:
+                position["compressed_end"] = compressed_offset(f)
+            if record_starts:
+                position["record_starts"] = offsets
+            yield position, header, b"".join(records)
+            index += 1
+
+
+def parse_block(header, block, encoding='utf-8', **read_csv_kwargs):
+    read_csv_kwargs.setdefault('low_memory', False)
+    return pd.read_csv(io.BytesIO(header + block), encoding=encoding, **read_csv_kwargs)
+
+
+def parse_block_arrow(header, block, encoding='utf-8'):
+    # Every column as an Arrow string array, nulls where pandas would see NaN
+    names = next(csv.reader(io.StringIO(header.decode(encoding).lstrip('\ufeff'))))
+    return pa_csv.read_csv(
+        pa.BufferReader(block),
+        read_options=pa_csv.ReadOptions(column_names=names, encoding=encoding, use_threads=False),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                             strings_can_be_null=True))
+
+
+def record_ranges(path, chunk_size, start_offset=None, start_line=None, sample_bytes=1 << 20):
+    # -> (start, end, first_line, lines) for consecutive ranges of whole
+    # records of about chunk_size rows each
+    with open(path, 'rb') as f:
+        header, header_lines = read_record(f)
+        data_start = start_offset or f.tell()
+        line_number = (start_line or header_lines + 1) if start_offset else header_lines + 1
+        size = os.fstat(f.fileno()).st_size
+        if not header or data_start >= size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sample = mm[data_start:data_start + sample_bytes]
+            row_bytes = len(sample) / max(sample.count(b"\n"), 1)
+            start = data_start
+            while start < size:
+                rows = chunk_size() if callable(chunk_size) else chunk_size
+                end = min(start + max(int(rows * row_bytes), 1), size)
+                segment = mm[start:end]
+                # start is a record boundary, so an odd quote count means
+                # the cut fell inside a quoted field
+                in_quotes = segment.count(b'"') % 2 == 1
+                lines = segment.count(b"\n")
+                while end < size and (in_quotes or mm[end - 1] != ord("\n")):
+                    newline = mm.find(b"\n", end)
+                    next_end = size if newline == -1 else newline + 1
+                    extra = mm[end:next_end]
+                    in_quotes ^= extra.count(b'"') % 2 == 1
+                    lines += extra.count(b"\n")
+                    end = next_end
+                yield start, end, line_number, lines
+                line_number += lines
+                start = end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        block = f.read(end - start)
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    return block
+
+
+def parse_range(path, header, index, start, end, first_line, lines, encoding='utf-8', read_csv_kwargs=None):
+    # Runs in a worker process: only the offsets cross the process boundary
+    # on the way in, the parsed chunk on the way out
+    block = read_range(path, start, end)
+    chunk = parse_block(header, block, encoding, **(read_csv_kwargs or {}))
+    line_starts = None
+    if lines != len(chunk):
+        # Some record spans lines; number them the way iter_record_blocks does
+        line_starts = []
+        f = io.BytesIO(block)
+        line_number = first_line
+        while True:
+            record, record_lines = read_record(f)
+            if not record:
+                break
+            line_starts.append(line_number)
+            line_number += record_lines
+    position = {"index": index, "start": start, "end": end, "first_line": first_line,
+                "next_line": first_line + lines, "records": len(chunk), "line_starts": line_starts}
+    return position, chunk
+
+
+def parse_record_block(position, header, block, encoding='utf-8', read_csv_kwargs=None):
+    # Worker side for compressed inputs, which have no byte ranges to hand out
+    return position, parse_block(header, block, encoding, **(read_csv_kwargs or {}))
+
+
+def read_chunks_parallel(path, chunk_size=50000, workers=None, start_offset=None, start_index=0, start_line=None,
+                         encoding='utf-8', **read_csv_kwargs):
+    workers = workers or os.cpu_count() or 1
+    if is_compressed(path):
+        tasks = ((parse_record_block, (position, header, block, encoding, read_csv_kwargs))
+                 for position, header, block in iter_record_blocks(path, chunk_size, start_offset, start_index,
+                                                                   start_line))
+    else:
+        header, _ = read_header(path)
+        tasks = ((parse_range, (path, header, index, start, end, first_line, lines, encoding, read_csv_kwargs))
+                 for index, (start, end, first_line, lines)
+                 in enumerate(record_ranges(path, chunk_size, start_offset, start_line), start_index))
+    executor = ProcessPoolExecutor(workers)
+    try:
+        # A couple of ranges per worker in flight keeps memory bounded
+        in_flight = deque()
+        for task, task_args in tasks:
+            in_flight.append(executor.submit(task, *task_args))
+            while len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def read_chunks(path, chunk_size=50000, start_offset=None, start_index=0, start_line=None,
+                encoding='utf-8', cache=None, workers=1, projection=None, **read_csv_kwargs):
+    # projection (projection.make_projection) limits the parse to the
+    # columns it needs and maps, transforms and filters every chunk
+    if projection is not None:
+        for position, chunk in read_chunks(path, chunk_size, start_offset, start_index, start_line, encoding, cache,
+                                           workers, **read_args(projection, read_csv_kwargs)):
+            yield project(position, chunk, projection)
+        return
+    # A stagecache.StagingCache serves text reads from its columnar copy
+    if cache is not None and read_csv_kwargs.get('dtype') is str:
+        chunks = cache.read_chunks(path, chunk_size, start_offset, start_index, encoding,
+                                   read_csv_kwargs.get('usecols'))
+        if chunks is not None:
+            yield from chunks
+            return
+    if workers != 1:
+        yield from read_chunks_parallel(path, chunk_size, workers, start_offset, start_index, start_line,
+                                        encoding, **read_csv_kwargs)
+        return
+    for position, header, block in iter_record_blocks(path, chunk_size, start_offset, start_index, start_line):
+        yield position, parse_block(header, block, encoding, **read_csv_kwargs)
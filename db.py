@@ -0,0 +1,265 @@
+import configparser
+import re
+import sqlite3
+import threading
+import time
+
+# Shared database access for the scripts. open_database() reads config.ini
+# once and returns a Database: a thread-safe connection pool plus cached
+# metadata lookups (table list, column definitions). Connections handed out
+# by the pool look like driver connections, and close() gives them back
+# instead of closing them, so code written for `connect()` (pipeline,
+# writers, deltaload) reuses them across files and worker threads.
+#
+# The backend is pluggable: [DATABASE] Backend = pyodbc (SQL Server, the
+# default) or sqlite for local runs, tests and benchmarks. Anything else
+# can be added with register_backend().
+#
+# The ODBC driver is [DATABASE] Driver when set. Otherwise each script keeps
+# the one it always used: the loaders ODBC Driver 17 (fast_executemany),
+# alterCol the old "SQL Server" driver, and the rest [SQL_SERVER] Driver,
+# like insertTables did.
+
+LOADER_DRIVER = '{ODBC Driver 17 for SQL Server}'
+
+
+def connection_string(section, driver=None):
+    driver = driver or section.get('Driver', LOADER_DRIVER)
+    if not driver.startswith('{'):
+        driver = '{' + driver + '}'
+    return (f"DRIVER={driver};SERVER={section['Server']};DATABASE={section['Database']};"
+            f"UID={section['Username']};PWD={section['Password']}")
+
+
+class PyodbcBackend:
+    name = "pyodbc"
+
+    def __init__(self, conn_str):
+        self.conn_str = conn_str
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.conn_str)
+
+    def list_tables(self, cursor):
+        cursor.execute("SELECT table_name = t.name FROM sys.tables t "
+                       "INNER JOIN sys.schemas s ON t.schema_id = s.schema_id;")
+        return [row[0] for row in cursor.fetchall()]
+
+    def list_columns(self, cursor, table_name):
+        # (COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, IS_NULLABLE)
+        cursor.execute("SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, IS_NULLABLE "
+                       "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION",
+                       table_name)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def list_tables(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+        return [row[0] for row in cursor.fetchall()]
+
+    def list_columns(self, cursor, table_name):
+        # Same shape as INFORMATION_SCHEMA: VARCHAR(20) -> ("varchar", 20)
+        cursor.execute(f"PRAGMA table_info([{table_name}])")
+        columns = []
+        for _, name, declared, not_null, _, _ in cursor.fetchall():
+            match = re.match(r"\s*(\w*)\s*(?:\(\s*(\d+))?", declared or "")
+            data_type = (match.group(1) or "varchar").lower()
+            max_length = int(match.group(2)) if match.group(2) else None
+            columns.append((name, data_type, max_length, "NO" if not_null else "YES"))
+        return columns
+
+
+_BACKENDS = {
+    "pyodbc": lambda config, driver: PyodbcBackend(connection_string(config['SQL_SERVER'], driver)),
+    "sqlite": lambda config, driver: SqliteBackend(config.get('DATABASE', 'SqlitePath', fallback='local.db')),
+}
+
+
+def register_backend(name, factory):
+    # factory(config, driver) -> an object with connect(), list_tables(cursor)
+    # and list_columns(cursor, table_name); driver is the ODBC driver to use,
+    # None for the configured one
+    _BACKENDS[name] = factory
+
+
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=8, check_after=30.0, health_check="SELECT 1"):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.check_after = check_after
+        self.health_check = health_check
+        self.condition = threading.Condition()
+        self.idle = []  # (connection, time it was returned)
+        self.in_use = 0
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+        for _ in range(min_size):
+            self.idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        conn = self._connect()
+        self.stats["opened"] += 1
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                while self.idle:
+                    conn, returned = self.idle.pop()
+                    # Connections that sat idle a while may have been dropped
+                    if time.monotonic() - returned > self.check_after and not self._healthy(conn):
+                        self._discard(conn)
+                        continue
+                    self.in_use += 1
+                    self.stats["reused"] += 1
+                    return conn
+                if self.in_use < self.max_size:
+                    self.in_use += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No database connection free after {timeout}s "
+                                       f"(pool max_size={self.max_size})")
+                self.condition.wait(remaining)
+        try:
+            return self._open()
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, conn):
+        # Whatever the borrower left open is rolled back; a connection that
+        # cannot even do that is dead and is not reused
+        try:
+            conn.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+        with self.condition:
+            self.in_use -= 1
+            if healthy:
+                self.idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self.condition.notify()
+
+    def connect(self):
+        # Drop-in for a driver's connect(): close() returns it to the pool
+        return PooledConnection(self, self.acquire())
+
+    def close_all(self):
+        with self.condition:
+            for conn, _ in self.idle:
+                conn.close()
+            self.idle.clear()
+
+
+class Database:
+    def __init__(self, backend, min_size=1, max_size=8):
+        self.backend = backend
+        self.pool = ConnectionPool(backend.connect, min_size, max_size)
+        self.lock = threading.Lock()
+        self._tables = None
+        self._columns = {}
+
+    def connect(self):
+        return self.pool.connect()
+
+    def tables(self, refresh=False):
+        with self.lock:
+            if self._tables is None or refresh:
+                conn = self.connect()
+                try:
+                    self._tables = self.backend.list_tables(conn.cursor())
+                finally:
+                    conn.close()
+            return list(self._tables)
+
+    def columns(self, table_name, refresh=False):
+        # [(name, data_type, max_length, is_nullable)] in table order
+        with self.lock:
+            if table_name not in self._columns or refresh:
+                conn = self.connect()
+                try:
+                    self._columns[table_name] = self.backend.list_columns(conn.cursor(), table_name)
+                finally:
+                    conn.close()
+            return list(self._columns[table_name])
+
+    def invalidate(self, table_name=None):
+        # After DDL: forget the table list and the altered table's columns
+        with self.lock:
+            self._tables = None
+            if table_name is None:
+                self._columns.clear()
+            else:
+                self._columns.pop(table_name, None)
+
+    def close(self):
+        self.pool.close_all()
+
+
+def open_database(config=None, backend=None, min_size=None, max_size=None, driver=None):
+    # driver: the calling script's default ODBC driver, [DATABASE] Driver wins
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+    section = config['DATABASE'] if config.has_section('DATABASE') else {}
+    name = backend or section.get('Backend', 'pyodbc')
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown database backend {name!r}, expected one of {', '.join(sorted(_BACKENDS))}")
+    return Database(_BACKENDS[name](config, section.get('Driver') or driver),
+                    int(section.get('PoolMinSize', 1)) if min_size is None else min_size,
+                    int(section.get('PoolMaxSize', 8)) if max_size is None else max_size)
@@ -0,0 +1,117 @@
+import fnmatch
+
+from typeinfer import choose_type
+
+# CREATE TABLE statements from full-file CSV profiles. Keys, identity columns
+# and indexes come from rules in config.ini instead of code, one section per
+# table name or fnmatch pattern (exact names are tried first, then patterns
+# in file order):
+#
+#   [TABLE:contact]
+#   Identity = Id          ; added as INT IDENTITY(1, 1) unless the CSV has it
+#   PrimaryKey = Id        ; comma separated; defaults to an added identity
+#   Index = clustered      ; none, clustered or columnstore
+#   ClusterOn = CreatedDate
+#
+# Index = clustered clusters the table on ClusterOn (the primary key when
+# unset); columnstore makes it a clustered columnstore. Either way a primary
+# key that is not the clustering key is created NONCLUSTERED.
+#
+# The same sections can also map, transform and filter the CSV's columns;
+# projection.py reads those keys.
+
+INDEX_CHOICES = ("none", "clustered", "columnstore")
+DEFAULT_RULE = {"identity": None, "primary_key": [], "index": "none", "cluster_on": []}
+
+
+def split_columns(value):
+    return [name.strip() for name in value.split(",") if name.strip()] if value else []
+
+
+def read_table_rules(config):
+    rules = []
+    for section in config.sections():
+        if not section.upper().startswith("TABLE:"):
+            continue
+        values = config[section]
+        index = values.get("Index", "none").strip().lower()
+        if index not in INDEX_CHOICES:
+            raise ValueError(f"[{section}] Index must be one of {', '.join(INDEX_CHOICES)}, not {index!r}")
+        rules.append((section.split(":", 1)[1].strip(),
+                      {"identity": values.get("Identity", "").strip() or None,
+                       "primary_key": split_columns(values.get("PrimaryKey")),
+                       "index": index, "cluster_on": split_columns(values.get("ClusterOn"))}))
+    return rules
+
+
+def rule_for(table_name, rules, default=DEFAULT_RULE):
+    # SQL Server table names are case-insensitive, so are the rules
+    name = table_name.lower()
+    for pattern, rule in rules:
+        if pattern.lower() == name:
+            return rule
+    for pattern, rule in rules:
+        if fnmatch.fnmatch(name, pattern.lower()):
+            return rule
+    return default
+
+
+def profile_types(profile, threshold=1.0):
+    # -> {column: sql type} in CSV column order
+    return {column["name"]: choose_type(column["type_stats"], threshold)[0] for column in profile["columns"]}
+
+
+def table_statements(table_name, column_types, rule=DEFAULT_RULE, schema="dbo"):
+    table = f"{schema}.{table_name}"
+    identity = rule["identity"]
+    added_identity = identity is not None and identity not in column_types
+    key = rule["primary_key"] or ([identity] if added_identity else [])
+    types = ({identity: "INT"} if added_identity else {})
+    types.update(column_types)
+
+    for name in key:
+        if name not in types:
+            raise ValueError(f"Primary key column {name} of {table_name} is not in the CSV")
+        if types[name].upper().endswith("(MAX)"):
+            raise ValueError(f"Primary key column {name} of {table_name} is {types[name]}, which cannot be a key")
+    cluster_on = rule["cluster_on"] or key
+    if rule["index"] == "clustered" and not cluster_on:
+        raise ValueError(f"Index = clustered for {table_name} needs ClusterOn or a primary key")
+
+    definitions = []
+    for name, sql_type in types.items():
+        definition = f"[{name}] {sql_type}"
+        if name == identity and added_identity:
+            definition += " IDENTITY(1, 1)"
+        if name in key:
+            definition += " NOT NULL"
+        definitions.append(definition)
+    if key:
+        clustered = rule["index"] == "none" or (rule["index"] == "clustered" and cluster_on == key)
+        definitions.append(f"CONSTRAINT [PK_{table_name}] PRIMARY KEY {'CLUSTERED' if clustered else 'NONCLUSTERED'} "
+                           f"({', '.join(f'[{name}]' for name in key)})")
+
+    statements = [f"CREATE TABLE {table} ({', '.join(definitions)});"]
+    if rule["index"] == "clustered" and cluster_on != key:
+        statements.append(f"CREATE CLUSTERED INDEX [CIX_{table_name}] ON {table} "
+                          f"({', '.join(f'[{name}]' for name in cluster_on)});")
+    elif rule["index"] == "columnstore":
+        statements.append(f"CREATE CLUSTERED COLUMNSTORE INDEX [CCI_{table_name}] ON {table};")
+    return statements
+
+
+def create_tables(connection, plans):
+    # plans: [(table_name, statements)]. One session, one transaction: either
+    # every table is created or none is.
+    cursor = connection.cursor()
+    try:
+        for table_name, statements in plans:
+            for statement in statements:
+                cursor.execute(statement)
+            print(f"Table {table_name} created.")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
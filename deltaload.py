@@ -0,0 +1,211 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from badrows import invalid_rows, row_lines
+from csvreader import read_chunks
+from params import build_batch, column_values
+from pipeline import build_insert_sql, open_writer
+from sources import sidecar_base
+
+# Delta loads for a table that is refreshed from a new export of the same
+# CSV. A compact index from the previous load keeps, for every key, a 64-bit
+# hash of the key and a 64-bit hash of the whole row (plus the key text, for
+# deletes). The new file is streamed once and only rows whose key is new or
+# whose row hash changed are sent to a staging table, which one MERGE
+# applies; keys missing from the new file are deleted. The index is only
+# replaced after the transaction commits.
+
+STAGE_TABLE = "#delta_stage"
+DELETED_TABLE = "#delta_deleted"
+
+
+def index_path(csv_file, table_name):
+    return f"{sidecar_base(csv_file)}.{table_name}.delta.npz"
+
+
+def load_index(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        return {"key_hashes": saved["key_hashes"], "row_hashes": saved["row_hashes"], "keys": saved["keys"]}
+
+
+def save_index(path, key_hashes, row_hashes, keys):
+    # Sorted by key hash so lookups are a binary search
+    order = np.argsort(key_hashes, kind="stable")
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, key_hashes=key_hashes[order], row_hashes=row_hashes[order], keys=keys[order])
+    os.replace(tmp_path, path)
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def key_text(chunk, key):
+    return np.char.encode(chunk[key].fillna("").to_numpy(dtype=str), "utf-8")
+
+
+def hash_chunk(chunk, key):
+    key_hashes = pd.util.hash_pandas_object(chunk[key], index=False).to_numpy()
+    row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    return key_hashes, row_hashes
+
+
+def classify(key_hashes, row_hashes, index):
+    # -> (new, changed) boolean masks against the previous load
+    if index is None or not len(index["key_hashes"]):
+        return np.ones(len(key_hashes), dtype=bool), np.zeros(len(key_hashes), dtype=bool)
+    old_keys = index["key_hashes"]
+    found = np.searchsorted(old_keys, key_hashes)
+    found = np.minimum(found, len(old_keys) - 1)
+    known = old_keys[found] == key_hashes
+    changed = known & (index["row_hashes"][found] != row_hashes)
+    return ~known, changed
+
+
+def stage_sql(stage_table, table_name, select_list):
+    # An empty copy of the table's columns. SELECT INTO copies an IDENTITY
+    # property along with the column, and the stage inserts explicit key
+    # values; over a UNION it creates plain columns instead.
+    return (f"SELECT TOP 0 {select_list} INTO {stage_table} FROM {table_name} "
+            f"UNION ALL SELECT TOP 0 {select_list} FROM {table_name};")
+
+
+def identity_columns(cursor, table_name):
+    cursor.execute("SELECT name FROM sys.identity_columns WHERE object_id = OBJECT_ID(?)", table_name)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def merge_sql(table_name, columns, key, identity=()):
+    # An identity column can be inserted (under IDENTITY_INSERT) but never updated
+    column_list = ", ".join(f"[{col}]" for col in columns)
+    updates = ", ".join(f"t.[{col}] = s.[{col}]" for col in columns if col != key and col not in identity)
+    source_values = ", ".join(f"s.[{col}]" for col in columns)
+    matched = f"WHEN MATCHED THEN UPDATE SET {updates} " if updates else ""
+    return (f"MERGE {table_name} AS t USING {STAGE_TABLE} AS s ON t.[{key}] = s.[{key}] "
+            f"{matched}WHEN NOT MATCHED BY TARGET THEN INSERT ({column_list}) VALUES ({source_values});")
+
+
+def delete_sql(table_name, key):
+    return f"DELETE t FROM {table_name} AS t INNER JOIN {DELETED_TABLE} AS d ON t.[{key}] = d.[{key}];"
+
+
+def delta_load(csv_file, table_name, connect, key, column_types=None, chunk_size=50000, dry_run=False,
+               cache=None, on_progress=None, projection=None):
+    start_time = time.perf_counter()
+    path = index_path(csv_file, table_name)
+    index = load_index(path)
+    if index is None:
+        print(f"[INFO] No delta index for {table_name} yet, every row is merged this time.")
+    stats = {"rows": 0, "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "dry_run": dry_run}
+    key_hashes, row_hashes, keys = [], [], []
+    conn = cursor = None
+    columns = None
+    identity = []
+
+    try:
+        if not dry_run:
+            conn, cursor = open_writer(connect)
+            identity = identity_columns(cursor, table_name)
+            cursor.execute(stage_sql(STAGE_TABLE, table_name, "*"))
+            cursor.execute(stage_sql(DELETED_TABLE, table_name, f"[{key}]"))
+
+        for position, chunk in read_chunks(csv_file, chunk_size, cache=cache, projection=projection, dtype=str):
+            if key not in chunk.columns:
+                raise ValueError(f"Key column {key} is not in {csv_file}")
+            columns = list(chunk.columns)
+            chunk_keys, chunk_rows = hash_chunk(chunk, key)
+            new, changed = classify(chunk_keys, chunk_rows, index)
+            stats["rows"] += len(chunk)
+            stats["inserted"] += int(new.sum())
+            stats["updated"] += int(changed.sum())
+            delta = chunk[new | changed]
+            if column_types:
+                # One transaction for the whole file: a value that would go
+                # in as NULL stops the load instead
+                reasons = invalid_rows(delta, None, column_types)
+                if reasons:
+                    lines = row_lines(position, len(chunk))
+                    first = min(reasons)
+                    line = lines[np.flatnonzero(new | changed)[first]] if lines is not None else None
+                    raise ValueError(f"{len(reasons)} rows of {csv_file} do not convert to the types of {table_name}, "
+                                     f"first at line {line}: {reasons[first]}")
+            if len(delta) and not dry_run:
+                cursor.executemany(build_insert_sql(STAGE_TABLE, columns), build_batch(delta, column_types))
+            key_hashes.append(chunk_keys)
+            row_hashes.append(chunk_rows)
+            keys.append(key_text(chunk, key))
+            if on_progress is not None:
+                on_progress(len(chunk))
+
+        key_hashes = _concat(key_hashes, np.uint64)
+        row_hashes = _concat(row_hashes, np.uint64)
+        keys = _concat(keys, np.bytes_)
+        stats["unchanged"] = stats["rows"] - stats["inserted"] - stats["updated"]
+
+        # MERGE refuses to update one target row from two source rows
+        unique_keys, counts = np.unique(key_hashes, return_counts=True)
+        if len(unique_keys) < len(key_hashes):
+            raise ValueError(f"{int((counts > 1).sum())} keys appear more than once in {csv_file}; "
+                             f"{key} cannot drive a delta load")
+
+        deleted = []
+        if index is not None:
+            gone = ~np.isin(index["key_hashes"], unique_keys, assume_unique=True)
+            deleted = [value.decode("utf-8") for value in index["keys"][gone]]
+        stats["deleted"] = len(deleted)
+
+        if not dry_run:
+            if deleted:
+                key_type = column_types.get(key) if column_types else None
+                cursor.executemany(build_insert_sql(DELETED_TABLE, [key]),
+                                   [(value,) for value in column_values(pd.Series(deleted), key_type)])
+                cursor.execute(delete_sql(table_name, key))
+            if stats["inserted"] or stats["updated"]:
+                # New rows keep the key values from the file, identity or not
+                explicit_identity = any(column in identity for column in columns)
+                if explicit_identity:
+                    cursor.execute(f"SET IDENTITY_INSERT {table_name} ON;")
+                try:
+                    cursor.execute(merge_sql(table_name, columns, key, identity))
+                finally:
+                    # A session setting: the pooled session must not keep it
+                    if explicit_identity:
+                        cursor.execute(f"SET IDENTITY_INSERT {table_name} OFF;")
+            # Temp tables live as long as the session, and pooled sessions
+            # outlive this load
+            cursor.execute(f"DROP TABLE {STAGE_TABLE};")
+            cursor.execute(f"DROP TABLE {DELETED_TABLE};")
+            conn.commit()
+            save_index(path, key_hashes, row_hashes, keys)
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
+
+    stats["elapsed_seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+def build_index(csv_file, table_name, key, chunk_size=50000, cache=None, projection=None):
+    # For a table that was just loaded in full: record its state without
+    # touching the database, so the next refresh is a delta
+    key_hashes, row_hashes, keys = [], [], []
+    for _, chunk in read_chunks(csv_file, chunk_size, cache=cache, projection=projection, dtype=str):
+        if key not in chunk.columns:
+            raise ValueError(f"Key column {key} is not in {csv_file}")
+        chunk_keys, chunk_rows = hash_chunk(chunk, key)
+        key_hashes.append(chunk_keys)
+        row_hashes.append(chunk_rows)
+        keys.append(key_text(chunk, key))
+    save_index(index_path(csv_file, table_name), _concat(key_hashes, np.uint64), _concat(row_hashes, np.uint64),
+               _concat(keys, np.bytes_))
@@ -1,80 +1,96 @@
-import pyodbc
-import pandas as pd
 import os
 import configparser
-import glob
 import time
-import numpy as np
-
-# Read database configurations from config.ini
-config = configparser.ConfigParser()
-config.read('config.ini')
-
-conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={config['SQL_SERVER']['Server']};DATABASE={config['SQL_SERVER']['Database']};UID={config['SQL_SERVER']['Username']};PWD={config['SQL_SERVER']['Password']}"
-
-try:
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    cursor.fast_executemany = True  # Enabling fast_executemany
-    print("Successfully connected to the SQL Server.")
-except Exception as e:
-    print(f"Failed to connect to SQL Server: {e}")
-    exit()
-
-csv_files = [f for f in glob.glob("*.csv")]
-print("Available CSV files in the current directory:")
-for idx, file in enumerate(csv_files):
-    print(f"{idx + 1}. {file}")
-
-csv_file = input("Enter the name or number of the CSV file you want to import: ")
-if csv_file.isnumeric():
-    csv_file = csv_files[int(csv_file) - 1]
-
-print(f"You've selected {csv_file}. Is that correct? (y/n): ")
-confirmation = input()
-if confirmation.lower() != 'y':
-    print("Aborted.")
-    exit()
-
-# Fetch table names in the SQL Server database
-cursor.execute("SELECT table_name = t.name FROM sys.tables t INNER JOIN sys.schemas s ON t.schema_id = s.schema_id;")
-tables = [row.table_name for row in cursor.fetchall()]
-
-# Display table names to the user
-print("Available tables in the database:")
-for table in tables:
-    print(table)
-
-# User selects the SQL table
-table_name = input("Enter the SQL table name where the data will be inserted: ")
-
-try:
-    # Read CSV in chunks
-    chunk_iter = pd.read_csv(csv_file, chunksize=5000, low_memory=False) # Adjust chunksize based on available memory
-    print("Reading the CSV in chunks...")
-    
-    for chunk in chunk_iter:
-        chunk = chunk.replace({np.nan: "NULL"})
-        total_rows = len(chunk)
-        print(f"Total rows in this chunk: {total_rows}")
-
-        rows = [tuple(x) for x in chunk.to_numpy()]
-
-        placeholders = ",".join("?" * len(chunk.columns))
-        columns = ",".join([f"[{col}]" for col in chunk.columns])
-        sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-        
-        start_time = time.time()
-        cursor.executemany(sql, rows)
-        conn.commit()
-        end_time = time.time()
-        
-        print(f"Inserted this chunk in {end_time - start_time:.2f} seconds.")
-
-except Exception as e:
-    print(f"An error occurred: {e}")
-    conn.rollback()
-
-finally:
-    cursor.close()
-    conn.close()
+
+from autotune import ChunkTuner, make_chunk_size
+from csvreader import read_chunks
+from db import LOADER_DRIVER, open_database
+from params import build_batch
+from pipeline import read_loader_config
+from sources import find_inputs
+
+
+def main():
+    # Read database configurations from config.ini
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+
+    try:
+        database = open_database(config, driver=LOADER_DRIVER)
+        conn = database.connect()
+        cursor = conn.cursor()
+        cursor.fast_executemany = True  # Enabling fast_executemany
+        print("Successfully connected to the SQL Server.")
+    except Exception as e:
+        print(f"Failed to connect to SQL Server: {e}")
+        exit()
+
+    csv_files = find_inputs()  # .csv, .csv.gz/.zst/.bz2/.xz and CSVs inside .zip archives
+    print("Available CSV files in the current directory:")
+    for idx, file in enumerate(csv_files):
+        print(f"{idx + 1}. {file}")
+
+    csv_file = input("Enter the name or number of the CSV file you want to import: ")
+    if csv_file.isnumeric():
+        csv_file = csv_files[int(csv_file) - 1]
+
+    print(f"You've selected {csv_file}. Is that correct? (y/n): ")
+    confirmation = input()
+    if confirmation.lower() != 'y':
+        print("Aborted.")
+        exit()
+
+    # Fetch table names in the SQL Server database
+    tables = database.tables()
+
+    # Display table names to the user
+    print("Available tables in the database:")
+    for table in tables:
+        print(table)
+
+    # User selects the SQL table
+    table_name = input("Enter the SQL table name where the data will be inserted: ")
+
+    try:
+        # Read CSV in chunks
+        # [LOADER] ChunkSize fixes the chunk size; auto (the default) starts at
+        # 5000 rows and tunes it from commit latency and memory. ReadWorkers
+        # parses byte ranges of the file in that many processes.
+        settings = read_loader_config(config)
+        chunk_size = make_chunk_size(settings["chunk_size"], settings["target_commit_seconds"],
+                                     settings["memory_limit_mb"], initial=5000)
+        tuner = chunk_size if isinstance(chunk_size, ChunkTuner) else None
+        chunk_iter = (chunk for _, chunk in read_chunks(csv_file, chunk_size, workers=settings["read_workers"]))
+        print("Reading the CSV in chunks...")
+
+        for chunk in chunk_iter:
+            total_rows = len(chunk)
+            print(f"Total rows in this chunk: {total_rows}")
+
+            rows = build_batch(chunk)  # missing values go in as real NULLs
+
+            placeholders = ",".join("?" * len(chunk.columns))
+            columns = ",".join([f"[{col}]" for col in chunk.columns])
+            sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+
+            start_time = time.time()
+            cursor.executemany(sql, rows)
+            conn.commit()
+            end_time = time.time()
+            if tuner is not None:
+                tuner.observe_commit(total_rows, 1, end_time - start_time)
+
+            print(f"Inserted this chunk in {end_time - start_time:.2f} seconds.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        conn.rollback()
+
+    finally:
+        cursor.close()
+        conn.close()
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
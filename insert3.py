@@ -1,87 +1,125 @@
-import pyodbc
+import argparse
 import configparser
-import glob
+import threading
 import time
 import os
-import pandas as pd
-import numpy as np
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-
-
-# Read database configurations from config.ini
-config = configparser.ConfigParser()
-config.read('config.ini')
-
-conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={config['SQL_SERVER']['Server']};DATABASE={config['SQL_SERVER']['Database']};UID={config['SQL_SERVER']['Username']};PWD={config['SQL_SERVER']['Password']}"
-
-try:
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    cursor.fast_executemany = True  # Enabling fast_executemany
-    print("Successfully connected to the SQL Server.")
-except Exception as e:
-    print(f"Failed to connect to SQL Server: {e}")
-    exit()
-
-csv_files = [f for f in glob.glob("*.csv")]
-print("Available CSV files in the current directory:")
-for idx, file in enumerate(csv_files):
-    print(f"{idx + 1}. {file}")
-
-csv_num = int(input("Enter the number of the CSV file you want to import: "))
-csv_file = csv_files[csv_num - 1]
-
-print(f"You've selected {csv_file}. Is that correct? (y/n): ")
-confirmation = input()
-if confirmation.lower() != 'y':
-    print("Aborted.")
-    exit()
-
-# Calculate the total number of rows in the CSV file using pandas
-# chunk_size for READ ONLY
-chunk_size = 50000
-
-# Specify the engine and usecols parameter
-total_csv_rows = 0
-
-# Start the timer for CSV row counting
-csv_row_count_start_time = time.time()
-
-with pd.read_csv(csv_file, engine='c', usecols=[0], chunksize=chunk_size) as chunk_iter:
-    for chunk in chunk_iter:
-        total_csv_rows += len(chunk)
-
-# Stop the timer for CSV row counting
-csv_row_count_end_time = time.time()
-
-print(f"Chunk size: {chunk_size}")
-print(f"Total rows in the entire CSV: {total_csv_rows}")
-print(f"Time taken for CSV row counting: {csv_row_count_end_time - csv_row_count_start_time:.2f} seconds")
-
-
-
-cursor.execute("SELECT table_name = t.name FROM sys.tables t INNER JOIN sys.schemas s ON t.schema_id = s.schema_id;")
-tables = [row.table_name for row in cursor.fetchall()]
-
-print("Available tables in the database:")
-print('\n'.join(tables))
-
-table_name = input("Enter the SQL table name where the data will be inserted: ")
-primary_key_column = input("Enter the name of the primary key or unique column for debugging (case-sensitive): ")
-
-
-
-
-
-try:
-    chunk_size = 50000  # Adjust based on observation and database capacity
-    chunk_iter = pd.read_csv(csv_file, chunksize=chunk_size, low_memory=False, encoding='utf-8')
-    
-    pbar = tqdm(total=total_csv_rows, dynamic_ncols=True, unit="row")
-    
-    for i, chunk in enumerate(chunk_iter):
-        # Debugging section
+from autotune import make_chunk_size
+from checkpoint import Checkpoint
+from badrows import Quarantine, column_limits, quarantine_path
+from csvprofile import row_count
+from db import LOADER_DRIVER, open_database
+from deltaload import build_index, delta_load
+from metrics import FORMATS, open_metrics, open_profiler
+from pipeline import read_loader_config
+from projection import describe, projection_for, read_projections
+from sources import compressed_size, find_inputs
+from stagecache import open_cache
+from typeinfer import parameter_type
+from verify import print_report, verify_load
+from writers import BACKENDS
+
+
+def main():
+    # Read database configurations from config.ini
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+
+    parser = argparse.ArgumentParser(description="Import a CSV file into a SQL Server table.")
+    parser.add_argument("--workers", type=int, help="parallel writer connections (default: [LOADER] Workers or 1)")
+    parser.add_argument("--commit-every", dest="commit_every", type=int,
+                        help="chunks per commit on each writer (default: [LOADER] CommitEvery or 1)")
+    parser.add_argument("--read-workers", dest="read_workers", type=int,
+                        help="processes parsing the CSV (default: [LOADER] ReadWorkers or 1)")
+    parser.add_argument("--chunk-size", dest="chunk_size",
+                        help="rows per chunk, or auto to tune it from commit latency "
+                             "(default: [LOADER] ChunkSize or auto)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore any checkpoint and import from the first row")
+    parser.add_argument("--delta", action="store_true",
+                        help="apply only new, changed and removed rows since the last delta load, "
+                             "keyed on the primary key")
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        help="writer backend (default: [LOADER] Backend or executemany)")
+    parser.add_argument("--staging-dir", dest="staging_dir",
+                        help="where bulk-insert/bcp stage the data and format files")
+    parser.add_argument("--server-staging-dir", dest="server_staging_dir",
+                        help="the staging directory as SQL Server sees it, for BULK INSERT")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, help="BULK INSERT/bcp rows per batch")
+    parser.add_argument("--no-tablock", dest="tablock", action="store_false", default=None,
+                        help="do not take a table lock during BULK INSERT/bcp")
+    parser.add_argument("--metrics",
+                        help="write per-stage metrics snapshots to this file (default: [METRICS] Path if enabled)")
+    parser.add_argument("--metrics-format", dest="metrics_format", choices=FORMATS,
+                        help="jsonl appends a snapshot per line, prometheus rewrites a textfile-collector file")
+    parser.add_argument("--profile-chunk", dest="profile_chunk", type=int,
+                        help="cProfile and tracemalloc this chunk through each stage")
+    parser.add_argument("--verify", action="store_true",
+                        help="after the load, compare partition checksums of the table and the CSV by the key column")
+    args = parser.parse_args()
+    loader_settings = read_loader_config(config, args)
+
+    try:
+        database = open_database(config, max_size=max(loader_settings["workers"], 1) + 1, driver=LOADER_DRIVER)
+        conn = database.connect()
+        cursor = conn.cursor()
+        print("Successfully connected to the SQL Server.")
+    except Exception as e:
+        print(f"Failed to connect to SQL Server: {e}")
+        exit()
+    # The table list is fetched while the prompts below wait on the user
+    prefetch = ThreadPoolExecutor(1)
+    tables_future = prefetch.submit(database.tables)
+
+    csv_files = find_inputs()  # .csv, .csv.gz/.zst/.bz2/.xz and CSVs inside .zip archives
+    print("Available CSV files in the current directory:")
+    for idx, file in enumerate(csv_files):
+        print(f"{idx + 1}. {file}")
+
+    csv_num = int(input("Enter the number of the CSV file you want to import: "))
+    csv_file = csv_files[csv_num - 1]
+
+    print(f"You've selected {csv_file}. Is that correct? (y/n): ")
+    confirmation = input()
+    if confirmation.lower() != 'y':
+        print("Aborted.")
+        exit()
+
+    # Total rows come from the cached profile or a byte-level count, not a parse
+    csv_row_count_start_time = time.time()
+    total_csv_rows = row_count(csv_file)
+    csv_row_count_end_time = time.time()
+
+    print(f"Total rows in the entire CSV: {total_csv_rows}")
+    print(f"Time taken for CSV row counting: {csv_row_count_end_time - csv_row_count_start_time:.2f} seconds")
+
+    tables = tables_future.result()
+    prefetch.shutdown()
+
+    print("Available tables in the database:")
+    print('\n'.join(tables))
+
+    table_name = input("Enter the SQL table name where the data will be inserted: ")
+    primary_key_column = input("Enter the name of the primary key or unique column for debugging (case-sensitive): ")
+
+    # Send typed parameters matching the target columns instead of strings
+    target_columns = database.columns(table_name)
+    target_types = {row[0]: parameter_type(row[1]) for row in target_columns}
+    # Widths, integer ranges and NOT NULL, checked before rows are sent
+    target_limits = column_limits(target_columns)
+    # Only the columns the table takes are parsed, under their table names
+    projection = projection_for(table_name, read_projections(config))
+    if projection is not None:
+        print(describe(projection, table_name))
+
+
+
+
+
+    def debug_primary_key(chunk):
         if primary_key_column in chunk.columns:
             print(f"Checking column {primary_key_column}")
             print(f"Number of NaN/NULL values: {chunk[primary_key_column].isna().sum()}")
@@ -89,48 +127,157 @@ try:
             print(f"Maximum length of values: {chunk[primary_key_column].apply(lambda x: len(str(x))).max()}")
         else:
             print(f"Column {primary_key_column} not found in this chunk.")
-        
-        chunk = chunk.replace({np.nan: "NULL"})
-        total_rows = len(chunk)
-
-        rows = [tuple(x) for x in chunk.to_numpy()]
-
-        placeholders = ",".join("?" * len(chunk.columns))
-        columns = ",".join([f"[{col}]" for col in chunk.columns])
-        sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-        
-        start_time = time.time()
-        try:
-            cursor.executemany(sql, rows)
-            conn.commit()
-            end_time = time.time()
-            pbar.update(total_rows)
-        except Exception as e:
-            print(f"[ERROR] An error occurred while inserting a row: {e}")
-            for row in rows:
-                try:
-                    cursor.execute(sql, row)
-                    conn.commit()
-                except:
-                    print(f"Problematic row: {row}")
-                    conn.rollback()
-                    break
-
-        print(f"[SUCCESS] Inserted this chunk in {end_time - start_time:.2f} seconds.\n")
-
-    pbar.close()
 
-except Exception as e:
-    print(f"[ERROR] An error occurred: {e}")
-    conn.rollback()
 
-finally:
+    # The table list above was the only thing this connection was needed for;
+    # it goes back to the pool and the first writer picks it up again.
     cursor.close()
     conn.close()
 
+    connect = database.connect
+    cache = open_cache(config)
+    chunk_size = make_chunk_size(loader_settings["chunk_size"], loader_settings["target_commit_seconds"],
+                                 loader_settings["memory_limit_mb"])
+
+    if loader_settings["backend"] != "executemany":
+        # One server-side bulk load: there are no chunk commits to checkpoint
+        bulk_options = {"connect": connect, "staging_dir": loader_settings["staging_dir"],
+                        "server_dir": loader_settings["server_staging_dir"],
+                        "target_columns": [row[0] for row in target_columns],
+                        "tablock": loader_settings["tablock"], "batch_size": loader_settings["batch_size"],
+                        "cache": cache, "projection": projection}
+        if loader_settings["backend"] == "bcp":
+            backend = BACKENDS["bcp"](config['SQL_SERVER']['Server'], config['SQL_SERVER']['Database'],
+                                      config['SQL_SERVER']['Username'], config['SQL_SERVER']['Password'],
+                                      **bulk_options)
+        else:
+            backend = BACKENDS[loader_settings["backend"]](**bulk_options)
+        try:
+            pbar = tqdm(total=total_csv_rows, dynamic_ncols=True, unit="row", desc="staging")
+            stats = backend.load(csv_file, table_name, chunk_size, on_progress=pbar.update)
+            pbar.close()
+            print(f"[SUCCESS] Loaded {stats['rows']} rows in {stats['elapsed_seconds']:.2f} seconds "
+                  f"(staging {stats['stage_seconds']:.2f}s, {backend.name} {stats['load_seconds']:.2f}s).")
+        except Exception as e:
+            print(f"[ERROR] An error occurred: {e}")
+            # Callers and schedulers must see the load failed
+            sys.exit(1)
+        finally:
+            database.close()
+        exit()
+
+    if args.delta:
+        # Staging table + MERGE in one transaction, so there is nothing to resume
+        try:
+            pbar = tqdm(total=total_csv_rows, dynamic_ncols=True, unit="row", desc="comparing")
+            stats = delta_load(csv_file, table_name, connect, primary_key_column, target_types, chunk_size,
+                               cache=cache, on_progress=pbar.update, projection=projection)
+            pbar.close()
+            print(f"[SUCCESS] {stats['inserted']} inserted, {stats['updated']} updated, {stats['deleted']} deleted, "
+                  f"{stats['unchanged']} unchanged in {stats['elapsed_seconds']:.2f} seconds.")
+        except Exception as e:
+            print(f"[ERROR] An error occurred: {e}")
+            sys.exit(1)
+        finally:
+            database.close()
+        exit()
+
+    checkpoint = Checkpoint(csv_file, table_name)
+    checkpoint.load()
+    resume_args = {}
+    if args.restart:
+        checkpoint.state.update(committed_chunks=0, committed_offset=0, next_line=None, rows=0, complete=False)
+    elif checkpoint.state["complete"]:
+        print(f"{csv_file} was already fully imported into {table_name}. Import it again? (y/n): ")
+        if input().lower() != 'y':
+            print("Aborted.")
+            exit()
+        checkpoint.state.update(committed_chunks=0, committed_offset=0, next_line=None, rows=0, complete=False)
+    elif checkpoint.resuming:
+        resume_args = checkpoint.resume_args()
+        print(f"[INFO] Resuming after chunk {checkpoint.state['committed_chunks']} "
+              f"({checkpoint.state['rows']} rows already committed).")
+
+    quarantine = Quarantine(quarantine_path(csv_file, table_name))
+    if not checkpoint.resuming:
+        quarantine.clear()
+    # Snapshots keep coming while the load runs and a last one is written when
+    # it ends, failed or not
+    metrics = open_metrics(config, args, labels={"table": table_name}).start()
+    loaded = False
+
+    try:
+        on_commit = checkpoint.mark_committed
+        on_progress = None
+        if total_csv_rows is None:
+            # Compressed input: the row count is unknown without decompressing
+            # the whole file, so progress is measured in compressed bytes read
+            pbar = tqdm(total=compressed_size(csv_file), dynamic_ncols=True, unit="B", unit_scale=True)
+
+            progress_lock = threading.Lock()
+
+            def on_commit(position, rows):
+                checkpoint.mark_committed(position, rows)
+                # Writers commit out of order; the bar only moves forward
+                with progress_lock:
+                    compressed_end = position.get("compressed_end", 0)
+                    if compressed_end > pbar.n:
+                        pbar.update(compressed_end - pbar.n)
+        else:
+            pbar = tqdm(total=total_csv_rows, initial=checkpoint.state["rows"], dynamic_ncols=True, unit="row")
+            on_progress = pbar.update
+
+        backend = BACKENDS["executemany"](connect, metrics=metrics, profiler=open_profiler(config, args))
+        stats = backend.load(csv_file, table_name, chunk_size, on_progress=on_progress,
+                             writers=loader_settings["workers"], commit_every=loader_settings["commit_every"],
+                             queue_size=loader_settings["queue_size"], chunk_hook=debug_primary_key,
+                             on_commit=on_commit, column_types=target_types, cache=cache,
+                             column_limits=target_limits, quarantine=quarantine,
+                             read_workers=loader_settings["read_workers"], projection=projection, **resume_args)
+
+        pbar.close()
+        checkpoint.mark_complete()
+        loaded = True
+        if primary_key_column in target_types:
+            # The next --delta run compares against this load instead of
+            # merging every row
+            try:
+                build_index(csv_file, table_name, primary_key_column, chunk_size, cache=cache, projection=projection)
+            except Exception as e:
+                print(f"[WARN] No delta index was saved, the next --delta run merges every row: {e}")
+        print(f"[SUCCESS] Inserted {stats['rows']} rows in {stats['elapsed_seconds']:.2f} seconds "
+              f"({stats['rows_per_second']:.0f} rows/s).")
+        print(f"[INFO] Stage busy time - read: {stats['read_seconds']:.2f}s, "
+              f"convert: {stats['convert_seconds']:.2f}s, write: {stats['write_seconds']:.2f}s")
+        for worker in stats["workers"]:
+            status = f"FAILED ({worker['error']})" if worker["failed"] else "ok"
+            print(f"[INFO] Worker {worker['worker']}: {worker['rows']} rows in {worker['chunks']} chunks, "
+                  f"{worker['rows_per_second']:.0f} rows/s, {status}")
+        if stats.get("chunk_size_decisions"):
+            print(f"[INFO] Chunk size settled at {stats['chunk_size']} rows after "
+                  f"{len(stats['chunk_size_decisions'])} adjustments (peak RSS {stats['peak_rss_mb']} MB).")
+        if stats["filtered"]:
+            print(f"[INFO] {stats['filtered']} rows did not pass the table's filter and were skipped.")
+        if stats["quarantined"]:
+            print(f"[WARN] {stats['quarantined']} rows were rejected and written to {quarantine.path}.")
+        if stats["retried_chunks"]:
+            print(f"[INFO] {stats['retried_chunks']} uncommitted chunks were re-inserted by other workers.")
+
+    except Exception as e:
+        print(f"[ERROR] An error occurred: {e}")
+        print(f"[INFO] Committed progress is saved in {checkpoint.path}; rerun to resume.")
+    finally:
+        quarantine.close()
+        metrics.close()
+
+    if loaded and args.verify:
+        # Rejected rows were never inserted, so they show up as missing
+        try:
+            print_report(verify_load(csv_file, table_name, connect, primary_key_column, projection=projection))
+        except Exception as e:
+            print(f"[ERROR] Verification failed: {e}")
+    database.close()
 
 
-
-
-
-
+if __name__ == '__main__':
+    main()
@@ -1,100 +1,134 @@
 import pandas as pd
-import pyodbc
-import os
+import argparse
 import configparser
 
-# Retrieve DB credentials from the config
+from csvprofile import column_types, profile_files
+from db import open_database
+from ddl import create_tables, profile_types, read_table_rules, rule_for, table_statements
+from projection import project_types, projection_for, read_projections
+from sources import csv_name, find_inputs
+
 config = configparser.ConfigParser()
 config.read('config.ini')
-DB_DRIVER = config['SQL_SERVER']['Driver']
-DB_SERVER = config['SQL_SERVER']['Server']
-DB_NAME = config['SQL_SERVER']['Database']
-DB_USERNAME = config['SQL_SERVER']['Username']
-DB_PASSWORD = config['SQL_SERVER']['Password']
 
 def read_csv_file(filename, nrows=None):
     return pd.read_csv(filename, nrows=nrows)
 
-def infer_data_types(filename):
-    df_sample = pd.read_csv(filename, nrows=5000)  # Limit rows for type inference
-    
-    return {col: "VARCHAR(MAX)" for col in df_sample.columns}
+def infer_data_types(filename, sample_size=None, threshold=1.0):
+    # Full-file inference from the cached profile shared with colreducer1,
+    # or a reservoir sample of sample_size rows
+    return column_types(filename, sample_size=sample_size, threshold=threshold)
 
 
 
-def get_connection():
+def get_connection(database):
     print("Attempting to connect to the SQL Server...")
     try:
-        conn = pyodbc.connect(
-            f'DRIVER={DB_DRIVER};'
-            f'SERVER={DB_SERVER};'
-            f'DATABASE={DB_NAME};'
-            f'UID={DB_USERNAME};'
-            f'PWD={DB_PASSWORD};'
-        )
+        conn = database.connect()
         print("Connection to the SQL Server established successfully!")
         return conn
     except Exception as e:
         print(f"Failed to connect to SQL Server. Error: {e}")
         return None
 
-def create_table(conn, table_name, col_types):
+def create_table(conn, table_name, col_types, rules=()):
     print("Attempting to create the table...")
-    cursor = conn.cursor()
-    
-    if table_name.lower() == 'contact':
-        # Create "Id" column as primary key only if it doesn't exist in the CSV columns
-        if 'Id' not in col_types:
-            columns = "[Id] INT PRIMARY KEY IDENTITY(1, 1)"
-        else:
-            columns = ""
-        
-        # Add remaining columns as VARCHAR(MAX)
-        for col, dtype in col_types.items():
-            if columns:
-                columns += f", [{col}] VARCHAR(MAX)"
-            else:
-                columns += f"[{col}] VARCHAR(MAX)"
-                
-    else:
-        # Surrounding column names with square brackets to handle potential SQL keywords or special characters in column names.
-        columns = ", ".join([f"[{col}] {dtype}" for col, dtype in col_types.items()])
-    
-    query = f"CREATE TABLE dbo.{table_name} ({columns});"  # Note the 'dbo.' prefix
-    
+    # Keys, identity columns and indexes come from the [TABLE:...] rules in
+    # config.ini (see ddl.py); contact's IDENTITY key is one of them now
     try:
-        cursor.execute(query)
-        conn.commit()
-        print(f"Table {table_name} created successfully!")
+        # create_tables reports each table it creates
+        create_tables(conn, [(table_name, table_statements(table_name, col_types, rule_for(table_name, rules)))])
     except Exception as e:
         print(f"Error while creating table. Error: {e}")
 
 
-# Adjustments in main function
+def plan_tables(csv_files, rules, threshold=1.0, workers=None, projections=()):
+    # Profiles every file at once (full-file stats, cached) -> [(table, statements)].
+    # A table with a column mapping gets only its mapped columns, renamed.
+    profiles = profile_files(csv_files, workers=workers)
+    plans = []
+    for filename in csv_files:
+        table_name = csv_name(filename).split('.')[0]
+        col_types = project_types(profile_types(profiles[filename], threshold), projection_for(table_name, projections))
+        plans.append((table_name, table_statements(table_name, col_types, rule_for(table_name, rules))))
+    return plans
+
+
+def create_all(database, csv_files, rules, threshold=1.0, workers=None, dry_run=False, projections=()):
+    print(f"Profiling {len(csv_files)} CSV files...")
+    plans = plan_tables(csv_files, rules, threshold, workers, projections)
+    existing = {name.lower() for name in database.tables()} if not dry_run else set()
+    new_plans = []
+    for table_name, statements in plans:
+        if table_name.lower() in existing:
+            print(f"Table {table_name} already exists, skipping.")
+            continue
+        new_plans.append((table_name, statements))
+        print("\n".join(statements))
+    if dry_run or not new_plans:
+        return
+    conn = get_connection(database)
+    if not conn:
+        return
+    try:
+        create_tables(conn, new_plans)
+        print(f"Created {len(new_plans)} tables.")
+    except Exception as e:
+        print(f"Error while creating tables, none were created. Error: {e}")
+    finally:
+        database.invalidate()
+        conn.close()
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Create SQL Server tables for the CSV files in a directory.")
+    parser.add_argument("directory", nargs="?", default=".", help="where the CSV files are (default: here)")
+    parser.add_argument("--all", action="store_true",
+                        help="profile every CSV at once and create all tables in one session, without prompts")
+    parser.add_argument("--workers", type=int, help="processes profiling the files (default: all cores)")
+    parser.add_argument("--threshold", type=float, default=1.0,
+                        help="share of values a type must fit before it is chosen over VARCHAR")
+    parser.add_argument("--dry-run", action="store_true", help="print the DDL, create nothing")
+    args = parser.parse_args()
+
     print("Starting the main function...")
-    
-    for filename in os.listdir():
-        if filename.endswith('.csv'):
-            choice = input(f"Do you want to process the file '{filename}'? (yes/no) ").lower()
-            if choice not in ['yes', 'y']:
-                continue
-            
-            print(f"Reading a sample of CSV file: {filename}")  
-            col_types = infer_data_types(filename) # Pass filename
-            
-            # Connect to SQL Server
-            conn = get_connection()
-            if not conn:
-                print("Failed to get database connection. Skipping this file.")
-                continue
-
-            # Create table, using the cleaned filename without extension as table name
-            table_name = filename.split('.')[0]  # Removing the file extension here
-
-            create_table(conn, table_name, col_types)
-
-            conn.close()
+    rules = read_table_rules(config)
+    projections = read_projections(config)
+    database = open_database(config)
+    csv_files = find_inputs(args.directory)
+
+    if args.all:
+        create_all(database, csv_files, rules, args.threshold, args.workers, args.dry_run, projections)
+        database.close()
+        return
+
+    for filename in csv_files:
+        choice = input(f"Do you want to process the file '{filename}'? (yes/no) ").lower()
+        if choice not in ['yes', 'y']:
+            continue
+
+        print(f"Inferring column types of CSV file: {filename}")
+        col_types = infer_data_types(filename, threshold=args.threshold)
+
+        # Create table, using the cleaned filename without extension as table name
+        table_name = csv_name(filename).split('.')[0]  # Removing the file extension here
+        col_types = project_types(col_types, projection_for(table_name, projections))
+        if args.dry_run:
+            print("\n".join(table_statements(table_name, col_types, rule_for(table_name, rules))))
+            continue
+
+        conn = get_connection(database)
+        if not conn:
+            print("Failed to get database connection. Skipping this file.")
+            continue
+
+        create_table(conn, table_name, col_types, rules)
+        database.invalidate(table_name)
+
+        # Back to the pool; the next file reuses the same connection
+        conn.close()
+
+    database.close()
 
 if __name__ == '__main__':
     print("Script started...")
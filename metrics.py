@@ -0,0 +1,271 @@
+import bisect
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Per-stage instrumentation for the loaders: counters, gauges and latency
+# histograms, exported as JSON lines (one snapshot per line, appended) or
+# in the Prometheus text format (the file is replaced, ready for the
+# node_exporter textfile collector).
+#
+# Disabled metrics are NULL_METRICS, whose methods do nothing; the loaders
+# feed it the timings they measure anyway, so switching metrics off costs a
+# no-op call per chunk.
+#
+# ChunkProfiler runs cProfile and tracemalloc over one chunk as it passes
+# through each stage and writes a .prof file and a text report per stage.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FORMATS = ("jsonl", "prometheus")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        cumulative = []
+        seen = 0
+        for count in self.counts[:-1]:
+            seen += count
+            cumulative.append(seen)
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "buckets": dict(zip(map(str, self.buckets), cumulative))}
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self, path=None, format="jsonl", interval=10.0, labels=None, prefix="csvload"):
+        if format not in FORMATS:
+            raise ValueError(f"Metrics format must be one of {', '.join(FORMATS)}")
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.labels = dict(labels or {})
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time)
+
+    def snapshot(self):
+        with self.lock:
+            return {"time": time.time(), "uptime_seconds": time.time() - self.started, "labels": self.labels,
+                    "counters": dict(self.counters), "gauges": dict(self.gauges),
+                    "histograms": {name: h.snapshot() for name, h in self.histograms.items()}}
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        labels = ",".join(f'{key}="{value}"' for key, value in sorted(self.labels.items()))
+
+        def series(name, extra="", value=0):
+            label_text = ",".join(part for part in (labels, extra) if part)
+            return f"{self.prefix}_{name}{{{label_text}}} {value}" if label_text else f"{self.prefix}_{name} {value}"
+
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {self.prefix}_{name}_total counter", series(f"{name}_total", value=value)]
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines += [f"# TYPE {self.prefix}_{name} gauge", series(name, value=value)]
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(series(f"{name}_bucket", f'le="{bound}"', count))
+            lines += [series(f"{name}_bucket", 'le="+Inf"', histogram["count"]),
+                      series(f"{name}_sum", value=histogram["sum"]), series(f"{name}_count", value=histogram["count"])]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        if self.path is None:
+            return
+        if self.format == "prometheus":
+            # Replaced whole, so a scraper never reads half a file
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, self.path)
+        else:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
+
+    def start(self):
+        # Snapshots every `interval` seconds while a load runs
+        if self.path is None or self.thread is not None:
+            return self
+        self.stop_event.clear()
+
+        def export():
+            while not self.stop_event.wait(self.interval):
+                self.write()
+
+        self.thread = threading.Thread(target=export, name="metrics-export", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+
+class NullMetrics:
+    enabled = False
+
+    def count(self, name, value=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return _NULL_CONTEXT
+
+    def snapshot(self):
+        return {}
+
+    def start(self):
+        return self
+
+    def close(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class ChunkProfiler:
+    def __init__(self, chunk_index=None, output_prefix="chunk_profile", top=25):
+        self.chunk_index = chunk_index
+        self.output_prefix = output_prefix
+        self.top = top
+        self.reports = []
+
+    def profile(self, index, stage):
+        if self.chunk_index is None or index != self.chunk_index:
+            return _NULL_CONTEXT
+        return self._profile(index, stage)
+
+    @contextlib.contextmanager
+    def _profile(self, index, stage):
+        # tracemalloc sees every thread, so the allocation report also holds
+        # whatever the other stages allocated in the meantime
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            self._report(index, stage, profiler, before, after, peak)
+
+    def _report(self, index, stage, profiler, before, after, peak):
+        path = f"{self.output_prefix}.chunk{index}.{stage}"
+        profiler.dump_stats(path + ".prof")
+        text = io.StringIO()
+        text.write(f"Chunk {index}, stage {stage}\n\n")
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(self.top)
+        text.write(f"Traced memory peak: {peak / 2 ** 20:.1f} MB\nTop allocations:\n")
+        for stat in after.compare_to(before, "lineno")[:self.top]:
+            text.write(f"  {stat}\n")
+        with open(path + ".txt", "w") as f:
+            f.write(text.getvalue())
+        self.reports.append(path + ".txt")
+        print(f"[INFO] Profiled chunk {index} ({stage}): {path}.txt, {path}.prof")
+
+
+NO_PROFILER = ChunkProfiler()
+
+
+def open_metrics(config, args=None, labels=None):
+    # [METRICS] Enabled/Path/Format/IntervalSeconds, --metrics PATH wins
+    section = config['METRICS'] if config.has_section('METRICS') else {}
+    path = getattr(args, "metrics", None)
+    if path is None and str(section.get('Enabled', 'no')).lower() in ('1', 'yes', 'true', 'on'):
+        path = section.get('Path', 'loader_metrics.jsonl')
+    if path is None:
+        return NULL_METRICS
+    format = getattr(args, "metrics_format", None) or section.get('Format')
+    if format is None:
+        format = "prometheus" if path.endswith(".prom") else "jsonl"
+    return Metrics(path, format, float(section.get('IntervalSeconds', 10)), labels)
+
+
+def open_profiler(config, args=None):
+    # [METRICS] ProfileChunk / --profile-chunk N: profile that chunk only
+    section = config['METRICS'] if config.has_section('METRICS') else {}
+    chunk_index = getattr(args, "profile_chunk", None)
+    if chunk_index is None and section.get('ProfileChunk'):
+        chunk_index = int(section.get('ProfileChunk'))
+    if chunk_index is None:
+        return NO_PROFILER
+    return ChunkProfiler(chunk_index, section.get('ProfilePrefix', 'chunk_profile'))
@@ -0,0 +1,259 @@
+import re
+
+from typeinfer import choose_type
+
+# Column type migrations for an existing table. The planner reads the
+# table's definition from INFORMATION_SCHEMA once, works out which columns
+# actually change, checks with one set-based query that the data fits the
+# new types, and picks a strategy:
+#
+#   alter    one ALTER COLUMN per change, all in one transaction. Widening a
+#            (N)VARCHAR(n) is a metadata change; anything else makes SQL
+#            Server touch every row, once per ALTER.
+#   rebuild  copy the table once into a new table with the final types
+#            (INSERT ... WITH (TABLOCK) SELECT, minimally logged), then swap
+#            the names. One pass over the data however many columns change.
+#            The copy only carries the columns and the primary key, so a
+#            table with an identity column, defaults, other indexes, foreign
+#            keys (either way), check constraints, triggers or computed
+#            columns is never rebuilt. The old table is kept under
+#            <table>__before_migrate for the operator to drop once checked.
+#
+# The dry-run estimate counts cells rewritten: rows x columns rewritten for
+# alter, rows x all columns for rebuild. What decides between them is the
+# number of passes: each rewriting ALTER is a full pass over the table, a
+# rebuild is one pass (plus re-creating the primary key).
+
+_ALTER_PATTERN = re.compile(r"ALTER\s+COLUMN\s+\[([^\]]+)\]\s+(.+?)\s*;?\s*$", re.IGNORECASE)
+_TYPE_PATTERN = re.compile(r"^\s*(\w+)\s*(?:\(\s*(MAX|\d+)\s*(?:,\s*(\d+)\s*)?\))?", re.IGNORECASE)
+_NULLABILITY_PATTERN = re.compile(r"\s+(NOT\s+)?NULL$", re.IGNORECASE)
+_STRING_TYPES = ("char", "varchar", "nchar", "nvarchar")
+
+
+def read_table_columns(cursor, table_name):
+    cursor.execute("""
+        SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, IS_NULLABLE,
+               COLUMNPROPERTY(OBJECT_ID(TABLE_SCHEMA + '.' + TABLE_NAME), COLUMN_NAME, 'IsIdentity')
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_NAME = ?
+        ORDER BY ORDINAL_POSITION
+    """, table_name)
+    return [{"name": row[0], "type": sql_type(row[1], row[2], row[3], row[4]), "nullable": row[5] == "YES",
+             "identity": bool(row[6])}
+            for row in cursor.fetchall()]
+
+
+def read_primary_key(cursor, table_name):
+    cursor.execute("""
+        SELECT tc.CONSTRAINT_NAME, kcu.COLUMN_NAME
+        FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+        JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu ON kcu.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+        WHERE tc.TABLE_NAME = ? AND tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+        ORDER BY kcu.ORDINAL_POSITION
+    """, table_name)
+    rows = cursor.fetchall()
+    return (rows[0][0], [row[1] for row in rows]) if rows else (None, [])
+
+
+def read_dependents(cursor, table_name):
+    # -> {kind: count} of the objects a rebuild would not carry over
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM sys.indexes WHERE object_id = t.id AND type > 0 AND is_primary_key = 0),
+               (SELECT COUNT(*) FROM sys.foreign_keys WHERE parent_object_id = t.id OR referenced_object_id = t.id),
+               (SELECT COUNT(*) FROM sys.default_constraints WHERE parent_object_id = t.id),
+               (SELECT COUNT(*) FROM sys.check_constraints WHERE parent_object_id = t.id),
+               (SELECT COUNT(*) FROM sys.triggers WHERE parent_id = t.id),
+               (SELECT COUNT(*) FROM sys.computed_columns WHERE object_id = t.id)
+        FROM (SELECT OBJECT_ID(?) AS id) t
+    """, table_name)
+    row = cursor.fetchone()
+    kinds = ("indexes", "foreign keys", "defaults", "check constraints", "triggers", "computed columns")
+    return {kind: count for kind, count in zip(kinds, row) if count}
+
+
+def sql_type(data_type, max_length=None, precision=None, scale=None):
+    data_type = data_type.upper()
+    if data_type.lower() in _STRING_TYPES:
+        return f"{data_type}({'MAX' if max_length == -1 else max_length})"
+    if data_type.lower() in ("decimal", "numeric"):
+        return f"{data_type}({precision},{scale})"
+    return data_type
+
+
+def parse_type(type_text):
+    # "VARCHAR(50)" -> ("varchar", 50, None); MAX is -1 like INFORMATION_SCHEMA
+    match = _TYPE_PATTERN.match(type_text)
+    if not match:
+        return type_text.lower(), None, None
+    base, size, scale = match.groups()
+    size = -1 if size and size.upper() == "MAX" else (int(size) if size else None)
+    return base.lower(), size, int(scale) if scale else None
+
+
+def parse_alter_statements(lines):
+    # alter_statements.txt lines -> {column: new type}
+    desired = {}
+    for line in lines:
+        match = _ALTER_PATTERN.search(line.strip())
+        if match:
+            # Nullability is kept from the table, only the type is planned
+            desired[match.group(1)] = _NULLABILITY_PATTERN.sub("", match.group(2).strip())
+    return desired
+
+
+def types_from_profile(profile, threshold=1.0):
+    return {column["name"]: choose_type(column["type_stats"], threshold)[0] for column in profile["columns"]}
+
+
+def is_metadata_only(old_type, new_type):
+    # Same string type made longer: SQL Server only updates the catalog
+    old_base, old_size, _ = parse_type(old_type)
+    new_base, new_size, _ = parse_type(new_type)
+    return (old_base == new_base and old_base in _STRING_TYPES and old_size not in (None, -1)
+            and new_size not in (None, -1) and new_size >= old_size)
+
+
+def plan_changes(columns, desired, only_max=True):
+    changes = []
+    for column in columns:
+        new_type = desired.get(column["name"])
+        if new_type is None or parse_type(new_type) == parse_type(column["type"]):
+            continue
+        if only_max and parse_type(column["type"])[1] != -1:
+            continue
+        changes.append({"column": column["name"], "from": column["type"], "to": new_type,
+                        "nullable": column["nullable"],
+                        "metadata_only": is_metadata_only(column["type"], new_type)})
+    return changes
+
+
+def measure_sql(table_name, changes):
+    # One scan answers every pre-check: the longest value for string
+    # targets, and how many values would not convert for the others. The
+    # length is DATALENGTH of the value in the target's type, so trailing
+    # spaces count (LEN drops them) and N-types count two bytes a character.
+    measures = ["COUNT_BIG(*)"]
+    for change in changes:
+        if change["metadata_only"]:
+            continue
+        base, _, _ = parse_type(change["to"])
+        if base in ("nchar", "nvarchar"):
+            measures.append(f"MAX(DATALENGTH(CONVERT(NVARCHAR(MAX), [{change['column']}]))) / 2")
+        elif base in _STRING_TYPES:
+            measures.append(f"MAX(DATALENGTH(CONVERT(VARCHAR(MAX), [{change['column']}])))")
+        else:
+            measures.append(f"SUM(CASE WHEN [{change['column']}] IS NOT NULL "
+                            f"AND TRY_CONVERT({change['to']}, [{change['column']}]) IS NULL THEN 1 ELSE 0 END)")
+    return f"SELECT {', '.join(measures)} FROM {table_name};"
+
+
+def check_changes(cursor, table_name, changes):
+    # -> row count; each change gets "measured" and "safe"
+    cursor.execute(measure_sql(table_name, changes))
+    row = cursor.fetchone()
+    rows = row[0] or 0
+    measured_values = iter(row[1:])
+    for change in changes:
+        if change["metadata_only"]:
+            # A longer column of the same type holds whatever is there
+            change["measured"], change["safe"] = None, True
+            continue
+        measured = next(measured_values)
+        base, size, _ = parse_type(change["to"])
+        change["measured"] = measured
+        if base in _STRING_TYPES:
+            change["safe"] = size == -1 or (measured or 0) <= size
+        else:
+            change["safe"] = not measured
+    return rows
+
+
+def estimate(rows, columns, changes, rebuild_min_passes=3, dependents=None):
+    rewrites = [change for change in changes if not change["metadata_only"]]
+    alter_cost = rows * len(rewrites)
+    rebuild_cost = rows * len(columns)
+    # What the copy would lose; any of it keeps the ALTERs
+    blockers = dict(dependents or {})
+    if any(column["identity"] for column in columns):
+        blockers["identity column"] = 1
+    if len(rewrites) >= rebuild_min_passes and not blockers:
+        strategy = "rebuild"
+    else:
+        strategy = "alter"
+    return {"rows": rows, "changes": len(changes), "rewrites": len(rewrites), "alter_cost": alter_cost,
+            "rebuild_cost": rebuild_cost, "strategy": strategy, "rebuild_blockers": blockers}
+
+
+def alter_statements(table_name, changes, primary_key=(None, [])):
+    statements = [f"ALTER TABLE {table_name} ALTER COLUMN [{change['column']}] {change['to']}"
+                  f"{'' if change['nullable'] else ' NOT NULL'};"
+                  for change in changes]
+    # A key column cannot be altered while the constraint depends on it
+    constraint, key_columns = primary_key
+    if any(change["column"] in key_columns for change in changes):
+        statements.insert(0, f"ALTER TABLE {table_name} DROP CONSTRAINT [{constraint}];")
+        statements.append(f"ALTER TABLE {table_name} ADD CONSTRAINT [{constraint}] PRIMARY KEY "
+                          f"({', '.join(f'[{name}]' for name in key_columns)});")
+    return statements
+
+
+def rebuild_statements(table_name, columns, changes, primary_key=(None, [])):
+    new_types = {change["column"]: change["to"] for change in changes}
+    new_table = f"{table_name}__migrate"
+    old_table = f"{table_name}__before_migrate"
+    definitions = [f"[{column['name']}] {new_types.get(column['name'], column['type'])}"
+                   f"{'' if column['nullable'] else ' NOT NULL'}"
+                   for column in columns]
+    column_list = ", ".join(f"[{column['name']}]" for column in columns)
+    select_list = ", ".join(f"CONVERT({new_types[column['name']]}, [{column['name']}])"
+                            if column["name"] in new_types else f"[{column['name']}]"
+                            for column in columns)
+    statements = [f"CREATE TABLE {new_table} ({', '.join(definitions)});",
+                  f"INSERT INTO {new_table} WITH (TABLOCK) ({column_list}) SELECT {select_list} FROM {table_name};"]
+    constraint, key_columns = primary_key
+    if key_columns:
+        statements.append(f"ALTER TABLE {table_name} DROP CONSTRAINT [{constraint}];")
+        statements.append(f"ALTER TABLE {new_table} ADD CONSTRAINT [{constraint}] PRIMARY KEY "
+                          f"({', '.join(f'[{name}]' for name in key_columns)});")
+    # The old table is renamed, not dropped: dropping it is the operator's
+    # call once the new one has been checked
+    statements += [f"IF (SELECT COUNT_BIG(*) FROM {new_table}) <> (SELECT COUNT_BIG(*) FROM {table_name}) "
+                   f"THROW 50000, 'Row counts differ after the copy', 1;",
+                   f"EXEC sp_rename '{table_name}', '{old_table}';",
+                   f"EXEC sp_rename '{new_table}', '{table_name}';"]
+    return statements
+
+
+def plan(cursor, table_name, desired, only_max=True, rebuild_min_passes=3):
+    columns = read_table_columns(cursor, table_name)
+    if not columns:
+        raise ValueError(f"Table {table_name} not found")
+    changes = plan_changes(columns, desired, only_max)
+    result = {"table": table_name, "columns": columns, "changes": changes, "unsafe": []}
+    if not changes:
+        result.update(estimate(0, columns, changes, rebuild_min_passes), statements=[])
+        return result
+    rows = check_changes(cursor, table_name, changes)
+    result["unsafe"] = [change for change in changes if not change["safe"]]
+    result.update(estimate(rows, columns, changes, rebuild_min_passes, read_dependents(cursor, table_name)))
+    primary_key = read_primary_key(cursor, table_name)
+    if result["strategy"] == "rebuild":
+        result["statements"] = rebuild_statements(table_name, columns, changes, primary_key)
+    else:
+        result["statements"] = alter_statements(table_name, changes, primary_key)
+    return result
+
+
+def execute(connection, statements):
+    cursor = connection.cursor()
+    connection.autocommit = False
+    try:
+        for idx, statement in enumerate(statements, start=1):
+            cursor.execute(statement)
+            print(f"Executed statement {idx}/{len(statements)}: {statement}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.autocommit = True
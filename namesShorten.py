@@ -1,8 +1,33 @@
 import os
 
-directory = os.getcwd()  # Get the current directory
 
-for filename in os.listdir(directory):
-    if filename.endswith(".csv"):
-        new_filename = filename.split(" ")[0] + ".csv"
-        os.rename(os.path.join(directory, filename), os.path.join(directory, new_filename))
+def short_name(filename):
+    # "case 2024-01-31 export.csv" -> "case.csv"; a name without a space is
+    # already short
+    if " " not in filename:
+        return filename
+    return filename.split(" ")[0] + ".csv"
+
+
+def shorten_names(directory=".", dry_run=False):
+    # -> [(old name, new name)] renamed (or that would be, for a dry run).
+    # A name another file already has is left alone rather than overwritten.
+    renamed = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".csv"):
+            continue
+        new_filename = short_name(filename)
+        if new_filename == filename:
+            continue
+        if os.path.exists(os.path.join(directory, new_filename)) or new_filename in dict(renamed).values():
+            print(f"[WARN] {filename}: {new_filename} already exists, not renamed.")
+            continue
+        if not dry_run:
+            os.rename(os.path.join(directory, filename), os.path.join(directory, new_filename))
+        renamed.append((filename, new_filename))
+    return renamed
+
+
+if __name__ == "__main__":
+    directory = os.getcwd()  # Get the current directory
+    shorten_names(directory)
@@ -0,0 +1,32 @@
+from typeinfer import to_parameters
+
+# Parameter batches for executemany, built a column at a time. Each column
+# is converted once to a list of Python values with None for missing (so
+# the server stores real NULLs, not the string "NULL"), and rows are then
+# assembled by zip() in C. The old path built a 2-D object array and a
+# tuple per row in Python after copying the frame with replace().
+
+
+def column_values(values, sql_type=None):
+    if sql_type is not None:
+        values = to_parameters(values, sql_type)
+    return values.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def columns_for(chunk, column_types=None):
+    columns = []
+    for i, name in enumerate(chunk.columns):
+        sql_type = column_types.get(name, "VARCHAR") if column_types is not None else None
+        columns.append(column_values(chunk.iloc[:, i], sql_type))
+    return columns
+
+
+def build_batch(chunk, column_types=None):
+    # pyodbc's executemany wants a real sequence of rows
+    return list(zip(*columns_for(chunk, column_types)))
+
+
+def iter_batch(chunk, column_types=None):
+    # For drivers that take any iterable (sqlite3): rows are produced as the
+    # driver consumes them, so the full row list never exists at once
+    return zip(*columns_for(chunk, column_types))
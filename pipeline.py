@@ -0,0 +1,433 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from autotune import ChunkTuner, current_rss
+from badrows import invalid_rows, row_lines
+from csvreader import read_chunks
+from metrics import NO_PROFILER, NULL_METRICS
+from params import build_batch
+
+# Bounded producer/consumer loader: a reader thread parses CSV chunks, a
+# converter thread turns them into parameter rows and one or more writer
+# threads push them through their own connection. The queues are bounded so
+# a slow stage applies backpressure instead of letting chunks pile up in RAM.
+
+_DONE = object()
+
+
+def _put(q, item, stop_event):
+    # Block on a full queue but give up as soon as another stage has failed
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop_event):
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def build_insert_sql(table_name, columns):
+    placeholders = ",".join("?" * len(columns))
+    column_list = ",".join([f"[{col}]" for col in columns])
+    return f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders})"
+
+
+def convert_chunk(chunk, column_types=None):
+    # With column_types the chunk was read as text and each column is
+    # converted to the target column's type; missing values become None
+    return build_batch(chunk, column_types)
+
+
+def open_writer(connect, fast_executemany=True):
+    conn = connect()
+    cursor = conn.cursor()
+    if fast_executemany:
+        try:
+            cursor.fast_executemany = True  # pyodbc only, other drivers ignore it
+        except AttributeError:
+            pass
+    return conn, cursor
+
+
+class ConnectionLost(Exception):
+    # rows_done rows of the batch are settled: rows_inserted of them are
+    # committed, the rest went to on_bad_row
+    def __init__(self, cause, rows_done=0, rows_inserted=0):
+        super().__init__(str(cause))
+        self.cause = cause
+        self.rows_done = rows_done
+        self.rows_inserted = rows_inserted
+
+
+# sqlite3 errors (and their extended codes) that mean the database file
+# went away, not that the statement was wrong
+SQLITE_CONNECTION_ERRORS = ("SQLITE_CANTOPEN", "SQLITE_IOERR", "SQLITE_NOTADB")
+
+
+def is_connection_error(e):
+    # Only a lost session, not any OperationalError: sqlite raises that for
+    # "database is locked" and "no such table" too, which no failover fixes.
+    # pyodbc puts the SQLSTATE first in args, class 08 is a connection error.
+    if isinstance(e, (ConnectionLost, ConnectionError)):
+        return True
+    state = e.args[0] if e.args else None
+    if isinstance(state, str) and state[:2] == "08" and len(state) == 5:
+        return True
+    if getattr(e, "sqlite_errorname", "").startswith(SQLITE_CONNECTION_ERRORS):
+        return True
+    return type(e).__name__ == "ProgrammingError" and "closed" in str(e).lower()
+
+
+def insert_bisect(conn, cursor, sql, rows, on_bad_row, offset=0):
+    # Insert what can be inserted from a batch the server rejected. Halves
+    # that go in are committed, halves that fail are split again, so k bad
+    # rows cost O(k log n) round trips instead of one per row. Every row
+    # before the slice being tried is settled, which is what ConnectionLost
+    # reports as done.
+    if not rows:
+        return 0
+    try:
+        cursor.executemany(sql, rows)
+        conn.commit()
+        return len(rows)
+    except ConnectionLost:
+        raise
+    except Exception as e:
+        if is_connection_error(e):
+            raise ConnectionLost(e, offset)
+        try:
+            conn.rollback()
+        except Exception as rollback_error:
+            # A session that cannot roll back is gone, whatever the insert
+            # error said; the halves already committed stay done
+            raise ConnectionLost(rollback_error, offset)
+        if len(rows) == 1:
+            on_bad_row(offset, rows[0], e)
+            return 0
+    middle = len(rows) // 2
+    inserted = insert_bisect(conn, cursor, sql, rows[:middle], on_bad_row, offset)
+    try:
+        return inserted + insert_bisect(conn, cursor, sql, rows[middle:], on_bad_row, offset + middle)
+    except ConnectionLost as lost:
+        lost.rows_inserted += inserted
+        raise
+
+
+def read_loader_config(config, args=None):
+    # [LOADER] in config.ini supplies the defaults, command line flags win
+    section = config['LOADER'] if config.has_section('LOADER') else {}
+    settings = {
+        "workers": int(section.get('Workers', 1)),
+        "commit_every": int(section.get('CommitEvery', 1)),
+        "queue_size": int(section.get('QueueSize', 4)),
+        # Processes parsing byte ranges of the file, 1 parses in the reader thread
+        "read_workers": int(section.get('ReadWorkers', 1)),
+        # "auto" sizes chunks from measured commit latency, a number fixes it
+        "chunk_size": section.get('ChunkSize', 'auto'),
+        "target_commit_seconds": float(section.get('TargetCommitSeconds', 2.0)),
+        "memory_limit_mb": int(section.get('MemoryLimitMB', 0)) or None,
+        "backend": section.get('Backend', 'executemany'),
+        "staging_dir": section.get('StagingDir'),
+        "server_staging_dir": section.get('ServerStagingDir'),
+        "batch_size": int(section.get('BatchSize', 100000)),
+        "tablock": section.get('Tablock', 'yes').lower() in ('1', 'yes', 'true', 'on'),
+    }
+    if args is not None:
+        for key in settings:
+            value = getattr(args, key, None)
+            if value is not None:
+                settings[key] = value
+    return settings
+
+
+def load_csv(csv_file, table_name, connect, chunk_size=50000, writers=1, queue_size=4,
+             commit_every=1, fast_executemany=True, chunk_hook=None, on_progress=None, on_commit=None,
+             chunks=None, start_offset=None, start_index=0, start_line=None, column_types=None, cache=None,
+             column_limits=None, quarantine=None, metrics=None, profiler=None, read_workers=1, projection=None):
+    # metrics (metrics.Metrics) gets per-stage latencies and counters,
+    # profiler (metrics.ChunkProfiler) profiles one chunk through each stage,
+    # projection (projection.projection_for) picks, renames and filters
+    # columns and rows as the file is read
+    metrics = NULL_METRICS if metrics is None else metrics
+    profiler = NO_PROFILER if profiler is None else profiler
+    stop_event = threading.Event()
+    parsed_queue = queue.Queue(maxsize=queue_size)
+    rows_queue = queue.Queue(maxsize=queue_size)
+    # Uncommitted chunks of a writer that died, picked up by the survivors
+    retry_queue = queue.Queue()
+    # Set once every converted chunk is in rows_queue. Writers stop on it
+    # rather than on a sentinel each: a dead writer would never take its
+    # sentinel and leave the converter blocked on the full queue.
+    converted = threading.Event()
+    errors = []
+    lock = threading.Lock()
+    stats = {"rows": 0, "chunks": 0, "read_seconds": 0.0, "convert_seconds": 0.0, "write_seconds": 0.0,
+             "workers": [], "retried_chunks": 0, "quarantined": 0, "filtered": 0}
+    alive_writers = [writers]
+    # A ChunkTuner as chunk_size is fed parse and commit timings
+    tuner = chunk_size if isinstance(chunk_size, ChunkTuner) else None
+
+    def bad_row(line, error, values, columns):
+        with lock:
+            stats["quarantined"] += 1
+        metrics.count("rows_quarantined")
+        if quarantine is not None:
+            quarantine.add(line, error, values, columns)
+        else:
+            print(f"Problematic row (line {line}): {error}: {list(values)}")
+
+    def fail(e):
+        with lock:
+            errors.append(e)
+        stop_event.set()
+
+    def reader():
+        try:
+            if chunks is not None:
+                chunk_iter = (({"index": i}, chunk) for i, chunk in enumerate(chunks, start_index))
+            else:
+                # With target types known, read raw text and let the converter type it
+                read_args = {"dtype": str} if column_types is not None else {}
+                chunk_iter = read_chunks(csv_file, chunk_size, start_offset, start_index, start_line, cache=cache,
+                                         workers=read_workers, projection=projection, **read_args)
+            next_index = start_index
+            start_time = time.perf_counter()
+            while True:
+                with profiler.profile(next_index, "read"):
+                    chunk = next(chunk_iter, None)
+                if chunk is None:
+                    break
+                next_index = chunk[0]["index"] + 1
+                parse_seconds = time.perf_counter() - start_time
+                stats["read_seconds"] += parse_seconds
+                metrics.observe("read_seconds", parse_seconds)
+                metrics.count("rows_read", len(chunk[1]))
+                if chunk[0].get("filtered"):
+                    stats["filtered"] += chunk[0]["filtered"]
+                    metrics.count("rows_filtered", chunk[0]["filtered"])
+                if tuner is not None:
+                    tuner.observe_parse(len(chunk[1]), parse_seconds)
+                if not _put(parsed_queue, chunk, stop_event):
+                    return
+                start_time = time.perf_counter()
+            _put(parsed_queue, _DONE, stop_event)
+        except Exception as e:
+            fail(e)
+
+    def converter():
+        try:
+            while True:
+                chunk = _get(parsed_queue, stop_event)
+                if chunk is _DONE:
+                    break
+                position, chunk = chunk
+                start_time = time.perf_counter()
+                with profiler.profile(position["index"], "convert"):
+                    if chunk_hook is not None:
+                        chunk_hook(chunk)
+                    lines = row_lines(position, len(chunk))
+                    if column_limits is not None or column_types is not None:
+                        # Rows the target would reject, or whose values would
+                        # not convert to its types, never reach the server
+                        reasons = invalid_rows(chunk, column_limits, column_types)
+                        if reasons:
+                            bad = sorted(reasons)
+                            for i, values in zip(bad, chunk.iloc[bad].to_numpy(dtype=object, na_value=None)):
+                                bad_row(lines[i] if lines is not None else None, reasons[i], values, chunk.columns)
+                            keep = np.ones(len(chunk), dtype=bool)
+                            keep[bad] = False
+                            chunk = chunk.iloc[keep]
+                            lines = lines[keep] if lines is not None else None
+                    position = dict(position, row_lines=lines, columns=list(chunk.columns))
+                    sql = build_insert_sql(table_name, chunk.columns)
+                    rows = convert_chunk(chunk, column_types)
+                convert_seconds = time.perf_counter() - start_time
+                stats["convert_seconds"] += convert_seconds
+                metrics.observe("convert_seconds", convert_seconds)
+                if not _put(rows_queue, (position, sql, rows), stop_event):
+                    return
+            converted.set()
+        except Exception as e:
+            fail(e)
+
+    def next_item():
+        while not stop_event.is_set():
+            try:
+                return retry_queue.get_nowait()
+            except queue.Empty:
+                pass
+            # Checked before the get, so an item put just ahead of the
+            # event is still taken
+            finished = converted.is_set()
+            try:
+                return rows_queue.get(timeout=0.1)
+            except queue.Empty:
+                if finished and retry_queue.empty():
+                    return _DONE
+        return _DONE
+
+    def writer(worker_id):
+        worker = {"worker": worker_id, "rows": 0, "chunks": 0, "commits": 0, "seconds": 0.0,
+                  "rows_per_second": 0.0, "failed": False, "error": None}
+        with lock:
+            stats["workers"].append(worker)
+        conn = cursor = None
+        pending = []
+        item = None
+        # Time spent executing the open transaction, for the tuner
+        pending_seconds = [0.0]
+
+        def record(committed, chunk_count):
+            with lock:
+                worker["rows"] += committed
+                worker["chunks"] += chunk_count
+                worker["commits"] += 1
+                stats["rows"] += committed
+                stats["chunks"] += chunk_count
+            metrics.count("rows_written", committed)
+            metrics.count("chunks_written", chunk_count)
+            metrics.count("commits")
+            if on_progress is not None and committed:
+                on_progress(committed)
+
+        def commit():
+            start_time = time.perf_counter()
+            with profiler.profile(pending[-1][0]["index"] if pending else None, "commit"):
+                conn.commit()
+            metrics.observe("commit_seconds", time.perf_counter() - start_time)
+            committed = sum(len(rows) for _, _, rows in pending)
+            if tuner is not None and pending_seconds[0]:
+                tuner.observe_commit(committed, len(pending),
+                                     pending_seconds[0] + time.perf_counter() - start_time)
+            pending_seconds[0] = 0.0
+            if metrics.enabled:
+                metrics.gauge("rss_bytes", current_rss())
+                if tuner is not None:
+                    metrics.gauge("chunk_size", tuner.size)
+            record(committed, len(pending))
+            if on_commit is not None:
+                for position, _, rows in pending:
+                    on_commit(position, len(rows))
+            pending.clear()
+
+        try:
+            conn, cursor = open_writer(connect, fast_executemany)
+            while True:
+                item = next_item()
+                if item is _DONE:
+                    break
+                position, sql, rows = item
+                start_time = time.perf_counter()
+                try:
+                    if rows:
+                        with profiler.profile(position["index"], "execute"):
+                            cursor.executemany(sql, rows)
+                    execute_seconds = time.perf_counter() - start_time
+                    metrics.observe("execute_seconds", execute_seconds)
+                    pending_seconds[0] += execute_seconds
+                    pending.append(item)
+                    item = None
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    print(f"[ERROR] Worker {worker_id} failed to insert a chunk: {e}")
+                    metrics.count("insert_errors")
+                    # The rollback takes the earlier uncommitted chunks with it,
+                    # replay them before falling back to row-by-row inserts
+                    conn.rollback()
+                    pending_seconds[0] = 0.0
+                    for _, pending_sql, pending_rows in pending:
+                        cursor.executemany(pending_sql, pending_rows)
+                    commit()
+                    def bad_batch_row(i, row, error):
+                        lines = position["row_lines"]
+                        bad_row(lines[i] if lines is not None else None, error, row, position["columns"])
+
+                    record(insert_bisect(conn, cursor, sql, rows, bad_batch_row), 1)
+                    if on_commit is not None:
+                        on_commit(position, len(rows))
+                    item = None
+                if len(pending) >= commit_every:
+                    commit()
+                worker["seconds"] += time.perf_counter() - start_time
+            if pending:
+                start_time = time.perf_counter()
+                commit()
+                worker["seconds"] += time.perf_counter() - start_time
+        except Exception as e:
+            if isinstance(e, ConnectionLost) and item is not None:
+                # Rows settled by the bisection before the link dropped are committed
+                lines = item[0]["row_lines"]
+                position = dict(item[0], row_lines=lines[e.rows_done:] if lines is not None else None)
+                item = (position, item[1], item[2][e.rows_done:])
+                record(e.rows_inserted, 0)
+            print(f"[ERROR] Worker {worker_id} stopped: {e}")
+            worker["failed"] = True
+            worker["error"] = str(e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            # Everything committed so far stays committed; only the chunks of
+            # the open transaction go back for another worker to insert
+            requeue = pending + ([item] if item is not None and item is not _DONE else [])
+            for lost in requeue:
+                retry_queue.put(lost)
+            metrics.count("writer_failures")
+            metrics.count("chunks_retried", len(requeue))
+            with lock:
+                stats["retried_chunks"] += len(requeue)
+                alive_writers[0] -= 1
+                last_writer = alive_writers[0] == 0
+            if last_writer:
+                fail(e)
+        finally:
+            if worker["seconds"]:
+                worker["rows_per_second"] = worker["rows"] / worker["seconds"]
+            with lock:
+                stats["write_seconds"] += worker["seconds"]
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+    threads = [threading.Thread(target=reader, name="csv-reader"),
+               threading.Thread(target=converter, name="csv-converter")]
+    threads += [threading.Thread(target=writer, args=(i,), name=f"sql-writer-{i}") for i in range(writers)]
+
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # A writer can die after the others have already drained the queue
+    if not errors and not retry_queue.empty():
+        threads = [threading.Thread(target=writer, args=(writers,), name="sql-writer-recovery")]
+        alive_writers[0] = 1
+        threads[0].start()
+        threads[0].join()
+
+    stats["elapsed_seconds"] = time.perf_counter() - start_time
+    stats["rows_per_second"] = stats["rows"] / stats["elapsed_seconds"] if stats["elapsed_seconds"] else 0.0
+    stats["workers"].sort(key=lambda w: w["worker"])
+    if tuner is not None:
+        stats["chunk_size"] = tuner.size
+        stats["chunk_size_decisions"] = tuner.decisions
+        stats["peak_rss_mb"] = round(tuner.peak_rss / 1024 / 1024, 1)
+
+    if errors:
+        raise errors[0]
+    return stats
@@ -0,0 +1,185 @@
+import re
+
+from badrows import row_lines
+from ddl import rule_for
+
+# Which CSV columns go into a table, under what names, and which rows. Our
+# exports carry a few hundred columns and a table takes a fraction of them,
+# so the mapping is applied while reading: only the mapped columns (plus
+# the ones the filter looks at) are parsed at all, the filter drops rows
+# before they are queued, and the loaders, DDL and checks downstream only
+# ever see target columns. Mappings live in the same config.ini sections
+# as the DDL rules (see ddl.py):
+#
+#   [TABLE:contact]
+#   Columns =
+#       Contact ID -> Id
+#       First Name -> FirstName
+#       Email
+#   Transforms =
+#       FirstName: strip, title
+#       Email: strip, lower, null_if_empty
+#   Filter = `Record Status` == 'Active' and `Is Deleted` != 'true'
+#
+# Columns is "CSV name -> target name" (or just the name), one per line or
+# comma separated; without it every column is kept. Transforms are keyed
+# by target column (one per line, or separated by semicolons) and run in
+# order on the column's text. Filter is a pandas expression over the CSV
+# columns, which must be quoted in backticks; values are compared as text.
+
+TRANSFORMS = {
+    "strip": lambda values: values.str.strip(),
+    "lower": lambda values: values.str.lower(),
+    "upper": lambda values: values.str.upper(),
+    "title": lambda values: values.str.title(),
+    "squeeze": lambda values: values.str.replace(r"\s+", " ", regex=True),
+    "digits": lambda values: values.str.replace(r"\D+", "", regex=True),
+    "null_if_empty": lambda values: values.mask(values.str.strip() == ""),
+    "left": lambda values, length: values.str.slice(0, int(length)),
+    "replace": lambda values, old, new="": values.str.replace(old, new, regex=False),
+    "default": lambda values, value: values.fillna(value),
+}
+
+
+def _entries(value):
+    # One entry per line, or comma separated when it fits on one line
+    if not value or not value.strip():
+        return []
+    value = value.strip()
+    parts = value.splitlines() if "\n" in value else value.split(",")
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_columns(value):
+    # -> [(csv column, target column)]
+    columns = []
+    for entry in _entries(value):
+        source, _, target = entry.partition("->")
+        columns.append((source.strip(), (target or source).strip()))
+    targets = [target for _, target in columns]
+    duplicates = sorted({target for target in targets if targets.count(target) > 1})
+    if duplicates:
+        raise ValueError(f"Columns maps more than one CSV column to {', '.join(duplicates)}")
+    return columns
+
+
+def parse_transforms(value):
+    # "Email: strip, left(100)" -> {"Email": [("strip", []), ("left", ["100"])]}
+    transforms = {}
+    value = (value or "").strip()
+    # One column per line, or semicolon separated on one line: the steps
+    # of a column are already comma separated
+    for entry in value.splitlines() if "\n" in value else value.split(";"):
+        if not entry.strip():
+            continue
+        target, _, steps = entry.partition(":")
+        parsed = []
+        for name, args in re.findall(r"(\w+)\s*(?:\(([^)]*)\))?", steps):
+            if name not in TRANSFORMS:
+                raise ValueError(f"Unknown transform {name!r} for {target.strip()}, "
+                                 f"expected one of {', '.join(sorted(TRANSFORMS))}")
+            parsed.append((name, [arg.strip().strip("'\"") for arg in args.split(",")] if args else []))
+        transforms[target.strip()] = parsed
+    return transforms
+
+
+def make_projection(columns=None, transforms=None, filter=None):
+    mapping = parse_columns(columns) if isinstance(columns, str) else list(columns or [])
+    transforms = parse_transforms(transforms) if isinstance(transforms, str) else dict(transforms or {})
+    filter = (filter or "").strip() or None
+    filter_columns = re.findall(r"`([^`]+)`", filter or "")
+    sources = {target: source for source, target in mapping}
+    if mapping:
+        unknown = sorted(set(transforms) - set(sources))
+        if unknown:
+            raise ValueError(f"Transforms name columns that are not mapped: {', '.join(unknown)}")
+        read_columns = [source for source, _ in mapping]
+        read_columns += [name for name in dict.fromkeys(filter_columns) if name not in read_columns]
+    else:
+        read_columns = None
+    # Transforms and the filter work on text, whatever the reader infers
+    text_columns = list(dict.fromkeys([sources.get(target, target) for target in transforms] + filter_columns))
+    return {"columns": mapping, "transforms": transforms, "filter": filter, "read_columns": read_columns,
+            "text_columns": text_columns}
+
+
+def read_projections(config):
+    # -> [(pattern, projection)] for the [TABLE:...] sections that map
+    # columns, transform them or filter rows
+    projections = []
+    for section in config.sections():
+        if not section.upper().startswith("TABLE:"):
+            continue
+        values = config[section]
+        if not any(values.get(key, "").strip() for key in ("Columns", "Transforms", "Filter")):
+            continue
+        try:
+            projection = make_projection(values.get("Columns"), values.get("Transforms"), values.get("Filter"))
+        except ValueError as e:
+            raise ValueError(f"[{section}] {e}") from None
+        projections.append((section.split(":", 1)[1].strip(), projection))
+    return projections
+
+
+def projection_for(table_name, projections):
+    # None when the table takes the CSV as it is
+    return rule_for(table_name, projections, default=None)
+
+
+def read_args(projection, read_csv_kwargs):
+    # The read_csv arguments that push the projection into the parser: only
+    # the needed columns, and transformed ones as text
+    read_csv_kwargs = dict(read_csv_kwargs)
+    if projection["read_columns"] is not None:
+        read_csv_kwargs["usecols"] = projection["read_columns"]
+    dtype = read_csv_kwargs.get("dtype")
+    if dtype is not str and projection["text_columns"]:
+        read_csv_kwargs["dtype"] = dict(dtype or {}, **{name: str for name in projection["text_columns"]})
+    return read_csv_kwargs
+
+
+def project(position, chunk, projection):
+    # -> (position, chunk) with the filter, mapping and transforms applied.
+    # Dropped rows keep the line numbers of the rest right for quarantine
+    # and reports; position["filtered"] says how many were dropped.
+    if projection["filter"] is not None:
+        keep = chunk.eval(projection["filter"])
+        keep = keep.fillna(False).to_numpy(dtype=bool)
+        if not keep.all():
+            lines = row_lines(position, len(chunk))
+            chunk = chunk[keep].reset_index(drop=True)
+            position = dict(position, filtered=int((~keep).sum()),
+                            line_starts=lines[keep].tolist() if lines is not None else None)
+    if projection["columns"]:
+        chunk = chunk[[source for source, _ in projection["columns"]]]
+        chunk = chunk.set_axis([target for _, target in projection["columns"]], axis=1)
+    if projection["transforms"]:
+        chunk = chunk.copy()
+        for target, steps in projection["transforms"].items():
+            values = chunk[target]
+            for name, args in steps:
+                values = TRANSFORMS[name](values, *args)
+            chunk[target] = values
+    return position, chunk
+
+
+def project_types(column_types, projection):
+    # {csv column: sql type} -> {target column: sql type}, for DDL and
+    # type changes of a projected table
+    if projection is None or not projection["columns"]:
+        return dict(column_types)
+    missing = [source for source, _ in projection["columns"] if source not in column_types]
+    if missing:
+        raise ValueError(f"Mapped columns {', '.join(missing)} are not in the CSV")
+    return {target: column_types[source] for source, target in projection["columns"]}
+
+
+def describe(projection, table_name):
+    parts = []
+    if projection["columns"]:
+        parts.append(f"{len(projection['columns'])} mapped columns")
+    if projection["transforms"]:
+        parts.append(f"transforms on {len(projection['transforms'])}")
+    if projection["filter"] is not None:
+        parts.append(f"rows where {projection['filter']}")
+    return f"[INFO] {table_name}: {', '.join(parts)} ([TABLE:...] in config.ini)."
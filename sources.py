@@ -0,0 +1,221 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+import zipfile
+
+try:
+    from isal import igzip as gzip_module  # same API as gzip, several times faster inflate
+except ImportError:
+    gzip_module = gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# CSV inputs that are not plain files: .csv.gz / .csv.zst / .csv.bz2 /
+# .csv.xz, and members of zip archives, named "<archive>.zip::<member>".
+# They are streamed straight from the compressed file, never extracted to
+# disk. A background thread decompresses ahead of the reader (zlib, bz2,
+# lzma and zstd release the GIL while they work), so inflating the next
+# blocks overlaps with parsing the current one.
+#
+# Offsets in chunk positions stay offsets into the decompressed CSV, so
+# checkpoints work unchanged (resuming decompresses up to the offset without
+# parsing it). Positions from compressed inputs also carry compressed_end,
+# how far into the compressed file the chunk ended, for progress reporting
+# without a counting pass.
+
+MEMBER_SEPARATOR = "::"
+CODECS = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2", ".xz": "xz"}
+
+
+def split_member(path):
+    # "exports.zip::case.csv" -> ("exports.zip", "case.csv")
+    if MEMBER_SEPARATOR in path:
+        archive, member = path.split(MEMBER_SEPARATOR, 1)
+        return archive, member
+    return path, None
+
+
+def codec(path):
+    archive, member = split_member(path)
+    if member is not None:
+        return "zip"
+    return CODECS.get(os.path.splitext(path)[1].lower())
+
+
+def is_compressed(path):
+    return codec(path) is not None
+
+
+def archive_path(path):
+    # The file on disk: what to stat and hash
+    return split_member(path)[0]
+
+
+def input_stat(path):
+    return os.stat(archive_path(path))
+
+
+def sidecar_base(path):
+    # Where a CSV's profile, checkpoint, quarantine and delta index live:
+    # next to the file, or next to the archive for a zip member
+    archive, member = split_member(path)
+    if member is None:
+        return path
+    return f"{archive}.{member.replace('/', '_').replace(chr(92), '_')}"
+
+
+def csv_name(path):
+    # "exports.zip::2024/case.csv" and "case.csv.gz" -> "case.csv"
+    archive, member = split_member(path)
+    name = os.path.basename(member.replace("\\", "/")) if member is not None else os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    return stem if ext.lower() in CODECS else name
+
+
+def compressed_size(path):
+    archive, member = split_member(path)
+    if member is not None:
+        with zipfile.ZipFile(archive) as zf:
+            return zf.getinfo(member).compress_size
+    return os.path.getsize(path)
+
+
+def find_inputs(directory=".", suffix=".csv"):
+    # Plain and compressed CSVs in a directory, plus the CSV members of every
+    # zip archive in it
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name) if directory != "." else name
+        lower = name.lower()
+        if lower.endswith(suffix) or any(lower.endswith(suffix + ext) for ext in CODECS):
+            paths.append(path)
+        elif lower.endswith(".zip"):
+            paths.extend(zip_members(path, suffix))
+    return paths
+
+
+def zip_members(archive, suffix=".csv"):
+    with zipfile.ZipFile(archive) as zf:
+        return [f"{archive}{MEMBER_SEPARATOR}{info.filename}" for info in zf.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(suffix)]
+
+
+class DecompressedStream(io.RawIOBase):
+    def __init__(self, stream, offset, closers, block_size=4 << 20, depth=4):
+        # offset() -> compressed bytes consumed so far
+        self.stream = stream
+        self.offset = offset
+        self.closers = closers
+        self.block_size = block_size
+        self.blocks = queue.Queue(depth)
+        self.stop_event = threading.Event()
+        self.block = b""
+        self.block_pos = 0
+        self.position = 0
+        self.compressed_offset = 0
+        self.eof = False
+        self.thread = threading.Thread(target=self._fill, name="decompress", daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        try:
+            while True:
+                data = self.stream.read(self.block_size)
+                if not self._put((data, self.offset(), None)) or not data:
+                    return
+        except Exception as e:
+            self._put((b"", None, e))
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.block_pos >= len(self.block):
+            if self.eof:
+                return 0
+            data, offset, error = self.blocks.get()
+            if error is not None:
+                raise error
+            if not data:
+                self.eof = True
+                return 0
+            self.block, self.block_pos, self.compressed_offset = data, 0, offset
+        n = min(len(buffer), len(self.block) - self.block_pos)
+        buffer[:n] = self.block[self.block_pos:self.block_pos + n]
+        self.block_pos += n
+        self.position += n
+        return n
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.stop_event.set()
+            self.thread.join()
+            for close in self.closers:
+                close()
+        super().close()
+
+
+def open_input(path):
+    # -> a binary file object positioned at the start of the CSV text
+    kind = codec(path)
+    if kind is None:
+        return open(path, 'rb')
+    if kind == "zip":
+        archive, member = split_member(path)
+        zf = zipfile.ZipFile(archive)
+        info = zf.getinfo(member)
+        stream = zf.open(info)
+        # The archive file sits just past the compressed bytes read so far
+        offset = lambda: min(max(zf.fp.tell() - info.header_offset, 0), info.compress_size)
+        closers = [stream.close, zf.close]
+    else:
+        raw = open(path, 'rb')
+        if kind == "gzip":
+            stream = gzip_module.GzipFile(fileobj=raw, mode='rb')
+        elif kind == "bz2":
+            stream = bz2.BZ2File(raw, mode='rb')
+        elif kind == "xz":
+            stream = lzma.LZMAFile(raw, mode='rb')
+        else:
+            if zstandard is None:
+                raise ImportError(f"Reading {path} needs the zstandard package (pip install zstandard)")
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        offset = raw.tell
+        closers = [stream.close, raw.close]
+    return io.BufferedReader(DecompressedStream(stream, offset, closers), buffer_size=1 << 20)
+
+
+def compressed_offset(f):
+    # Compressed bytes behind what has been read from an open_input() stream,
+    # None for a plain file
+    raw = getattr(f, "raw", None)
+    return raw.compressed_offset if isinstance(raw, DecompressedStream) else None
+
+
+def skip_to(f, offset, block_size=4 << 20):
+    # Seek for streams that can only go forward
+    if f.seekable():
+        f.seek(offset)
+        return
+    while f.tell() < offset:
+        if not f.read(min(block_size, offset - f.tell())):
+            break
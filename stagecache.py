@@ -0,0 +1,219 @@
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from checkpoint import file_hash
+from csvreader import iter_record_blocks, parse_block_arrow
+from sources import archive_path, input_stat, split_member
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
+# Columnar staging cache for CSV files. The first read of a file parses it
+# once into an Arrow IPC file (one record batch per chunk, every column kept
+# as text) under <cache dir>/<content hash>/. Later reads memory-map that
+# file and hand out the batches as DataFrames without touching the CSV
+# parser. Entries are keyed by the file's content hash, so a renamed copy
+# hits the cache and an edited file misses it. The cache is trimmed to
+# max_size_mb, least recently used entry first.
+#
+# Next to the batches the entry keeps every row's byte offset and line
+# number in the CSV, so chunks are cut at whatever size the caller asks for
+# (a ChunkTuner included) with exact positions, and a resume starts at the
+# committed offset's row rather than at the batch around it.
+#
+# Only text reads (dtype=str) are served from the cache; anything asking
+# pandas to infer types reads the CSV as before.
+
+
+def path_key(csv_file):
+    return hashlib.blake2b(os.path.abspath(csv_file).encode(), digest_size=16).hexdigest()
+
+
+# Entries built before the row offsets were kept are rebuilt
+CACHE_VERSION = 2
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class StagingCache:
+    def __init__(self, cache_dir=".csvcache", max_size_mb=20480, chunk_size=50000):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "paths"), exist_ok=True)
+
+    def content_key(self, csv_file, encoding='utf-8'):
+        # Hashing the file is a fraction of the cost of parsing it, and is
+        # skipped altogether while the file's size and mtime are unchanged
+        stat = input_stat(csv_file)
+        pointer = os.path.join(self.cache_dir, "paths", path_key(csv_file) + ".json")
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                saved = json.load(f)
+            if saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime:
+                return saved["key"]
+        key = f"{file_hash(archive_path(csv_file))}-{encoding}"
+        member = split_member(csv_file)[1]
+        if member is not None:
+            # Members of one archive share its hash
+            key = f"{key}-{hashlib.blake2b(member.encode(), digest_size=8).hexdigest()}"
+        with open(pointer + ".tmp", 'w') as f:
+            json.dump({"file": os.path.abspath(csv_file), "size": stat.st_size, "mtime": stat.st_mtime,
+                       "key": key}, f)
+        os.replace(pointer + ".tmp", pointer)
+        return key
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, csv_file, encoding='utf-8'):
+        entry = self.entry_dir(self.content_key(csv_file, encoding))
+        manifest = os.path.join(entry, "manifest.json")
+        if not os.path.exists(manifest):
+            return None
+        with open(manifest) as f:
+            saved = json.load(f)
+        if saved.get("version") != CACHE_VERSION:
+            return None
+        os.utime(manifest)  # last use, for eviction
+        return entry, saved
+
+    def build(self, csv_file, encoding='utf-8'):
+        key = self.content_key(csv_file, encoding)
+        entry = self.entry_dir(key)
+        tmp_entry = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_entry, exist_ok=True)
+        manifest = {"key": key, "version": CACHE_VERSION, "source": os.path.abspath(csv_file),
+                    "encoding": encoding, "rows": 0, "batches": [], "built": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        writer = None
+        # Row i starts at byte row_starts[i] on line row_lines[i]; one more
+        # entry each for the end of the file
+        row_starts = array('q')
+        row_lines = array('q')
+        try:
+            with open(os.path.join(tmp_entry, "data.arrow"), 'wb') as sink:
+                for position, header, block in iter_record_blocks(csv_file, self.chunk_size, record_starts=True):
+                    table = parse_block_arrow(header, block, encoding).combine_chunks()
+                    if writer is None:
+                        writer = pa_ipc.new_file(sink, table.schema)
+                        manifest["columns"] = table.column_names
+                    writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+                    manifest["rows"] += table.num_rows
+                    row_starts.extend(position.pop("record_starts"))
+                    row_lines.extend(position["line_starts"] or
+                                     range(position["first_line"], position["next_line"]))
+                    manifest["batches"].append(dict(position, line_starts=None))
+                if writer is not None:
+                    writer.close()
+            if manifest["batches"]:
+                row_starts.append(manifest["batches"][-1]["end"])
+                row_lines.append(manifest["batches"][-1]["next_line"])
+            np.save(os.path.join(tmp_entry, "row_starts.npy"), np.frombuffer(row_starts, dtype=np.int64))
+            np.save(os.path.join(tmp_entry, "row_lines.npy"), np.frombuffer(row_lines, dtype=np.int64))
+            with open(os.path.join(tmp_entry, "manifest.json"), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            if os.path.exists(entry) and self.lookup(csv_file, encoding) is not None:
+                # Another reader built the same file meanwhile
+                shutil.rmtree(tmp_entry)
+            else:
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp_entry, entry)
+        except BaseException:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return entry, manifest
+
+    def evict(self, keep=None):
+        if not self.max_size:
+            return []
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                manifest = os.path.join(self.cache_dir, name, "manifest.json")
+                if name != "paths" and os.path.exists(manifest):
+                    size = dir_size(os.path.join(self.cache_dir, name))
+                    entries.append((os.path.getmtime(manifest), name, size))
+            total = sum(size for _, _, size in entries)
+            evicted = []
+            for _, name, size in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if name == keep:
+                    continue
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                total -= size
+                evicted.append(name)
+            if evicted:
+                print(f"[INFO] Staging cache over {self.max_size // (1024 * 1024)} MB, "
+                      f"evicted {len(evicted)} entries.")
+            return evicted
+
+    def read_chunks(self, csv_file, chunk_size=50000, start_offset=None, start_index=0, encoding='utf-8',
+                    columns=None):
+        # Same (position, chunk) pairs as csvreader.read_chunks, or None when
+        # start_offset is not where a row starts (a checkpoint from another
+        # reader) and the CSV has to be read instead. columns selects from
+        # the memory-mapped table, so the others are never converted to pandas.
+        cached = self.lookup(csv_file, encoding)
+        if cached is None:
+            print(f"[INFO] Staging {csv_file} into the columnar cache...")
+            cached = self.build(csv_file, encoding)
+        entry, manifest = cached
+        row_starts = np.load(os.path.join(entry, "row_starts.npy"), mmap_mode='r')
+        row = 0
+        if start_offset and manifest["rows"]:
+            row = int(np.searchsorted(row_starts, start_offset))
+            if row > manifest["rows"] or row_starts[row] != start_offset:
+                print(f"[WARN] {csv_file}: offset {start_offset} is not a row start in the staging cache, "
+                      f"reading the CSV.")
+                return None
+        return self._chunks(entry, manifest, row_starts, row, chunk_size, start_index, columns)
+
+    def _chunks(self, entry, manifest, row_starts, row, chunk_size, index, columns):
+        row_lines = np.load(os.path.join(entry, "row_lines.npy"), mmap_mode='r')
+        batch_ends = [batch["end"] for batch in manifest["batches"]]
+        with pa.memory_map(os.path.join(entry, "data.arrow")) as source:
+            table = pa_ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select(list(columns))
+            while row < manifest["rows"]:
+                size = chunk_size() if callable(chunk_size) else chunk_size
+                end_row = min(row + size, manifest["rows"])
+                lines = row_lines[row:end_row + 1]
+                position = {"index": index, "start": int(row_starts[row]), "end": int(row_starts[end_row]),
+                            "first_line": int(lines[0]), "next_line": int(lines[-1]), "records": end_row - row,
+                            # Per-record start lines, only kept once a record spans lines
+                            "line_starts": lines[:-1].tolist() if lines[-1] - lines[0] != end_row - row else None}
+                batch = manifest["batches"][bisect.bisect_left(batch_ends, position["end"])]
+                if "compressed_end" in batch:
+                    position["compressed_end"] = batch["compressed_end"]
+                yield position, table.slice(row, end_row - row).to_pandas()
+                row = end_row
+                index += 1
+
+
+def open_cache(config):
+    # [CACHE] in config.ini: Enabled, Dir, MaxSizeMB. None when the cache is
+    # off or pyarrow is not installed.
+    section = config['CACHE'] if config.has_section('CACHE') else {}
+    if section.get('Enabled', 'no').lower() not in ('1', 'yes', 'true', 'on'):
+        return None
+    if pa is None:
+        print("[WARN] The staging cache needs pyarrow, reading CSV files directly.")
+        return None
+    return StagingCache(section.get('Dir', '.csvcache'), int(section.get('MaxSizeMB', 20480)))
@@ -0,0 +1,105 @@
+import time
+import unicodedata
+
+import pandas as pd
+
+# Lazy chunk pipelines. Every stage is a generator that pulls one chunk from
+# the stage before it, so only a chunk per stage is alive at any time no
+# matter how large the file is. Stages count the rows going in and out and
+# the time spent in their own transform.
+
+
+class Stage:
+    def __init__(self, name, transform=None):
+        self.name = name
+        self.transform = transform
+        self.chunks = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.seconds = 0.0
+
+    def __call__(self, chunks):
+        # Without a transform the stage is the source and times the reads
+        chunks = iter(chunks)
+        while True:
+            start_time = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            self.rows_in += len(chunk)
+            if self.transform is not None:
+                start_time = time.perf_counter()
+                chunk = self.transform(chunk)
+            self.rows_out += len(chunk)
+            self.chunks += 1
+            self.seconds += time.perf_counter() - start_time
+            yield chunk
+
+    def stats(self):
+        return {"stage": self.name, "chunks": self.chunks, "rows_in": self.rows_in, "rows_out": self.rows_out,
+                "seconds": self.seconds}
+
+
+def run_pipeline(chunks, stages):
+    for stage in stages:
+        chunks = stage(chunks)
+    return chunks
+
+
+def _string_columns(chunk):
+    return [name for name in chunk.columns if chunk[name].dtype == object or pd.api.types.is_string_dtype(chunk[name])]
+
+
+def trim(chunk):
+    # Leading/trailing whitespace in headers and text cells
+    chunk = chunk.rename(columns=lambda name: name.strip() if isinstance(name, str) else name)
+    for name in _string_columns(chunk):
+        chunk[name] = chunk[name].str.strip()
+    return chunk
+
+
+def normalise(chunk):
+    # One Unicode form, plain spaces and \n line breaks; cells left empty by
+    # the other stages become real missing values
+    for name in _string_columns(chunk):
+        values = chunk[name]
+        non_ascii = values.str.contains(r"[^\x00-\x7f]", regex=True, na=False)
+        if non_ascii.any():
+            values = values.where(~non_ascii, values[non_ascii].map(lambda v: unicodedata.normalize("NFC", v)))
+            values = values.str.replace("\u00a0", " ", regex=False)
+        values = values.str.replace("\r\n", "\n", regex=False)
+        chunk[name] = values.mask(values == "")
+    return chunk
+
+
+class DedupeByKey:
+    # Keeps the first row for every key. Only the keys are remembered, so
+    # memory grows with the number of distinct keys, not with the data.
+    def __init__(self, key):
+        self.key = key
+        self.seen = set()
+
+    def __call__(self, chunk):
+        keys = chunk[self.key]
+        first = ~keys.duplicated() & ~keys.isin(self.seen)
+        self.seen.update(keys[first].tolist())
+        # Rows without a key cannot be compared, they all pass
+        return chunk[first | keys.isna()]
+
+
+def drop_columns(columns):
+    columns = set(columns)
+
+    def transform(chunk):
+        return chunk.drop(columns=[name for name in chunk.columns if name in columns])
+    return transform
+
+
+def write_csv(chunks, path, encoding='utf-8'):
+    rows = 0
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=i == 0, index=False)
+            rows += len(chunk)
+    return rows
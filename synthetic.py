@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic CSVs shaped roughly like our exports, for benchmarks and for
+# trying loaders against a local SQLite database.
+#
+# width_distribution shapes the text columns:
+#   uniform  each column gets a width up to max_width, values up to that width
+#   skewed   most columns short codes and names, a few long free-text columns
+#            (what the Salesforce exports look like)
+#   fixed    every value exactly max_width characters
+# bad_row_rate is the share of rows whose first integer column holds text
+# ("#VALUE!"), which the typed loaders reject into the quarantine.
+
+WIDTH_DISTRIBUTIONS = ("uniform", "skewed", "fixed")
+BAD_VALUE = "#VALUE!"
+
+
+def _text_column(rng, alphabet, rows, max_width, width_distribution):
+    if width_distribution == "fixed":
+        width = max_width
+    elif width_distribution == "skewed":
+        # Column widths from a long-tailed distribution, values mostly short
+        width = int(min(max_width, max(1, rng.lognormal(np.log(max(max_width, 2) / 8), 1.0))))
+    else:
+        width = int(rng.integers(1, max_width + 1))
+    letters = alphabet[rng.integers(0, len(alphabet), (rows, width))]
+    if width_distribution == "fixed":
+        lengths = np.full(rows, width)
+    elif width_distribution == "skewed":
+        lengths = np.clip(rng.geometric(min(1.0, 4 / width), rows), 1, width)
+    else:
+        lengths = rng.integers(1, width + 1, rows)
+    return pd.Series(["".join(row[:n]) for row, n in zip(letters, lengths)], dtype=object)
+
+
+def make_synthetic_frame(rows, columns=20, max_width=40, null_ratio=0.05, seed=0, width_distribution="uniform",
+                         bad_row_rate=0.0):
+    if width_distribution not in WIDTH_DISTRIBUTIONS:
+        raise ValueError(f"width_distribution must be one of {', '.join(WIDTH_DISTRIBUTIONS)}")
+    rng = np.random.default_rng(seed)
+    data = {"Case ID": np.arange(1, rows + 1)}
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    for i in range(1, columns):
+        if i % 4 == 1:
+            values = pd.Series(rng.integers(0, 1_000_000, rows), dtype="Int64")
+        elif i % 4 == 2:
+            values = pd.Series(rng.random(rows) * 1000).round(2)
+        else:
+            values = _text_column(rng, alphabet, rows, max_width, width_distribution)
+        if null_ratio:
+            values = values.mask(rng.random(rows) < null_ratio)
+        data[f"Column {i}"] = values
+    frame = pd.DataFrame(data)
+    if bad_row_rate and columns > 1:
+        # A separate generator, so the good rows are the same at any rate
+        bad = np.random.default_rng(seed + 1).random(rows) < bad_row_rate
+        frame["Column 1"] = frame["Column 1"].astype(object)
+        frame.loc[bad, "Column 1"] = BAD_VALUE
+    return frame
+
+
+def write_synthetic_csv(path, rows, columns=20, max_width=40, null_ratio=0.05, seed=0, width_distribution="uniform",
+                        bad_row_rate=0.0):
+    make_synthetic_frame(rows, columns, max_width, null_ratio, seed, width_distribution,
+                         bad_row_rate).to_csv(path, index=False)
+    return path
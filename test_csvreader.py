@@ -0,0 +1,108 @@
+import csv
+import gzip
+import io
+import random
+import zipfile
+
+import pandas as pd
+import pytest
+
+from csvreader import read_chunks, record_ranges
+
+
+def tricky_value(rng, i):
+    # Quoted newlines, escaped quotes and commas, where a range cut can land
+    # inside them
+    kind = i % 6
+    if kind == 0:
+        return f"line one\nline \"two\" {i}"
+    if kind == 1:
+        return f"\"quoted\" start, {i}"
+    if kind == 2:
+        return "\n".join("x" * rng.randint(0, 30) for _ in range(rng.randint(1, 4)))
+    if kind == 3:
+        return "".join(rng.choice("ab\",\n ") for _ in range(rng.randint(0, 40)))
+    if kind == 4:
+        return ""
+    return f"plain {i}"
+
+
+@pytest.fixture
+def csv_text():
+    rng = random.Random(7)
+    rows = [[i, tricky_value(rng, i), rng.choice(["", "a\r\nb", "\"\"", "end\""]), i * 2] for i in range(2000)]
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(["id", "notes", "extra", "double"])
+    writer.writerows(rows)
+    return text.getvalue()
+
+
+@pytest.fixture
+def csv_file(tmp_path, csv_text):
+    path = tmp_path / "cases.csv"
+    path.write_bytes(csv_text.encode("utf-8"))
+    return str(path)
+
+
+def read_all(path, chunk_size=37, workers=3, **kwargs):
+    chunks = list(read_chunks(path, chunk_size, workers=workers, dtype=str, **kwargs))
+    return chunks, pd.concat([chunk for _, chunk in chunks], ignore_index=True)
+
+
+def test_ranges_end_on_record_boundaries(csv_file, csv_text):
+    ranges = list(record_ranges(csv_file, 11))
+    assert len(ranges) > 50
+    data = csv_text.encode("utf-8")
+    assert ranges[0][0] == data.index(b"\n") + 1
+    assert ranges[-1][1] == len(data)
+    for (start, end, first_line, lines), following in zip(ranges, ranges[1:] + [None]):
+        # Balanced quotes and a final newline: each range parses on its own
+        assert data[start:end].count(b'"') % 2 == 0
+        assert data[end - 1:end] == b"\n"
+        if following is not None:
+            assert following[0] == end
+            assert following[2] == first_line + lines
+    assert ranges[-1][2] + ranges[-1][3] == data.count(b"\n") + 1
+
+
+def test_parallel_read_matches_read_csv(csv_file):
+    chunks, frame = read_all(csv_file)
+    pd.testing.assert_frame_equal(frame, pd.read_csv(csv_file, dtype=str))
+    assert [position["index"] for position, _ in chunks] == list(range(len(chunks)))
+    assert len(chunks) > 20
+
+
+def test_parallel_read_numbers_lines_like_the_serial_read(csv_file):
+    parallel, _ = read_all(csv_file)
+    serial, _ = read_all(csv_file, workers=1)
+    parallel_lines = [line for position, chunk in parallel
+                      for line in (position["line_starts"]
+                                   or range(position["first_line"], position["first_line"] + len(chunk)))]
+    serial_lines = [line for position, chunk in serial
+                    for line in (position["line_starts"]
+                                 or range(position["first_line"], position["first_line"] + len(chunk)))]
+    assert parallel_lines == serial_lines
+
+
+def test_parallel_read_resumes_at_a_range_end(csv_file):
+    chunks, frame = read_all(csv_file)
+    done = chunks[9][0]
+    resumed, rest = read_all(csv_file, start_offset=done["end"], start_index=10, start_line=done["next_line"])
+    assert resumed[0][0]["index"] == 10
+    assert resumed[0][0]["first_line"] == done["next_line"]
+    done_rows = sum(len(chunk) for _, chunk in chunks[:10])
+    pd.testing.assert_frame_equal(rest, frame.iloc[done_rows:].reset_index(drop=True))
+
+
+def test_parallel_read_of_gzip_and_zip_members(tmp_path, csv_file, csv_text):
+    expected = pd.read_csv(csv_file, dtype=str)
+    gz_file = tmp_path / "cases.csv.gz"
+    with gzip.open(gz_file, 'wb') as f:
+        f.write(csv_text.encode("utf-8"))
+    archive = tmp_path / "exports.zip"
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("2024/cases.csv", csv_text)
+    for path in (str(gz_file), f"{archive}::2024/cases.csv"):
+        _, frame = read_all(path)
+        pd.testing.assert_frame_equal(frame, expected)
@@ -0,0 +1,59 @@
+import csv
+
+import pytest
+
+from deltaload import build_index, delta_load, index_path
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "city"])
+        writer.writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def loaded(tmp_path):
+    # A full load of 100 rows, indexed the way insert3.py does after it
+    csv_file = write_csv(tmp_path / "people.csv", [[i, f"name {i}", f"city {i % 7}"] for i in range(100)])
+    build_index(csv_file, "people", "id", chunk_size=30)
+    return csv_file
+
+
+def test_refresh_splits_inserts_updates_deletes_and_unchanged(loaded):
+    # Rows 0-9 are gone, 10-14 changed, 100-102 are new, the rest is as loaded
+    rows = [[i, f"name {i}", f"city {i % 7}"] for i in range(10, 100)]
+    for row in rows[:5]:
+        row[2] = "moved"
+    rows += [[i, f"name {i}", "new"] for i in range(100, 103)]
+    write_csv(loaded, rows)
+    stats = delta_load(loaded, "people", None, "id", chunk_size=30, dry_run=True)
+    assert (stats["rows"], stats["inserted"], stats["updated"], stats["deleted"], stats["unchanged"]) == \
+        (93, 3, 5, 10, 85)
+
+
+def test_unchanged_file_has_no_delta(loaded):
+    stats = delta_load(loaded, "people", None, "id", chunk_size=30, dry_run=True)
+    assert (stats["inserted"], stats["updated"], stats["deleted"], stats["unchanged"]) == (0, 0, 0, 100)
+
+
+def test_without_an_index_every_row_is_new(tmp_path):
+    csv_file = write_csv(tmp_path / "people.csv", [[i, "a", "b"] for i in range(20)])
+    stats = delta_load(csv_file, "people", None, "id", dry_run=True)
+    assert (stats["inserted"], stats["updated"], stats["deleted"]) == (20, 0, 0)
+
+
+def test_duplicate_keys_are_rejected_and_the_index_kept(loaded):
+    with open(index_path(loaded, "people"), 'rb') as f:
+        index = f.read()
+    write_csv(loaded, [[i % 50, f"name {i}", "x"] for i in range(100)])
+    with pytest.raises(ValueError, match="50 keys appear more than once"):
+        delta_load(loaded, "people", None, "id", chunk_size=30, dry_run=True)
+    with open(index_path(loaded, "people"), 'rb') as f:
+        assert f.read() == index
+
+
+def test_missing_key_column_is_an_error(loaded):
+    with pytest.raises(ValueError, match="Key column code"):
+        build_index(loaded, "people", "code")
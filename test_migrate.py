@@ -0,0 +1,45 @@
+from migrate import estimate, measure_sql, plan_changes, rebuild_statements
+
+COLUMNS = [{"name": "Id", "type": "INT", "nullable": False, "identity": False},
+           {"name": "Notes", "type": "VARCHAR(MAX)", "nullable": True, "identity": False},
+           {"name": "Code", "type": "VARCHAR(20)", "nullable": True, "identity": False}]
+
+
+def test_only_varchar_max_columns_change_by_default():
+    desired = {"Notes": "VARCHAR(400)", "Code": "CHAR(4)"}
+    assert [change["column"] for change in plan_changes(COLUMNS, desired)] == ["Notes"]
+    assert [change["column"] for change in plan_changes(COLUMNS, desired, only_max=False)] == ["Notes", "Code"]
+
+
+def test_measure_counts_trailing_spaces_and_reads_committed_data():
+    changes = plan_changes(COLUMNS, {"Notes": "NVARCHAR(400)", "Code": "VARCHAR(4)"}, only_max=False)
+    sql = measure_sql("Cases", changes)
+    assert "MAX(DATALENGTH(CONVERT(NVARCHAR(MAX), [Notes]))) / 2" in sql
+    assert "MAX(DATALENGTH(CONVERT(VARCHAR(MAX), [Code])))" in sql
+    assert "LEN(" not in sql and "NOLOCK" not in sql
+
+
+def test_dependent_objects_keep_the_alters():
+    changes = plan_changes(COLUMNS, {"Id": "BIGINT", "Notes": "VARCHAR(400)", "Code": "CHAR(4)"}, only_max=False)
+    assert estimate(10, COLUMNS, changes, rebuild_min_passes=2)["strategy"] == "rebuild"
+    blocked = estimate(10, COLUMNS, changes, rebuild_min_passes=2, dependents={"foreign keys": 1})
+    assert blocked["strategy"] == "alter"
+    assert blocked["rebuild_blockers"] == {"foreign keys": 1}
+
+
+def test_rebuild_keeps_the_old_table():
+    changes = plan_changes(COLUMNS, {"Notes": "VARCHAR(400)"})
+    statements = rebuild_statements("Cases", COLUMNS, changes, ("PK_Cases", ["Id"]))
+    assert not any(statement.startswith("DROP TABLE") for statement in statements)
+    assert statements[-2] == "EXEC sp_rename 'Cases', 'Cases__before_migrate';"
+
+
+def test_requested_rebuild_that_blockers_refuse_is_reported(capsys):
+    from alterCol import print_plan
+
+    changes = plan_changes(COLUMNS, {"Notes": "VARCHAR(400)"})
+    result = dict(estimate(10, COLUMNS, changes, rebuild_min_passes=0, dependents={"triggers": 2}),
+                  table="Cases", changes=changes)
+    assert result["strategy"] == "alter"
+    print_plan(result, "rebuild")
+    assert "--strategy rebuild not followed, the copy would lose: 2 triggers" in capsys.readouterr().out
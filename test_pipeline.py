@@ -0,0 +1,272 @@
+import csv
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from checkpoint import Checkpoint
+from pipeline import ConnectionLost, insert_bisect, is_connection_error, load_csv
+
+
+class StubServer:
+    # A stand-in for the database: connections keep their inserts until
+    # commit; the first `dead` connections lose their link on their first
+    # insert, connection n (from 1) in fail_after after that many inserts
+    def __init__(self, dead=0, fail_after=None):
+        self.rows = []
+        self.dead = dead
+        self.fail_after = fail_after or {}
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            self.opened += 1
+            inserts = 0 if self.opened <= self.dead else self.fail_after.get(self.opened)
+            return StubConnection(self, inserts)
+
+
+class StubConnection:
+    def __init__(self, server, inserts_left=None):
+        self.server = server
+        self.inserts_left = inserts_left
+        self.pending = []
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        with self.server.lock:
+            self.server.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def executemany(self, sql, rows):
+        if self.conn.inserts_left is not None:
+            if self.conn.inserts_left == 0:
+                raise ConnectionError("link down")
+            self.conn.inserts_left -= 1
+        self.conn.pending.extend(rows)
+
+    def close(self):
+        pass
+
+
+def make_chunks(count, rows):
+    return [pd.DataFrame({"id": range(i * rows, (i + 1) * rows)}) for i in range(count)]
+
+
+def run_with_timeout(target, timeout=30):
+    result = {}
+
+    def run():
+        try:
+            result["stats"] = target()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "load_csv hung"
+    if "error" in result:
+        raise result["error"]
+    return result["stats"]
+
+
+@pytest.mark.parametrize("writers, queue_size", [(3, 1), (8, 4)])
+def test_survivor_finishes_when_all_other_writers_die(writers, queue_size):
+    server = StubServer(dead=writers - 1)
+    stats = run_with_timeout(lambda: load_csv(None, "t", server.connect, writers=writers, queue_size=queue_size,
+                                              chunks=make_chunks(40, 10)))
+    assert sorted(row[0] for row in server.rows) == list(range(400))
+    assert stats["rows"] == 400
+    assert sum(worker["failed"] for worker in stats["workers"]) == writers - 1
+
+
+def test_failover_requeues_the_open_transaction():
+    # Writer 1 dies holding two executed but uncommitted chunks; they and the
+    # chunk it was inserting go to the other writers, nothing is lost or doubled
+    server = StubServer(fail_after={1: 2})
+    stats = run_with_timeout(lambda: load_csv(None, "t", server.connect, writers=3, commit_every=3,
+                                              chunks=make_chunks(30, 10)))
+    assert sorted(row[0] for row in server.rows) == list(range(300))
+    assert stats["retried_chunks"] == 3
+    assert sum(worker["failed"] for worker in stats["workers"]) == 1
+
+
+def test_every_writer_dead_raises():
+    server = StubServer(dead=2)
+    with pytest.raises(ConnectionError):
+        run_with_timeout(lambda: load_csv(None, "t", server.connect, writers=2, queue_size=1,
+                                          chunks=make_chunks(10, 10)))
+
+
+class DriverError(Exception):
+    pass
+
+
+def test_connection_errors_are_driver_connection_states():
+    import sqlite3
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(sqlite3.OperationalError) as missing_table:
+        conn.execute("SELECT * FROM missing")
+    assert not is_connection_error(missing_table.value)
+    conn.close()
+    with pytest.raises(sqlite3.ProgrammingError) as closed:
+        conn.execute("SELECT 1")
+    assert is_connection_error(closed.value)
+    assert is_connection_error(DriverError("08S01", "[08S01] Communication link failure"))
+    assert not is_connection_error(DriverError("23000", "[23000] Violation of PRIMARY KEY constraint"))
+
+
+def test_bisect_reports_a_failed_rollback_as_connection_lost():
+    # The first rollback works; by the second the session is gone. The half
+    # committed in between stays done and nothing raises a raw driver error.
+    class Conn:
+        def __init__(self):
+            self.rollbacks = 0
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            self.rollbacks += 1
+            if self.rollbacks > 1:
+                raise DriverError("HY000", "rollback on a dead session")
+
+    class Cursor:
+        def __init__(self):
+            self.inserted = []
+
+        def executemany(self, sql, rows):
+            if 3 in rows:
+                raise DriverError("22001", "String or binary data would be truncated")
+            self.inserted.extend(rows)
+
+    cursor = Cursor()
+    with pytest.raises(ConnectionLost) as lost:
+        insert_bisect(Conn(), cursor, "INSERT", [0, 1, 2, 3], lambda *args: None)
+    assert cursor.inserted == [0, 1]
+    assert lost.value.rows_done == 2
+    assert lost.value.rows_inserted == 2
+
+
+def test_bisect_does_not_count_quarantined_rows_as_inserted():
+    # Row 1 is bad, the link drops when the second half is tried: four rows
+    # are settled but only three were committed
+    class Conn:
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+    class Cursor:
+        def executemany(self, sql, rows):
+            if rows == [4, 5, 6, 7]:
+                raise DriverError("08S01", "[08S01] Communication link failure")
+            if 1 in rows:
+                raise DriverError("22001", "String or binary data would be truncated")
+
+    bad = []
+    with pytest.raises(ConnectionLost) as lost:
+        insert_bisect(Conn(), Cursor(), "INSERT", list(range(8)), lambda i, row, e: bad.append(row))
+    assert bad == [1]
+    assert (lost.value.rows_done, lost.value.rows_inserted) == (4, 3)
+
+
+class ListQuarantine:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, line, error, values, columns=None):
+        self.rows.append((str(error), list(values)))
+
+
+def test_values_that_do_not_convert_are_quarantined_not_nulled():
+    server = StubServer()
+    quarantine = ListQuarantine()
+    chunk = pd.DataFrame({"id": ["1", "2", "x3", ""], "day": ["2024-01-02", "2024-13-01", "2024-01-03", None]})
+    stats = load_csv(None, "t", server.connect, chunks=[chunk], column_types={"id": "INT", "day": "DATE"},
+                     quarantine=quarantine)
+    assert [row[0] for row in server.rows] == [1, None]
+    assert sorted(error for error, _ in quarantine.rows) == ["day: not a valid date", "id: not a valid int"]
+    assert stats["quarantined"] == 2
+
+
+class Interrupted:
+    # sqlite connections that lose the link after `inserts` inserts in
+    # total, or never with None
+    def __init__(self, path, inserts=None):
+        self.path = path
+        self.inserts = inserts
+
+    def connect(self):
+        return InterruptedConnection(self, sqlite3.connect(self.path, check_same_thread=False))
+
+
+class InterruptedConnection:
+    def __init__(self, owner, conn):
+        self.owner = owner
+        self.conn = conn
+
+    def cursor(self):
+        return self
+
+    def executemany(self, sql, rows):
+        if self.owner.inserts is not None:
+            if self.owner.inserts == 0:
+                raise ConnectionError("link down")
+            self.owner.inserts -= 1
+        self.conn.executemany(sql, rows)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def test_resume_from_checkpoint_loads_every_row_once(tmp_path):
+    csv_file = str(tmp_path / "cases.csv")
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "notes"])
+        for i in range(1000):
+            writer.writerow([i, f"first\nsecond {i}" if i % 97 == 0 else f"note {i}"])
+    db_path = str(tmp_path / "local.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE cases (id INTEGER, notes TEXT)")
+
+    checkpoint = Checkpoint(csv_file, "cases")
+    checkpoint.load()
+    with pytest.raises(ConnectionError):
+        load_csv(csv_file, "cases", Interrupted(db_path, 4).connect, chunk_size=100,
+                 on_commit=checkpoint.mark_committed)
+
+    checkpoint = Checkpoint(csv_file, "cases")
+    checkpoint.load()
+    assert checkpoint.resuming and checkpoint.state["rows"] == 400
+    stats = load_csv(csv_file, "cases", Interrupted(db_path).connect, chunk_size=100,
+                     on_commit=checkpoint.mark_committed, **checkpoint.resume_args())
+    assert stats["rows"] == 600
+    with sqlite3.connect(db_path) as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM cases ORDER BY id")]
+        notes = conn.execute("SELECT notes FROM cases WHERE id = 970").fetchone()[0]
+    assert ids == list(range(1000))
+    assert notes == "first\nsecond 970"
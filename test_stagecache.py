@@ -0,0 +1,49 @@
+import csv
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from csvreader import read_chunks
+from stagecache import StagingCache
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "cases.csv"
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Id", "Notes"])
+        for i in range(18000):
+            # Every 1000th record spans two lines
+            writer.writerow([i, f"line one\nline two {i}" if i % 1000 == 0 else f"note {i}"])
+    return str(path)
+
+
+def test_cache_honours_the_chunk_size(csv_file, tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"), chunk_size=5000)
+    plain = list(read_chunks(csv_file, 3000, dtype=str))
+    cached = list(read_chunks(csv_file, 3000, cache=cache, dtype=str))
+    assert [len(chunk) for _, chunk in cached] == [3000] * 6
+    for (position, chunk), (cached_position, cached_chunk) in zip(plain, cached):
+        assert cached_position == position
+        pd.testing.assert_frame_equal(cached_chunk, chunk)
+
+
+def test_resume_from_a_checkpoint_written_without_the_cache(csv_file, tmp_path):
+    # Three 4000-row chunks committed by a plain read, resumed through a
+    # cache that batches by 5000: no committed row may come back
+    committed = list(read_chunks(csv_file, 4000, dtype=str))[:3]
+    done = committed[-1][0]
+    cache = StagingCache(str(tmp_path / "cache"), chunk_size=5000)
+    resumed = list(read_chunks(csv_file, 4000, done["end"], 3, done["next_line"], cache=cache, dtype=str))
+    ids = [int(i) for _, chunk in committed + resumed for i in chunk["Id"]]
+    assert ids == list(range(18000))
+    assert resumed[0][0]["index"] == 3
+    assert resumed[0][0]["first_line"] == done["next_line"]
+
+
+def test_offset_between_rows_reads_the_csv(csv_file, tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"))
+    assert cache.read_chunks(csv_file, 4000, start_offset=3) is None
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+import typeinfer
+from typeinfer import choose_type, merge, observe
+
+
+@pytest.fixture(params=["arrow", "pandas"])
+def infer(request, monkeypatch):
+    # Both observe() paths must pick the same types
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(typeinfer, "pa", None)
+
+    def infer(values, threshold=1.0):
+        return choose_type(observe(pd.Series(values, dtype=object)), threshold)[0]
+    return infer
+
+
+def test_types_are_promoted_narrowest_first(infer):
+    assert infer(["0", "1", "1"]) == "BIT"
+    assert infer(["true", "False"]) == "BIT"
+    assert infer(["0", "1", "7"]) == "INT"
+    assert infer(["7", "12345678901"]) == "BIGINT"
+    assert infer(["7", "1.5"]) == "DECIMAL(2,1)"
+    assert infer(["7", "seven"]) == "VARCHAR(15)"
+
+
+def test_leading_zeros_stay_text(infer):
+    assert infer(["00123", "04567"]) == "VARCHAR(15)"
+    assert infer(["0", "0.5", "-0.25"]) == "DECIMAL(3,2)"
+
+
+def test_int_range_boundary(infer):
+    assert infer(["2147483647", "-2147483648"]) == "INT"
+    assert infer(["2147483648"]) == "BIGINT"
+    assert infer(["-2147483649"]) == "BIGINT"
+    assert infer(["9999999999"]) == "BIGINT"
+    assert infer(["123456789012345678"]) == "BIGINT"
+    # Past 18 digits BIGINT may overflow, DECIMAL holds it exactly
+    assert infer(["1234567890123456789"]) == "DECIMAL(19,0)"
+
+
+def test_decimal_precision_and_scale(infer):
+    assert infer(["123.4", "5.678"]) == "DECIMAL(6,3)"
+    assert infer(["+12.50", ".5"]) == "DECIMAL(4,2)"
+    assert infer([" 3.25 ", "10"]) == "DECIMAL(4,2)"
+    # Over 38 digits of precision is not a DECIMAL
+    assert infer(["1" * 30 + "." + "1" * 10]).startswith("VARCHAR")
+
+
+def test_dates_and_datetimes(infer):
+    assert infer(["2024-01-02", "1999-12-31"]) == "DATE"
+    assert infer(["2024-01-02 10:30:00", "2024-01-02T10:30:00.1234567Z"]) == "DATETIME2"
+    assert infer(["2024-01-02", "2024-01-02 10:30"]) == "DATETIME2"
+    # Not a calendar date
+    assert infer(["2024-01-02", "2024-13-01"]) == "VARCHAR(20)"
+    assert infer(["2024-01-02", "2024-13-01"], threshold=0.5) == "DATE"
+
+
+def test_threshold_and_empty_columns(infer):
+    values = ["1", "2", "3", "n/a"]
+    assert infer(values) == "VARCHAR(13)"
+    assert infer(values, threshold=0.75) == "INT"
+    assert infer([]) == "VARCHAR(10)"
+    assert infer(["café"]) == "NVARCHAR(14)"
+
+
+def test_counters_merge_across_chunks(infer):
+    first = observe(pd.Series(["1", "2"], dtype=object))
+    second = observe(pd.Series(["3000000000"], dtype=object))
+    assert choose_type(first)[0] == "INT"
+    assert choose_type(merge(first, second))[0] == "BIGINT"
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from writers import BulkInsertBackend, bcp_command, bulk_insert_sql, format_file_lines, masked
+
+
+def test_bulk_insert_sql():
+    sql = bulk_insert_sql("Cases", r"\\files\staging\Cases.bulk.dat", r"\\files\staging\Cases.bulk.fmt",
+                          batch_size=5000)
+    assert sql == (r"BULK INSERT Cases FROM '\\files\staging\Cases.bulk.dat' WITH ("
+                   r"FORMATFILE = '\\files\staging\Cases.bulk.fmt', CODEPAGE = '65001', KEEPNULLS, "
+                   r"BATCHSIZE = 5000, TABLOCK);")
+
+
+def test_bulk_insert_sql_escapes_quotes_in_paths():
+    sql = bulk_insert_sql("Cases", "/srv/o'brien/a.dat", "/srv/o'brien/a.fmt", tablock=False, batch_size=0)
+    assert sql == "BULK INSERT Cases FROM '/srv/o''brien/a.dat' WITH (FORMATFILE = '/srv/o''brien/a.fmt', " \
+                  "CODEPAGE = '65001', KEEPNULLS);"
+
+
+def test_format_file_maps_columns_by_name():
+    lines = format_file_lines(["Id", "First Name", "Extra"], ["First Name", "Id"])
+    assert lines[:2] == ["14.0", "3"]
+    assert lines[2] == '1\tSQLCHAR\t0\t0\t"~|~"\t2\tId\t""'
+    assert lines[3] == '2\tSQLCHAR\t0\t0\t"~|~"\t1\tFirst_Name\t""'
+    # Not in the table: skipped; the last field ends the row
+    assert lines[4] == '3\tSQLCHAR\t0\t0\t"~|~|~\\r\\n"\t0\tExtra\t""'
+
+
+def test_bcp_password_is_masked():
+    command = bcp_command("Cases", "a.dat", "a.fmt", "db01", "Imports", "loader", "secret")
+    assert "secret" in command and "secret" not in masked(command)
+
+
+def test_staged_files_are_unique_per_load(tmp_path):
+    first = BulkInsertBackend(staging_dir=str(tmp_path), server_dir=r"\\files\staging")
+    second = BulkInsertBackend(staging_dir=str(tmp_path), server_dir=r"\\files\staging")
+    assert first.staged_paths("Cases")[0] != second.staged_paths("Cases")[0]
+    assert first.staged_paths("Cases")[1][0].startswith("\\\\files\\staging\\Cases.")
+
+
+def test_stage_writes_terminated_rows(tmp_path):
+    csv_file = tmp_path / "cases.csv"
+    pd.DataFrame({"Id": [1, 2], "Name": ["a", None]}).to_csv(csv_file, index=False)
+    backend = BulkInsertBackend(staging_dir=str(tmp_path), execute=False)
+    assert backend.stage(str(csv_file), "Cases") == 2
+    (data_file, format_file), _ = backend.staged_paths("Cases")
+    with open(data_file, newline='') as f:
+        assert f.read() == "1~|~a~|~|~\r\n2~|~~|~|~\r\n"
+
+
+@pytest.mark.parametrize("value", ["a~|~b", "a~|", "a~"])
+def test_stage_refuses_values_that_break_the_terminator(tmp_path, value):
+    csv_file = tmp_path / "cases.csv"
+    pd.DataFrame({"Id": [1], "Name": [value]}).to_csv(csv_file, index=False)
+    with pytest.raises(ValueError):
+        BulkInsertBackend(staging_dir=str(tmp_path), execute=False).stage(str(csv_file), "Cases")
+
+
+def test_failed_load_removes_the_staged_files(tmp_path):
+    class FailingBulkInsert(BulkInsertBackend):
+        def run(self, table_name):
+            raise RuntimeError("Bulk load data conversion error")
+
+    csv_file = tmp_path / "cases.csv"
+    pd.DataFrame({"Id": [1, 2], "Name": ["a", "b"]}).to_csv(csv_file, index=False)
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    with pytest.raises(RuntimeError):
+        FailingBulkInsert(staging_dir=str(staging_dir)).load(str(csv_file), "Cases")
+    assert list(staging_dir.iterdir()) == []
+    with pytest.raises(RuntimeError):
+        FailingBulkInsert(staging_dir=str(staging_dir), keep_files=True).load(str(csv_file), "Cases")
+    assert len(list(staging_dir.iterdir())) == 2
@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+# SQL Server type inference over raw CSV text. Every chunk is reduced to a
+# small dict of counters per column (how many values would fit each
+# candidate type, widths, ranges), counters merge across chunks or worker
+# processes, and choose_type() picks the narrowest type whose share of
+# matching values reaches the confidence threshold. Candidates are tried
+# narrowest first, so a column is promoted BIT -> INT -> BIGINT -> DECIMAL
+# or DATE -> DATETIME2 and only falls back to (N)VARCHAR when nothing fits.
+
+# Leading zeros mean an identifier or a postcode, not a number
+_INT_PATTERN = r"[+-]?(?:0|[1-9]\d*)"
+_DECIMAL_PATTERN = r"[+-]?(?:(?:0|[1-9]\d*)(?:\.\d+)?|\.\d+)"
+_DATE_PATTERN = r"\d{4}-\d{2}-\d{2}"
+_DATE_PREFIX = r"\d{4}-\d{2}-\d{2}.*"
+_DATETIME_PATTERN = r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,7})?)?(?:Z|[+-]\d{2}:?\d{2})?"
+
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+MAX_DECIMAL_PRECISION = 38
+
+# pandas 2 guesses one format from the first value unless told to accept
+# any ISO 8601 layout; pandas 1 parses each value on its own anyway
+_ISO_FORMAT = "ISO8601" if int(pd.__version__.split(".")[0]) >= 2 else None
+# Nullable Int64 keeps BIGINTs exact when a chunk has missing values
+_NULLABLE_NUMERIC = {"dtype_backend": "numpy_nullable"} if _ISO_FORMAT else {}
+
+
+def empty_stats():
+    return {"non_null": 0, "max_length": 0, "unicode": False, "bit": 0, "int": 0, "int_digits": 0,
+            "int_out_of_range": 0, "decimal": 0, "decimal_digits": 0, "scale": 0, "date": 0, "datetime": 0}
+
+
+def parse_datetimes(values):
+    # Offsets are normalised to UTC, naive values are kept as they are
+    return pd.to_datetime(values, format=_ISO_FORMAT, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+def _valid_dates(values, fmt=None):
+    parsed = parse_datetimes(values) if fmt is None else pd.to_datetime(values, format=fmt, errors='coerce')
+    return int(parsed.notna().sum())
+
+
+def _matches(values, pattern, probe_size=200):
+    # A column where fewer than half of the first values match can never
+    # reach a usable confidence threshold, so skip the full-column regex and
+    # count it as no matches. Thresholds below 0.5 are therefore meaningless.
+    if len(values) > probe_size * 2 and values.iloc[:probe_size].str.fullmatch(pattern).mean() < 0.5:
+        return pd.Series(False, index=values.index)
+    return values.str.fullmatch(pattern)
+
+
+def _arrow_matches(values, pattern, probe_size=200):
+    # Same probe as _matches; returns None instead of an all-false mask
+    regex = f"^\\s*(?:{pattern})\\s*$"
+    if len(values) > probe_size * 2:
+        if pc.mean(pc.match_substring_regex(values.slice(0, probe_size), regex)).as_py() < 0.5:
+            return None
+    mask = pc.match_substring_regex(values, regex)
+    return mask if pc.any(mask).as_py() else None
+
+
+def _count(mask):
+    return int(pc.sum(mask).as_py() or 0)
+
+
+def _observe_dates(stats, stripped):
+    # stripped: pandas strings that start like a date, usually few or none
+    is_date = stripped.str.fullmatch(_DATE_PATTERN)
+    if is_date.any():
+        stats["date"] = _valid_dates(stripped[is_date], "%Y-%m-%d")
+    is_datetime = stripped.str.fullmatch(_DATETIME_PATTERN)
+    if is_datetime.any():
+        stats["datetime"] = _valid_dates(stripped[is_datetime])
+
+
+def observe_arrow(column):
+    # column: a pyarrow string (Chunked)Array, nulls included. Everything
+    # stays in Arrow compute kernels; only the small set of date-looking
+    # values is handed to pandas for calendar validation.
+    stats = empty_stats()
+    values = pc.drop_null(column)
+    if len(values) == 0:
+        return stats
+    stats["non_null"] = len(values)
+    stats["max_length"] = int(pc.max(pc.utf8_length(values)).as_py())
+    stats["unicode"] = not pc.all(pc.string_is_ascii(values)).as_py()
+
+    is_decimal = _arrow_matches(values, _DECIMAL_PATTERN)
+    if is_decimal is not None:
+        numeric = pc.utf8_trim_whitespace(pc.filter(values, is_decimal))
+        unsigned = pc.utf8_ltrim(numeric, characters="+-")
+        lengths = pc.utf8_length(unsigned)
+        points = pc.find_substring(unsigned, ".")
+        has_point = pc.greater_equal(points, 0)
+        stats["decimal"] = len(numeric)
+        stats["decimal_digits"] = int(pc.max(pc.if_else(has_point, points, lengths)).as_py())
+        stats["scale"] = int(pc.max(pc.if_else(has_point, pc.subtract(pc.subtract(lengths, points), 1), 0)).as_py())
+        stats["bit"] = _count(pc.is_in(numeric, value_set=pa.array(["0", "1"])))
+
+        is_int = pc.match_substring_regex(numeric, f"^{_INT_PATTERN}$")
+        stats["int"] = _count(is_int)
+        if stats["int"]:
+            digits = pc.filter(lengths, is_int)
+            stats["int_digits"] = int(pc.max(digits).as_py())
+            # Only ten-digit values can straddle the INT limits
+            borderline = pc.filter(pc.filter(numeric, is_int), pc.equal(digits, 10))
+            if len(borderline):
+                numbers = pd.to_numeric(borderline.to_pandas(), errors='coerce')
+                stats["int_out_of_range"] = int(((numbers < INT_RANGE[0]) | (numbers > INT_RANGE[1])).sum())
+    if stats["max_length"] <= 5:
+        lowered = pc.utf8_lower(pc.utf8_trim_whitespace(values))
+        stats["bit"] += _count(pc.is_in(lowered, value_set=pa.array(["true", "false"])))
+
+    looks_like_date = _arrow_matches(values, _DATE_PREFIX)
+    if looks_like_date is not None:
+        _observe_dates(stats, pc.utf8_trim_whitespace(pc.filter(values, looks_like_date)).to_pandas())
+    return stats
+
+
+def observe(values):
+    # values: the non-null raw strings of one column in one chunk
+    if pa is not None:
+        return observe_arrow(pa.array(values, type=pa.string(), from_pandas=True))
+    stats = empty_stats()
+    if values.empty:
+        return stats
+    stats["non_null"] = len(values)
+    stats["max_length"] = int(values.str.len().max())
+    stats["unicode"] = bool(values.str.contains(r"[^\x00-\x7f]", regex=True).any())
+
+    stripped = values.str.strip()
+    is_decimal = _matches(stripped, _DECIMAL_PATTERN)
+    if is_decimal.any():
+        numeric = stripped[is_decimal]
+        unsigned = numeric.str.lstrip("+-")
+        lengths = unsigned.str.len()
+        points = unsigned.str.find(".")
+        stats["decimal"] = int(is_decimal.sum())
+        stats["decimal_digits"] = int(points.where(points >= 0, lengths).max())
+        stats["scale"] = int((lengths - points - 1).where(points >= 0, 0).max())
+        stats["bit"] = int(numeric.isin(["0", "1"]).sum())
+
+        is_int = numeric.str.fullmatch(_INT_PATTERN)
+        if is_int.any():
+            digits = lengths[is_int]
+            stats["int"] = int(is_int.sum())
+            stats["int_digits"] = int(digits.max())
+            # Only ten-digit values can straddle the INT limits
+            borderline = numeric[is_int][digits == 10]
+            if len(borderline):
+                numbers = pd.to_numeric(borderline, errors='coerce')
+                stats["int_out_of_range"] = int(((numbers < INT_RANGE[0]) | (numbers > INT_RANGE[1])).sum())
+    if stats["max_length"] <= 5:
+        stats["bit"] += int(stripped.str.lower().isin(["true", "false"]).sum())
+
+    looks_like_date = _matches(stripped, _DATE_PREFIX)
+    if looks_like_date.any():
+        _observe_dates(stats, stripped[looks_like_date])
+    return stats
+
+
+def merge(a, b):
+    merged = {}
+    for key, value in a.items():
+        if key in ("max_length", "int_digits", "decimal_digits", "scale"):
+            merged[key] = max(value, b[key])
+        elif key == "unicode":
+            merged[key] = value or b[key]
+        else:
+            merged[key] = value + b[key]
+    return merged
+
+
+def observe_chunk(chunk):
+    return {column: observe(chunk[column].dropna()) for column in chunk.columns}
+
+
+def default_string_type(max_length, unicode):
+    # Same sizing rules colreducer1 always used: ten characters of headroom,
+    # 18 exactly for Salesforce IDs, MAX for anything longer than 6000
+    name = "NVARCHAR" if unicode else "VARCHAR"
+    limit = 4000 if unicode else 6000
+    if max_length == 18:
+        return f"{name}(18)"
+    suggested = max_length + 10
+    if suggested > limit:
+        return f"{name}(MAX)"
+    return f"{name}({suggested})"
+
+
+def candidate_types(stats):
+    non_null = stats["non_null"]
+    candidates = []
+    if stats["bit"]:
+        candidates.append(("BIT", stats["bit"] / non_null))
+    if stats["int"]:
+        confidence = stats["int"] / non_null
+        if stats["int_digits"] <= 10 and not stats["int_out_of_range"]:
+            candidates.append(("INT", confidence))
+        if stats["int_digits"] <= 18:
+            candidates.append(("BIGINT", confidence))
+    if stats["decimal"]:
+        precision = max(stats["decimal_digits"] + stats["scale"], 1)
+        if precision <= MAX_DECIMAL_PRECISION:
+            candidates.append((f"DECIMAL({precision},{stats['scale']})", stats["decimal"] / non_null))
+    if stats["date"]:
+        candidates.append(("DATE", stats["date"] / non_null))
+    if stats["datetime"] or stats["date"]:
+        candidates.append(("DATETIME2", (stats["date"] + stats["datetime"]) / non_null))
+    return candidates
+
+
+def choose_type(stats, threshold=1.0, string_type=default_string_type):
+    # Returns (sql_type, confidence). The string fallback always fits, so its
+    # confidence is 1.0; an all-NULL column gets a short VARCHAR.
+    if stats["non_null"] == 0:
+        return string_type(0, False), 1.0
+    for sql_type, confidence in candidate_types(stats):
+        if confidence >= threshold:
+            return sql_type, confidence
+    return string_type(stats["max_length"], stats["unicode"]), 1.0
+
+
+def reservoir_sample(chunks, sample_size, seed=0):
+    # Algorithm R over a stream of DataFrame chunks, vectorized per chunk:
+    # row i replaces slot j ~ U[0, i] when j < sample_size. Duplicate slots
+    # are resolved last-write-wins, the same order the scalar loop uses.
+    rng = np.random.default_rng(seed)
+    sample = None
+    seen = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if sample is None:
+            sample = chunk.iloc[:0].copy()
+        take = max(0, min(sample_size - len(sample), len(chunk)))
+        if take:
+            sample = pd.concat([sample, chunk.iloc[:take]], ignore_index=True)
+        rest = chunk.iloc[take:]
+        if len(rest):
+            positions = np.arange(seen + take, seen + len(chunk))
+            slots = (rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+            keep = slots < sample_size
+            if keep.any():
+                sample.iloc[slots[keep]] = rest[keep].to_numpy()
+        seen += len(chunk)
+    return sample
+
+
+def to_parameters(values, sql_type):
+    # Converts one text column to the Python-facing type for sql_type;
+    # params.column_values turns the result into driver values with None
+    # for missing. DECIMAL stays text: SQL Server converts it exactly, a
+    # float would not.
+    if sql_type in ("INT", "BIGINT"):
+        if pa is not None:
+            # Arrow's cast is an order of magnitude faster than to_numeric;
+            # it refuses the whole column on one bad value, then coerce below
+            try:
+                ints = pc.cast(pc.utf8_trim_whitespace(pa.array(values, type=pa.string(), from_pandas=True)),
+                               pa.int64())
+                return pd.Series(ints.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get).array,
+                                 index=values.index)
+            except pa.ArrowInvalid:
+                pass
+        return pd.to_numeric(values.str.strip(), errors='coerce', **_NULLABLE_NUMERIC)
+    if sql_type == "BIT":
+        return values.str.strip().str.lower().map({"1": True, "true": True, "0": False, "false": False})
+    if sql_type == "DATE":
+        return pd.to_datetime(values, format="%Y-%m-%d", errors='coerce').dt.date
+    if sql_type == "DATETIME2":
+        return parse_datetimes(values)
+    return values
+
+
+def is_string_type(sql_type):
+    return sql_type.startswith(("VARCHAR", "NVARCHAR"))
+
+
+_PARAMETER_TYPES = {"bit": "BIT", "tinyint": "INT", "smallint": "INT", "int": "INT", "bigint": "BIGINT",
+                    "date": "DATE", "datetime": "DATETIME2", "datetime2": "DATETIME2",
+                    "smalldatetime": "DATETIME2"}
+
+
+def parameter_type(data_type):
+    # INFORMATION_SCHEMA.COLUMNS.DATA_TYPE -> the to_parameters() conversion
+    return _PARAMETER_TYPES.get(data_type.lower(), "VARCHAR")
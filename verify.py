@@ -0,0 +1,413 @@
+import argparse
+import configparser
+import decimal
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from csvreader import iter_record_blocks, parse_block, parse_range, read_header, record_ranges
+from db import open_database
+from projection import project, projection_for, read_args, read_projections
+from sources import is_compressed
+from typeinfer import parse_datetimes, to_parameters
+
+# Post-load verification: proof that a table holds what the CSV holds,
+# without pulling the table back. Both sides reduce every row to the same
+# text (each selected column rendered the way SQL Server's CONVERT prints
+# it, NULLs as a marker), hash it with SHA-256 and fold the hashes into
+# partitions picked by a hash of the key:
+#
+#   per partition: row count and the sum of the first 8 bytes of every row
+#   hash as a signed BIGINT
+#
+# Sums do not depend on row order, and unlike an XOR (CHECKSUM_AGG) a
+# duplicated row does not cancel out. The CSV side streams byte ranges
+# through a process pool; the table side is one GROUP BY over HASHBYTES,
+# run while the CSV is being hashed. Partitions that differ are drilled
+# into: the CSV rows and the table's (key, hash) pairs of just those
+# partitions are compared key by key.
+
+NULL_MARK = "\x1e"
+SEPARATOR = "\x1f"
+TEXT_TYPES = ("char", "varchar", "nchar", "nvarchar", "text", "ntext", "uniqueidentifier")
+INT_TYPES = ("tinyint", "smallint", "int", "bigint")
+
+
+def column_kind(data_type, scale=None, precision=None):
+    # INFORMATION_SCHEMA type -> (kind, digits), None when the CSV side
+    # cannot reproduce how SQL Server prints it
+    data_type = data_type.lower()
+    if data_type in TEXT_TYPES:
+        return "text", None
+    if data_type in INT_TYPES:
+        return "int", None
+    if data_type == "bit":
+        return "bit", None
+    if data_type in ("decimal", "numeric"):
+        return "decimal", int(scale or 0)
+    if data_type == "date":
+        return "date", None
+    if data_type == "datetime2":
+        return "datetime2", 7 if precision is None else int(precision)
+    if data_type == "datetime":
+        return "datetime", 3
+    return None
+
+
+def _decimal_text(value, scale):
+    # The value SQL Server stores after converting the text, printed with
+    # the column's scale
+    try:
+        number = decimal.Decimal(value.strip()).quantize(decimal.Decimal(1).scaleb(-scale),
+                                                          rounding=decimal.ROUND_HALF_UP)
+    except decimal.InvalidOperation:
+        return value
+    return format(abs(number) if number == 0 else number, "f")
+
+
+def _datetime_text(value, kind, digits):
+    # The driver sends microseconds; the column rounds them to its precision
+    value = value.floor("us")
+    if kind == "datetime":
+        # DATETIME counts 1/300 s ticks and prints them as .000/.003/.007
+        ticks = round(value.microsecond * 3 / 10000)
+        value = value.replace(microsecond=0) + pd.Timedelta(milliseconds=round(ticks * 10 / 3))
+        return value.strftime("%Y-%m-%d %H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+    step = 10 ** max(6 - digits, 0)
+    rounded = (value.microsecond + step // 2) // step * step
+    value = value.replace(microsecond=0) + pd.Timedelta(microseconds=rounded)
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if digits:
+        text += "." + (f"{value.microsecond:06d}" + "0" * max(digits - 6, 0))[:digits]
+    return text
+
+
+def render_column(values, kind, digits=None):
+    # Raw CSV text -> what CONVERT(NVARCHAR, column) returns once loaded
+    if kind == "int":
+        rendered = to_parameters(values, "BIGINT").astype("string")
+    elif kind == "bit":
+        rendered = to_parameters(values, "BIT").map({True: "1", False: "0"})
+    elif kind == "decimal":
+        rendered = values.map(lambda value: _decimal_text(value, digits), na_action="ignore")
+    elif kind == "date":
+        rendered = to_parameters(values, "DATE").map(lambda value: value.isoformat(), na_action="ignore")
+    elif kind in ("datetime2", "datetime"):
+        rendered = parse_datetimes(values).map(lambda value: _datetime_text(value, kind, digits),
+                                               na_action="ignore")
+    else:
+        rendered = values
+    rendered = rendered.astype(object)
+    return rendered.where(rendered.notna(), NULL_MARK)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-16-le")).digest()
+
+
+def partition_of(key_text, partitions):
+    return int.from_bytes(_digest(key_text)[:3], "big") % partitions
+
+
+def row_value(row_text):
+    return int.from_bytes(_digest(row_text)[:8], "big", signed=True)
+
+
+def empty_checksums(partitions):
+    return {"rows": 0, "counts": [0] * partitions, "sums": [0] * partitions, "drilled": []}
+
+
+def chunk_checksums(chunk, spec, position, drill=None):
+    # -> partition counts and sums of one chunk, plus (partition, key,
+    # row value, line) for its rows in the drilled partitions
+    if spec.get("projection") is not None:
+        position, chunk = project(position, chunk, spec["projection"])
+    missing = [name for name, _, _ in spec["columns"] if name not in chunk.columns]
+    if missing:
+        raise ValueError(f"Columns {', '.join(missing)} are not in the CSV")
+    rendered = [render_column(chunk[name], kind, digits) for name, kind, digits in spec["columns"]]
+    row_texts = rendered[0].str.cat(rendered[1:], sep=SEPARATOR) if len(rendered) > 1 else rendered[0]
+    key_texts = rendered[spec["key_index"]]
+    partitions = spec["partitions"]
+    result = empty_checksums(partitions)
+    result["rows"] = len(chunk)
+    line_starts = position.get("line_starts")
+    for i, (key_text, row_text) in enumerate(zip(key_texts, row_texts)):
+        partition = partition_of(key_text, partitions)
+        value = row_value(row_text)
+        result["counts"][partition] += 1
+        result["sums"][partition] += value
+        if drill and partition in drill:
+            line = line_starts[i] if line_starts else position["first_line"] + i
+            result["drilled"].append((partition, key_text, value, line))
+    return result
+
+
+def range_checksums(csv_file, header, start, end, first_line, lines, spec, drill=None, encoding='utf-8'):
+    # Worker side: reads and parses its own byte range
+    position, chunk = parse_range(csv_file, header, 0, start, end, first_line, lines, encoding, _read_args(spec))
+    return chunk_checksums(chunk, spec, position, drill)
+
+
+def block_checksums(position, header, block, spec, drill=None, encoding='utf-8'):
+    return chunk_checksums(parse_block(header, block, encoding, **_read_args(spec)), spec, position, drill)
+
+
+def _read_args(spec):
+    if spec.get("projection") is None:
+        return {"dtype": str}
+    return read_args(spec["projection"], {"dtype": str})
+
+
+def checksum_tasks(csv_file, spec, drill=None, chunk_size=50000, encoding='utf-8'):
+    # Same split as csvprofile.stats_tasks: byte ranges for plain files,
+    # decompressed blocks for compressed ones
+    if is_compressed(csv_file):
+        for position, header, block in iter_record_blocks(csv_file, chunk_size):
+            yield block_checksums, (position, header, block, spec, drill, encoding)
+        return
+    header, _ = read_header(csv_file)
+    for start, end, first_line, lines in record_ranges(csv_file, chunk_size):
+        yield range_checksums, (csv_file, header, start, end, first_line, lines, spec, drill, encoding)
+
+
+def merge_checksums(total, part):
+    total["rows"] += part["rows"]
+    for partition, (count, value) in enumerate(zip(part["counts"], part["sums"])):
+        total["counts"][partition] += count
+        total["sums"][partition] += value
+    total["drilled"].extend(part["drilled"])
+
+
+def csv_checksums(csv_file, spec, drill=None, chunk_size=50000, workers=None):
+    workers = workers or os.cpu_count() or 1
+    total = empty_checksums(spec["partitions"])
+    tasks = checksum_tasks(csv_file, spec, drill, chunk_size)
+    if workers == 1:
+        for task, task_args in tasks:
+            merge_checksums(total, task(*task_args))
+        return total
+    with ProcessPoolExecutor(workers) as executor:
+        in_flight = set()
+        for task, task_args in tasks:
+            in_flight.add(executor.submit(task, *task_args))
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge_checksums(total, future.result())
+        for future in in_flight:
+            merge_checksums(total, future.result())
+    return total
+
+
+def table_spec(connect, table_name, key, columns=None, partitions=256):
+    # The key plus the selected columns (all comparable ones by default),
+    # in table order, with how SQL Server prints each
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_SCALE, DATETIME_PRECISION "
+                       "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION",
+                       table_name)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    if not rows:
+        raise ValueError(f"Table {table_name} does not exist")
+    wanted = None if columns is None else set(columns) | {key}
+    spec_columns = []
+    for name, data_type, scale, precision in rows:
+        if wanted is not None and name not in wanted:
+            continue
+        kind = column_kind(data_type, scale, precision)
+        if kind is None:
+            if wanted is not None or name == key:
+                raise ValueError(f"Column {name} is {data_type}, which cannot be verified")
+            print(f"[WARN] Column {name} is {data_type} and is left out of the checksums.")
+            continue
+        spec_columns.append((name, kind[0], kind[1]))
+    names = [name for name, _, _ in spec_columns]
+    if key not in names:
+        raise ValueError(f"Key column {key} is not in {table_name}")
+    if wanted is not None and len(names) < len(wanted):
+        raise ValueError(f"Columns {', '.join(sorted(wanted - set(names)))} are not in {table_name}")
+    return {"columns": spec_columns, "key_index": names.index(key), "partitions": partitions}
+
+
+def column_sql(name, kind, digits=None):
+    column = f"[{name}]"
+    if kind == "text":
+        text = f"CAST({column} AS NVARCHAR(MAX))"
+    elif kind == "date":
+        text = f"CONVERT(NVARCHAR(10), {column}, 23)"
+    elif kind in ("datetime2", "datetime"):
+        text = f"CONVERT(NVARCHAR(27), {column}, 121)"
+    else:
+        text = f"CAST({column} AS NVARCHAR(50))"
+    return f"ISNULL({text}, NCHAR(30))"
+
+
+def _hashed_rows_sql(table_name, spec):
+    # One row per table row: its partition and the signed BIGINT of its hash
+    parts = [column_sql(name, kind, digits) for name, kind, digits in spec["columns"]]
+    row_text = f"CONCAT({', NCHAR(31), '.join(parts)})" if len(parts) > 1 else parts[0]
+    key_text = parts[spec["key_index"]]
+    return (f"SELECT {key_text} AS key_text, "
+            f"CAST(SUBSTRING(HASHBYTES('SHA2_256', {key_text}), 1, 3) AS INT) % {spec['partitions']} AS part, "
+            f"CAST(SUBSTRING(HASHBYTES('SHA2_256', {row_text}), 1, 8) AS BIGINT) AS row_value "
+            f"FROM {table_name}")
+
+
+def checksum_sql(table_name, spec):
+    return (f"SELECT part, COUNT_BIG(*), SUM(CAST(row_value AS DECIMAL(38, 0))) "
+            f"FROM ({_hashed_rows_sql(table_name, spec)}) AS hashed GROUP BY part")
+
+
+def drill_sql(table_name, spec, partitions):
+    return (f"SELECT part, key_text, row_value FROM ({_hashed_rows_sql(table_name, spec)}) AS hashed "
+            f"WHERE part IN ({', '.join(str(int(partition)) for partition in sorted(partitions))})")
+
+
+def _query(connect, sql):
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        conn.close()
+
+
+def table_checksums(connect, table_name, spec):
+    total = empty_checksums(spec["partitions"])
+    for partition, count, value in _query(connect, checksum_sql(table_name, spec)):
+        total["rows"] += int(count)
+        total["counts"][partition] = int(count)
+        total["sums"][partition] = int(value)
+    return total
+
+
+def compare_rows(csv_rows, table_rows):
+    # (partition, key, value[, line]) of the drilled partitions on both
+    # sides -> one entry per key that differs
+    csv_keys, table_keys = {}, {}
+    for partition, key_text, value, line in csv_rows:
+        csv_keys.setdefault(key_text, []).append((value, line))
+    for partition, key_text, value in table_rows:
+        table_keys.setdefault(key_text, []).append(int(value))
+    problems = []
+    for key_text in sorted(set(csv_keys) | set(table_keys)):
+        in_csv = csv_keys.get(key_text, [])
+        in_table = table_keys.get(key_text, [])
+        if sorted(value for value, _ in in_csv) == sorted(in_table):
+            continue
+        if not in_table:
+            problem = "missing from table"
+        elif not in_csv:
+            problem = "not in CSV"
+        elif len(in_csv) != len(in_table):
+            problem = f"{len(in_csv)} rows in CSV, {len(in_table)} in table"
+        else:
+            problem = "values differ"
+        problems.append({"key": None if key_text == NULL_MARK else key_text, "problem": problem,
+                         "lines": sorted(line for _, line in in_csv)})
+    return problems
+
+
+def verify_load(csv_file, table_name, connect, key, columns=None, partitions=256, workers=None, chunk_size=50000,
+                max_drill=16, projection=None):
+    # With a projection the CSV side checks what the load wrote: mapped,
+    # transformed and filtered rows under the target column names
+    start_time = time.perf_counter()
+    spec = table_spec(connect, table_name, key, columns, partitions)
+    spec["projection"] = projection
+    # The table's GROUP BY runs on the server while the CSV is hashed here
+    with ThreadPoolExecutor(1) as executor:
+        table_future = executor.submit(table_checksums, connect, table_name, spec)
+        csv_side = csv_checksums(csv_file, spec, chunk_size=chunk_size, workers=workers)
+        table_side = table_future.result()
+
+    mismatched = [partition for partition in range(partitions)
+                  if (csv_side["counts"][partition], csv_side["sums"][partition])
+                  != (table_side["counts"][partition], table_side["sums"][partition])]
+    report = {"file": csv_file, "table": table_name, "key": key,
+              "columns": [name for name, _, _ in spec["columns"]], "partitions": partitions,
+              "csv_rows": csv_side["rows"], "table_rows": table_side["rows"],
+              "mismatched_partitions": [{"partition": partition, "csv_rows": csv_side["counts"][partition],
+                                         "table_rows": table_side["counts"][partition]}
+                                        for partition in mismatched],
+              "rows": [], "drilled_partitions": []}
+
+    drill = set(mismatched[:max_drill])
+    if drill:
+        with ThreadPoolExecutor(1) as executor:
+            table_future = executor.submit(_query, connect, drill_sql(table_name, spec, drill))
+            csv_rows = csv_checksums(csv_file, spec, drill, chunk_size, workers)["drilled"]
+            table_rows = table_future.result()
+        report["rows"] = compare_rows(csv_rows, table_rows)
+        report["drilled_partitions"] = sorted(drill)
+    report["ok"] = not mismatched
+    report["elapsed_seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def print_report(report, show=20):
+    if report["ok"]:
+        print(f"[SUCCESS] {report['table']} matches {report['file']}: {report['table_rows']} rows, "
+              f"{report['partitions']} partitions over {len(report['columns'])} columns "
+              f"({report['elapsed_seconds']:.2f}s).")
+        return
+    print(f"[ERROR] {report['table']} does not match {report['file']}: {report['csv_rows']} rows in the CSV, "
+          f"{report['table_rows']} in the table, {len(report['mismatched_partitions'])} of "
+          f"{report['partitions']} partitions differ.")
+    skipped = len(report["mismatched_partitions"]) - len(report["drilled_partitions"])
+    if skipped > 0:
+        print(f"[INFO] {skipped} more partitions differ; rerun with a larger --max-drill to see their rows.")
+    for row in report["rows"][:show]:
+        lines = f" (line {', '.join(map(str, row['lines']))})" if row["lines"] else ""
+        print(f"    {report['key']} = {row['key']}{lines}: {row['problem']}")
+    if len(report["rows"]) > show:
+        print(f"    ... and {len(report['rows']) - show} more")
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+
+    parser = argparse.ArgumentParser(description="Check that a loaded table matches its CSV, partition by partition.")
+    parser.add_argument("csv_file")
+    parser.add_argument("table")
+    parser.add_argument("--key", required=True, help="primary key or unique column")
+    parser.add_argument("--columns", help="comma separated columns to compare (default: every comparable column)")
+    parser.add_argument("--partitions", type=int, default=256, help="key hash partitions (default 256)")
+    parser.add_argument("--max-drill", dest="max_drill", type=int, default=16,
+                        help="mismatching partitions to compare row by row (default 16)")
+    parser.add_argument("--workers", type=int, help="processes hashing the CSV (default: all cores)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=50000)
+    parser.add_argument("--report", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    columns = [name.strip() for name in args.columns.split(",")] if args.columns else None
+    database = open_database(config)
+    try:
+        report = verify_load(args.csv_file, args.table, database.connect, args.key, columns, args.partitions,
+                             args.workers, args.chunk_size, args.max_drill,
+                             projection_for(args.table, read_projections(config)))
+    finally:
+        database.close()
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    raise SystemExit(0 if report["ok"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import ntpath
+import os
+import posixpath
+import subprocess
+import time
+import uuid
+
+from csvreader import read_chunks
+from pipeline import load_csv
+
+# Writer backends for the loader, selectable per run. Both take the same
+# load(csv_file, table_name, ...) call and return a stats dict with at
+# least rows, elapsed_seconds and rows_per_second.
+#
+#   executemany  the pipelined pyodbc path (pipeline.load_csv)
+#   bulk-insert  stage the CSV as a delimited file plus a bcp format file,
+#                then run one BULK INSERT on the server
+#   bcp          same staging, loaded with the bcp command line tool
+#
+# The staged file has to be readable by SQL Server for BULK INSERT, so the
+# staging directory is usually a share; server_dir is that same directory
+# as the server sees it.
+
+FIELD_TERMINATOR = "~|~"
+ROW_TERMINATOR = "~|~|~\r\n"
+# A value ending in the start of the terminator would end the field early
+# ("a~|" + "~|~" reads as "a" then "|~|~"), so those are refused too
+TERMINATOR_PREFIXES = tuple(FIELD_TERMINATOR[:i] for i in range(1, len(FIELD_TERMINATOR)))
+
+
+class ExecuteManyBackend:
+    name = "executemany"
+
+    def __init__(self, connect, **options):
+        self.connect = connect
+        self.options = options
+
+    def load(self, csv_file, table_name, chunk_size=50000, on_progress=None, **kwargs):
+        options = dict(self.options, **kwargs)
+        return load_csv(csv_file, table_name, self.connect, chunk_size=chunk_size, on_progress=on_progress,
+                        **options)
+
+
+def format_file_lines(csv_columns, target_columns=None):
+    # Non-XML bcp format file. Every CSV column is a character field ending
+    # in FIELD_TERMINATOR (the last one in ROW_TERMINATOR) and is mapped by
+    # name to its ordinal in the target table; 0 means "skip this field".
+    target_columns = list(target_columns or csv_columns)
+    lines = ["14.0", str(len(csv_columns))]
+    for i, column in enumerate(csv_columns, start=1):
+        terminator = ROW_TERMINATOR if i == len(csv_columns) else FIELD_TERMINATOR
+        terminator = terminator.replace("\r", "\\r").replace("\n", "\\n")
+        server_order = target_columns.index(column) + 1 if column in target_columns else 0
+        # The name field is informational only but may not contain whitespace
+        name = "_".join(str(column).split()) or f"field{i}"
+        lines.append(f'{i}\tSQLCHAR\t0\t0\t"{terminator}"\t{server_order}\t{name}\t""')
+    return lines
+
+
+def sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def bulk_insert_sql(table_name, data_file, format_file, tablock=True, batch_size=100000):
+    options = [f"FORMATFILE = {sql_string(format_file)}", "CODEPAGE = '65001'", "KEEPNULLS"]
+    if batch_size:
+        options.append(f"BATCHSIZE = {batch_size}")
+    if tablock:
+        options.append("TABLOCK")
+    return f"BULK INSERT {table_name} FROM {sql_string(data_file)} WITH ({', '.join(options)});"
+
+
+def bcp_command(table_name, data_file, format_file, server, database, username=None, password=None,
+                tablock=True, batch_size=100000):
+    command = ["bcp", f"{database}.dbo.{table_name}", "in", data_file, "-f", format_file,
+               "-S", server, "-C", "65001"]
+    if username:
+        command += ["-U", username, "-P", password or ""]
+    else:
+        command.append("-T")  # integrated security
+    if batch_size:
+        command += ["-b", str(batch_size)]
+    if tablock:
+        command += ["-h", "TABLOCK"]
+    return command
+
+
+def masked(command):
+    return [("****" if previous == "-P" else part) for previous, part in zip([None] + command, command)]
+
+
+class BulkInsertBackend:
+    name = "bulk-insert"
+
+    def __init__(self, connect=None, staging_dir=None, server_dir=None, target_columns=None, tablock=True,
+                 batch_size=100000, execute=True, keep_files=False, cache=None, projection=None):
+        self.connect = connect
+        self.staging_dir = staging_dir or os.getcwd()
+        self.server_dir = server_dir or self.staging_dir
+        self.target_columns = target_columns
+        self.tablock = tablock
+        self.batch_size = batch_size
+        self.execute = execute
+        self.keep_files = keep_files
+        self.cache = cache
+        self.projection = projection
+        # Loads into the same table from other processes stage their own files
+        self.staging_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def staged_paths(self, table_name):
+        base = f"{table_name}.{self.staging_id}.bulk"
+        local = (os.path.join(self.staging_dir, base + ".dat"), os.path.join(self.staging_dir, base + ".fmt"))
+        # The server is usually Windows even when this script is not
+        join = ntpath.join if "\\" in self.server_dir else posixpath.join
+        server = (join(self.server_dir, base + ".dat"), join(self.server_dir, base + ".fmt"))
+        return local, server
+
+    def stage(self, csv_file, table_name, chunk_size=50000, on_progress=None):
+        (data_file, format_file), _ = self.staged_paths(table_name)
+        rows = 0
+        columns = None
+        with open(data_file, 'w', encoding='utf-8', newline='') as f:
+            for _, chunk in read_chunks(csv_file, chunk_size, cache=self.cache, projection=self.projection, dtype=str):
+                if columns is None:
+                    columns = list(chunk.columns)
+                # NULLs are written as empty fields, which KEEPNULLS loads as NULL
+                filled = chunk.fillna("")
+                fields = [filled.iloc[:, i] for i in range(len(columns))]
+                for column, values in zip(columns, fields):
+                    if (values.str.contains(FIELD_TERMINATOR, regex=False).any()
+                            or values.str.endswith(TERMINATOR_PREFIXES).any()):
+                        raise ValueError(f"Column {column} contains the staging terminator {FIELD_TERMINATOR!r} "
+                                         f"or ends in part of it")
+                lines = fields[0].str.cat(fields[1:], sep=FIELD_TERMINATOR)
+                f.write(ROW_TERMINATOR.join(lines) + ROW_TERMINATOR)
+                rows += len(chunk)
+                if on_progress is not None:
+                    on_progress(len(chunk))
+        with open(format_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(format_file_lines(columns or [], self.target_columns)) + "\n")
+        return rows
+
+    def command(self, table_name):
+        _, (data_file, format_file) = self.staged_paths(table_name)
+        return bulk_insert_sql(table_name, data_file, format_file, self.tablock, self.batch_size)
+
+    def describe(self, table_name):
+        return self.command(table_name)
+
+    def run(self, table_name):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.command(table_name))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, csv_file, table_name, chunk_size=50000, on_progress=None, **_):
+        start_time = time.perf_counter()
+        try:
+            rows = self.stage(csv_file, table_name, chunk_size, on_progress)
+            staged_time = time.perf_counter()
+            print(f"[INFO] {self.name}: {self.describe(table_name)}")
+            if self.execute:
+                self.run(table_name)
+        finally:
+            # Failed or not, a load that ran leaves no copy of the CSV behind
+            # unless asked to; without execute the files are the output
+            if self.execute and not self.keep_files:
+                for path in self.staged_paths(table_name)[0]:
+                    if os.path.exists(path):
+                        os.remove(path)
+        elapsed = time.perf_counter() - start_time
+        return {"rows": rows, "elapsed_seconds": elapsed, "stage_seconds": staged_time - start_time,
+                "load_seconds": time.perf_counter() - staged_time,
+                "rows_per_second": rows / elapsed if elapsed else 0.0}
+
+
+class BcpBackend(BulkInsertBackend):
+    name = "bcp"
+
+    def __init__(self, server, database, username=None, password=None, **options):
+        super().__init__(**options)
+        self.server = server
+        self.database = database
+        self.username = username
+        self.password = password
+
+    def command(self, table_name):
+        # bcp runs on this machine, so it reads the local staged files
+        (data_file, format_file), _ = self.staged_paths(table_name)
+        return bcp_command(table_name, data_file, format_file, self.server, self.database, self.username,
+                           self.password, self.tablock, self.batch_size)
+
+    def describe(self, table_name):
+        return " ".join(masked(self.command(table_name)))
+
+    def run(self, table_name):
+        subprocess.run(self.command(table_name), check=True)
+
+
+BACKENDS = {backend.name: backend for backend in (ExecuteManyBackend, BulkInsertBackend, BcpBackend)}